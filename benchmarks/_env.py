@@ -0,0 +1,76 @@
+"""
+Подготовка окружения для бенчмарков
+
+Настройки приложения читаются при импорте пакета src, поэтому модуль
+нужно импортировать до любых импортов из src.
+"""
+import os
+import socket
+import tempfile
+import time
+from typing import Dict, Optional
+
+
+def setup_env(db_path: Optional[str] = None, **overrides: str) -> str:
+    """
+    Заполнение переменных окружения для запуска без реальных сервисов
+    
+    Args:
+        db_path: Путь к файлу SQLite (по умолчанию временный файл)
+        **overrides: Дополнительные переменные окружения (имя в нижнем регистре)
+    
+    Returns:
+        Путь к файлу базы данных
+    """
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="bot-bench-"), "bench.db")
+    
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench-token")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ.pop("ALLOWED_USERS", None)
+    
+    for key, value in overrides.items():
+        os.environ[key.upper()] = str(value)
+    
+    # Логи на каждый запрос искажают замеры
+    from loguru import logger
+    logger.remove()
+    
+    return db_path
+
+
+def free_port() -> int:
+    """Свободный TCP-порт на localhost"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, q: float) -> float:
+    """Перцентиль q (0-100) по списку значений"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(title: str, rows: Dict[str, Dict[str, float]]) -> None:
+    """Печать таблицы результатов"""
+    print(f"\n{title}")
+    columns = sorted({column for row in rows.values() for column in row})
+    print(f"{'':<24}" + "".join(f"{column:>16}" for column in columns))
+    for name, row in rows.items():
+        print(f"{name:<24}" + "".join(f"{row.get(column, 0):>16.3f}" for column in columns))
+
+
+class Timer:
+    """Контекстный менеджер для замера времени"""
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
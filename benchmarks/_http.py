@@ -0,0 +1,131 @@
+"""
+Минимальный HTTP/1.1 сервер на asyncio для локальных заглушек
+
+Поддерживает keep-alive, ответы с Content-Length и потоковые ответы
+с chunked-кодированием. Внешние зависимости не нужны, поэтому бенчмарки
+запускаются полностью офлайн.
+"""
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class Request:
+    """Входящий HTTP-запрос"""
+    
+    def __init__(self, method: str, path: str, headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+    
+    def json(self):
+        """Тело запроса как JSON"""
+        return json.loads(self.body or b"{}")
+
+
+class Responder:
+    """Отправка ответа в соединение"""
+    
+    REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+               429: "Too Many Requests", 500: "Internal Server Error", 503: "Service Unavailable"}
+    
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.sent = False
+    
+    def _head(self, status: int, headers: Dict[str, str]) -> bytes:
+        lines = [f"HTTP/1.1 {status} {self.REASONS.get(status, 'Status')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+    
+    async def send(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+        """Ответ целиком"""
+        headers = dict(headers or {})
+        headers["Content-Length"] = str(len(body))
+        self.writer.write(self._head(status, headers) + body)
+        await self.writer.drain()
+        self.sent = True
+    
+    async def send_json(self, status: int, payload, headers: Optional[Dict[str, str]] = None) -> None:
+        """Ответ в формате JSON"""
+        headers = dict(headers or {})
+        headers["Content-Type"] = "application/json"
+        await self.send(status, json.dumps(payload).encode(), headers)
+    
+    async def start_chunked(self, status: int, headers: Optional[Dict[str, str]] = None) -> None:
+        """Начало потокового ответа"""
+        headers = dict(headers or {})
+        headers["Transfer-Encoding"] = "chunked"
+        self.writer.write(self._head(status, headers))
+        await self.writer.drain()
+        self.sent = True
+    
+    async def write_chunk(self, data: bytes) -> None:
+        """Очередной фрагмент потокового ответа"""
+        self.writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        await self.writer.drain()
+    
+    async def end_chunked(self) -> None:
+        """Завершение потокового ответа"""
+        self.writer.write(b"0\r\n\r\n")
+        await self.writer.drain()
+
+
+Handler = Callable[[Request, Responder], Awaitable[None]]
+
+
+class HttpServer:
+    """HTTP-сервер, передающий каждый запрос в обработчик"""
+    
+    def __init__(self, handler: Handler, host: str = "127.0.0.1", port: int = 0):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.connections = 0
+        self._server = None
+    
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+    
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+    
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+    
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+                
+                responder = Responder(writer)
+                await self.handler(Request(method, path, headers, body), responder)
+                if not responder.sent:
+                    await responder.send(404, b"")
+                
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,214 @@
+"""
+Холодный архив истории: размер горячей таблицы, задержка get_context
+и стоимость чтения архива на большой синтетической базе
+
+База заполняется сообщениями пользователей за несколько дней (тексты
+из случайных слов, чтобы сжатие было правдоподобным); TTL контекста
+24 часа, так что устаревшей оказывается почти вся история. Для каждого
+варианта (только удаление, архив gzip, архив zstd при установленном
+zstandard) очистка запускается на копии исходной базы. Замеряются
+длительность очистки, размер таблиц messages и message_archive
+(dbstat), задержка ContextService.get_context без кэша до и после
+очистки и восстановление архивной истории пользователя целиком и за
+один день.
+
+Запуск: python -m benchmarks.bench_archive [--users 2000] [--days 30] [--per-day 20]
+        [--queries 200] [--batch 2000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks._env import setup_env, percentile, report, Timer
+
+WORK_DIR = tempfile.mkdtemp(prefix="bot-bench-archive-")
+SOURCE_DB = os.path.join(WORK_DIR, "source.db")
+setup_env(
+    db_path=SOURCE_DB,
+    context_ttl_hours="24",
+    context_cache_enabled="false",
+    cleanup_batch_pause_seconds="0",
+    cleanup_time_budget_seconds="100000",
+    log_level="WARNING",
+    log_file=""
+)
+
+from src.config import settings  # noqa: E402
+from src.database.connection import db_manager  # noqa: E402
+from src.services import message_archive  # noqa: E402
+from src.services.context_service import context_service  # noqa: E402
+from src.services.message_archive import MessageArchive  # noqa: E402
+
+
+def make_vocabulary(rng: random.Random, size: int = 3000) -> list:
+    syllables = ["ко", "ра", "ни", "то", "ве", "ло", "ма", "ст", "ри", "на", "пе", "ду", "ль", "ка", "зо"]
+    return ["".join(rng.choice(syllables) for _ in range(rng.randint(1, 4))) for _ in range(size)]
+
+
+def fill(users: int, days: int, per_day: int) -> int:
+    """Заполнение исходной базы: сообщения равномерно за последние days дней"""
+    rng = random.Random(1)
+    vocabulary = make_vocabulary(rng)
+    now = datetime.utcnow()
+    step = timedelta(days=1) / per_day
+    
+    conn = sqlite3.connect(SOURCE_DB)
+    conn.executemany(
+        "INSERT INTO users (id, telegram_id) VALUES (?, ?)",
+        ((user, user) for user in range(1, users + 1))
+    )
+    
+    def rows():
+        for day in range(days, 0, -1):
+            start = now - timedelta(days=day)
+            for number in range(per_day):
+                created_at = (start + step * number).strftime("%Y-%m-%d %H:%M:%S.%f")
+                for user in range(1, users + 1):
+                    words = rng.choices(vocabulary, k=rng.randint(4, 40))
+                    yield (
+                        user, user, "user" if number % 2 == 0 else "assistant",
+                        " ".join(words), len(words) + 4, created_at
+                    )
+    
+    conn.executemany(
+        "INSERT INTO messages (user_id, telegram_id, role, content, token_count, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        rows()
+    )
+    conn.commit()
+    conn.close()
+    return users * days * per_day
+
+
+def table_sizes(path: str) -> dict:
+    """Строки в messages и размер таблиц с индексами, МБ"""
+    conn = sqlite3.connect(path)
+    sizes = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+    hot_rows = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    conn.close()
+    
+    def total(prefixes):
+        return sum(size for name, size in sizes.items() if name.startswith(prefixes)) / 2 ** 20
+    
+    return {
+        "hot rows": hot_rows,
+        "messages MB": total(("messages", "ix_messages")),
+        "archive MB": total(("message_archive", "ix_message_archive", "sqlite_autoindex_message_archive")),
+    }
+
+
+async def use_database(path: str) -> None:
+    await db_manager.close()
+    settings.database_url = f"sqlite+aiosqlite:///{path}"
+    await db_manager.init_db()
+
+
+async def measure_context(user_ids) -> dict:
+    latencies = []
+    for telegram_id in user_ids:
+        started = time.perf_counter()
+        await context_service.get_context(telegram_id)
+        latencies.append(time.perf_counter() - started)
+    return {
+        "context p50 ms": percentile(latencies, 50) * 1000,
+        "context p99 ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def measure_restore(user_ids, days: int) -> dict:
+    """Чтение архивной истории целиком и за один день"""
+    full, single = [], []
+    restored = 0
+    day = (datetime.utcnow() - timedelta(days=days // 2)).date()
+    for telegram_id in user_ids:
+        started = time.perf_counter()
+        restored += len(await context_service.load_archived_history(telegram_id))
+        full.append(time.perf_counter() - started)
+        
+        started = time.perf_counter()
+        await context_service.load_archived_history(telegram_id, day, day)
+        single.append(time.perf_counter() - started)
+    return {
+        "restore p50 ms": percentile(full, 50) * 1000,
+        "restore p99 ms": percentile(full, 99) * 1000,
+        "day p50 ms": percentile(single, 50) * 1000,
+        "restored/user": restored / len(user_ids),
+    }
+
+
+async def run_case(name: str, codec, user_ids, days: int) -> dict:
+    path = os.path.join(WORK_DIR, f"{name}.db")
+    shutil.copy(SOURCE_DB, path)
+    await use_database(path)
+    settings.context_archive_enabled = codec is not None
+    context_service.archive = MessageArchive(codec or "gzip")
+    
+    with Timer() as timer:
+        run = await context_service.cleanup_old_contexts()
+    result = {
+        "cleanup s": timer.elapsed,
+        "lock max ms": run["lock_time_max"] * 1000,
+        **await measure_context(user_ids),
+    }
+    if codec is not None:
+        stats = context_service.archive.stats()
+        result["ratio"] = stats["ratio"]
+        result["merged"] = stats["segments_merged"]
+        result.update(await measure_restore(user_ids, days))
+    
+    await db_manager.close()
+    result.update(table_sizes(path))
+    os.remove(path)
+    return result
+
+
+async def run(users: int, days: int, per_day: int, queries: int, batch: int) -> None:
+    await db_manager.init_db()
+    await db_manager.close()
+    with Timer() as fill_timer:
+        rows = fill(users, days, per_day)
+    print(f"Заполнено {rows} сообщений {users} пользователей за {days} дней ({fill_timer.elapsed:.1f} с)")
+    
+    settings.cleanup_batch_size = batch
+    user_ids = random.Random(2).sample(range(1, users + 1), min(queries, users))
+    
+    results = {}
+    await use_database(SOURCE_DB)
+    before = await measure_context(user_ids)
+    await db_manager.close()
+    results["до очистки"] = {**before, **table_sizes(SOURCE_DB)}
+    
+    cases = {"только удаление": None, "архив gzip": "gzip"}
+    if message_archive.zstandard is not None:
+        cases["архив zstd"] = "zstd"
+    for name, codec in cases.items():
+        results[name] = await run_case(name.replace(" ", "-"), codec, user_ids, days)
+    
+    report(
+        f"{rows} сообщений, {users} пользователей x {days} дней x {per_day}; "
+        f"пакет очистки {batch}, {len(user_ids)} запросов",
+        results
+    )
+    if message_archive.zstandard is None:
+        print("zstandard не установлен, вариант zstd пропущен")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--per-day", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.days, args.per_day, args.queries, args.batch))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Пул OpenAI-совместимых серверов: выбор по задержке и переключение при сбоях
+
+Несколько заглушек OpenAI с разной задержкой и надежностью:
+быстрая, медленная, нестабильная (половина ответов - ошибка 500),
+зависающая (отвечает дольше таймаута) и недоступная (порт не слушается).
+Сравниваются один медленный сервер, пул из работающих серверов и пул,
+в котором часть серверов неисправна.
+
+Запуск: python -m benchmarks.bench_backends [--requests 300] [--concurrency 20]
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._env import setup_env, free_port, percentile, report
+
+setup_env(
+    openai_request_timeout="1.0",
+    openai_max_concurrency="64",
+    openai_max_retries="3",
+    openai_breaker_cooldown_seconds="5"
+)
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.services.openai_service import get_openai_service  # noqa: E402
+
+
+async def run_case(backends, requests: int, concurrency: int) -> dict:
+    settings.openai_backends = backends
+    service = get_openai_service()
+    service._init_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    
+    async def request(index: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await service.get_chat_completion([{"role": "user", "content": f"Вопрос {index}"}])
+                latencies.append((time.perf_counter() - started) * 1000)
+            except Exception:
+                errors += 1
+    
+    await asyncio.gather(*(request(i) for i in range(requests)))
+    
+    stats = service.pool.stats()
+    await service.close()
+    
+    row = {
+        "p50 ms": percentile(latencies, 50),
+        "p95 ms": percentile(latencies, 95),
+        "errors": errors,
+        "failovers": stats["failovers"],
+    }
+    for name, backend in stats["backends"].items():
+        row[f"-> {name}"] = backend["requests"]
+    return row
+
+
+async def run(requests: int, concurrency: int) -> None:
+    servers = {
+        "fast": FakeOpenAIServer(first_token_delay=0.05, token_delay=0.0, reply_tokens=10),
+        "slow": FakeOpenAIServer(first_token_delay=0.3, token_delay=0.0, reply_tokens=10),
+        "flaky": FakeOpenAIServer(first_token_delay=0.05, token_delay=0.0, reply_tokens=10, error_rate=0.5),
+        "hang": FakeOpenAIServer(first_token_delay=5.0, token_delay=0.0, reply_tokens=10),
+    }
+    for server in servers.values():
+        await server.start()
+    
+    def backend(name: str) -> dict:
+        if name == "down":
+            return {"name": name, "base_url": f"http://127.0.0.1:{free_port()}/v1"}
+        return {"name": name, "base_url": servers[name].base_url}
+    
+    cases = {
+        "single slow": ["slow"],
+        "pool slow+fast": ["slow", "fast"],
+        "pool +flaky": ["slow", "fast", "flaky"],
+        "pool +hang+down": ["hang", "down", "slow", "fast"],
+    }
+    rows = {}
+    for title, names in cases.items():
+        rows[title] = await run_case([backend(name) for name in names], requests, concurrency)
+    
+    for server in servers.values():
+        await server.stop()
+    
+    columns = ["p50 ms", "p95 ms", "errors", "failovers"]
+    report(
+        f"{requests} запросов, {concurrency} одновременно, таймаут {settings.openai_request_timeout} с",
+        {title: {key: row[key] for key in columns} for title, row in rows.items()}
+    )
+    report(
+        "Распределение запросов по серверам (включая неудачные)",
+        {title: {key[3:]: value for key, value in row.items() if key.startswith("-> ")} for title, row in rows.items()}
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
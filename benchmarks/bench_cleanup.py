@@ -0,0 +1,112 @@
+"""
+Задержки живого трафика во время очистки устаревших сообщений:
+одна транзакция на все строки против пакетной очистки
+
+Запуск: python -m benchmarks.bench_cleanup [--rows 200000] [--users 20]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks._env import setup_env, percentile, report
+
+setup_env()
+
+from sqlalchemy import insert  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.database.connection import db_manager  # noqa: E402
+from src.database.models import Message, User  # noqa: E402
+from src.services.context_service import context_service  # noqa: E402
+
+CONFIGS = {
+    # Размер пакета больше числа строк - эквивалент прежнего одного DELETE
+    "single delete": {"cleanup_batch_size": 10 ** 9, "cleanup_time_budget_seconds": 3600},
+    "batched": {"cleanup_batch_size": 500, "cleanup_time_budget_seconds": 3600},
+}
+
+
+async def fill_expired(rows: int, users: int) -> None:
+    """Заполнение таблицы устаревшими сообщениями"""
+    created_at = datetime.utcnow() - timedelta(hours=settings.context_ttl_hours + 1)
+    async with db_manager.get_session() as session:
+        await session.execute(insert(User), [
+            {"id": i + 1, "telegram_id": i} for i in range(users)
+        ])
+    
+    chunk = 10000
+    for offset in range(0, rows, chunk):
+        async with db_manager.get_session() as session:
+            await session.execute(insert(Message), [
+                {
+                    "user_id": i % users + 1,
+                    "telegram_id": i % users,
+                    "role": "user",
+                    "content": f"old message {i}",
+                    "token_count": 5,
+                    "created_at": created_at,
+                }
+                for i in range(offset, min(offset + chunk, rows))
+            ])
+
+
+async def live_traffic(telegram_id: int, stop: asyncio.Event, latencies: list) -> None:
+    """Ходы диалога пользователя, пока идет очистка"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await context_service.begin_turn(telegram_id, ["live message"])
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def run_config(options: dict, rows: int, users: int) -> dict:
+    settings.database_url = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'cleanup.db')}"
+    for key, value in options.items():
+        setattr(settings, key, value)
+    
+    await db_manager.init_db()
+    await fill_expired(rows, users)
+    
+    live_users = range(1000, 1004)
+    for telegram_id in live_users:
+        await context_service.get_or_create_user(telegram_id)
+    
+    stop = asyncio.Event()
+    latencies = []
+    traffic = [asyncio.create_task(live_traffic(telegram_id, stop, latencies)) for telegram_id in live_users]
+    
+    await asyncio.sleep(0.2)
+    run = await context_service.cleanup_old_contexts()
+    stop.set()
+    await asyncio.gather(*traffic)
+    await db_manager.close()
+    
+    return {
+        "cleanup s": run["duration"],
+        "lock max ms": run["lock_time_max"] * 1000,
+        "turn p50 ms": percentile(latencies, 50),
+        "turn p99 ms": percentile(latencies, 99),
+        "turn max ms": max(latencies),
+    }
+
+
+async def run(rows: int, users: int) -> None:
+    context_service.cache = None
+    results = {}
+    for name, options in CONFIGS.items():
+        results[name] = await run_config(options, rows, users)
+    report(f"Очистка {rows} устаревших сообщений под нагрузкой", results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.users))
+
+
+if __name__ == "__main__":
+    main()
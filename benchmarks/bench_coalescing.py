@@ -0,0 +1,74 @@
+"""
+Количество запросов к OpenAI при пачках сообщений от пользователей:
+без объединения против окна ожидания
+
+Запуск: python -m benchmarks.bench_coalescing [--users 20] [--burst 4] [--gap 0.1]
+"""
+import argparse
+import asyncio
+
+from benchmarks._env import setup_env, free_port, report, Timer
+
+PORT = free_port()
+setup_env(openai_api_base=f"http://127.0.0.1:{PORT}/v1")
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from benchmarks.fake_updates import FakeContext, FakeUpdate  # noqa: E402
+from src.database.connection import db_manager  # noqa: E402
+from src.handlers.message_handler import handle_message, message_queue  # noqa: E402
+from src.services.openai_service import get_openai_service  # noqa: E402
+
+
+async def user_burst(user_id: int, burst: int, gap: float, replies: list) -> None:
+    """Пользователь отправляет несколько сообщений подряд"""
+    for i in range(burst):
+        update = FakeUpdate(user_id, f"часть {i} вопроса")
+        replies.append(update.message)
+        await handle_message(update, FakeContext())
+        await asyncio.sleep(gap)
+
+
+async def run(users: int, burst: int, gap: float) -> None:
+    server = FakeOpenAIServer(first_token_delay=0.3, token_delay=0.0, reply_tokens=20, port=PORT)
+    await server.start()
+    await db_manager.init_db()
+    rows = {}
+    
+    for index, (name, debounce) in enumerate((("no coalescing", 0.0), ("debounce 0.5s", 0.5))):
+        message_queue.debounce_seconds = debounce
+        # Каждый прогон со своими пользователями, чтобы контексты не пересекались
+        offset = index * users
+        server.requests = 0
+        messages = []
+        
+        with Timer() as timer:
+            await asyncio.gather(*(
+                user_burst(offset + user_id, burst, gap, messages)
+                for user_id in range(users)
+            ))
+            await message_queue.close()
+        
+        rows[name] = {
+            "messages": users * burst,
+            "openai calls": server.requests,
+            "replies": sum(len(message.replies) for message in messages),
+            "seconds": timer.elapsed,
+        }
+    
+    await get_openai_service().close()
+    await db_manager.close()
+    await server.stop()
+    report(f"{users} пользователей по {burst} сообщений с интервалом {gap} с", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=4)
+    parser.add_argument("--gap", type=float, default=0.1)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.burst, args.gap))
+
+
+if __name__ == "__main__":
+    main()
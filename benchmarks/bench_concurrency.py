@@ -0,0 +1,97 @@
+"""
+Пропускная способность в зависимости от числа одновременных пользователей
+
+Настоящий TelegramBot в режиме polling работает с заглушками Bot API и
+OpenAI с искусственной задержкой. Каждый пользователь присылает одно
+сообщение; замеряется время до ответа всем. Сравниваются
+последовательная обработка обновлений (UPDATE_CONCURRENCY=1) и
+параллельная с сохранением порядка внутри чата.
+
+Запуск: python -m benchmarks.bench_concurrency [--users 1,10,50,100]
+        [--telegram-latency 0.05] [--openai-latency 0.5] [--concurrency 16]
+"""
+import argparse
+import asyncio
+
+from benchmarks._env import setup_env, free_port, report, Timer
+
+OPENAI_PORT = free_port()
+TELEGRAM_PORT = free_port()
+
+setup_env(
+    openai_api_base=f"http://127.0.0.1:{OPENAI_PORT}/v1",
+    telegram_api_base=f"http://127.0.0.1:{TELEGRAM_PORT}/bot",
+    message_debounce_seconds="0",
+    openai_max_concurrency="128"
+)
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegramServer  # noqa: E402
+from src.bot import TelegramBot  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.services.openai_service import get_openai_service  # noqa: E402
+
+
+async def wait_until_polling(telegram: FakeTelegramServer) -> None:
+    """Ожидание первого getUpdates: до него deleteWebhook сбрасывает очередь"""
+    polls = telegram.calls.get("getUpdates", 0)
+    while telegram.calls.get("getUpdates", 0) == polls:
+        await asyncio.sleep(0.05)
+
+
+async def run_case(telegram: FakeTelegramServer, concurrency: int, users: int, first_user: int) -> dict:
+    settings.update_concurrency = concurrency
+    get_openai_service()._init_client()
+    telegram.sent.clear()
+    
+    bot = TelegramBot()
+    task = asyncio.create_task(bot.start())
+    await wait_until_polling(telegram)
+    
+    with Timer() as timer:
+        for i in range(users):
+            telegram.enqueue_update(first_user + i, "Привет!")
+        await telegram.wait_for_sent(users, timeout=300)
+    
+    await bot.stop()
+    task.cancel()
+    
+    return {"updates/sec": users / timer.elapsed, "seconds": timer.elapsed}
+
+
+async def run(user_counts, telegram_latency: float, openai_latency: float, concurrency: int) -> None:
+    openai = FakeOpenAIServer(first_token_delay=openai_latency, token_delay=0.0, reply_tokens=10, port=OPENAI_PORT)
+    telegram = FakeTelegramServer(latency=telegram_latency, port=TELEGRAM_PORT)
+    await openai.start()
+    await telegram.start()
+    
+    rows = {}
+    first_user = 1
+    for users in user_counts:
+        for mode in (1, concurrency):
+            result = await run_case(telegram, mode, users, first_user)
+            first_user += users
+            label = "последовательно" if mode == 1 else f"параллельно x{mode}"
+            rows[f"{users} польз., {label}"] = result
+    
+    await telegram.stop()
+    await openai.stop()
+    report(
+        f"Задержка Bot API {telegram_latency} с, OpenAI {openai_latency} с",
+        rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", default="1,10,50,100")
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--openai-latency", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    user_counts = [int(value) for value in args.users.split(",")]
+    asyncio.run(run(user_counts, args.telegram_latency, args.openai_latency, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Пропускная способность конкурентных add_message/get_context
+при разных настройках пула соединений и журнала SQLite
+
+Запуск: python -m benchmarks.bench_db_pool [--concurrency 32] [--ops 50]
+            [--database-url postgresql+asyncpg://...]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+
+from benchmarks._env import setup_env, report, Timer
+
+setup_env()
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.database.connection import db_manager  # noqa: E402
+from src.services.context_service import context_service  # noqa: E402
+
+CONFIGS = {
+    "nullpool + delete": {
+        "db_pool_size": 0,
+        "sqlite_journal_mode": "DELETE",
+        "sqlite_synchronous": "FULL",
+    },
+    "pool + wal": {
+        "db_pool_size": 5,
+        "db_max_overflow": 10,
+        "sqlite_journal_mode": "WAL",
+        "sqlite_synchronous": "NORMAL",
+    },
+}
+
+
+async def worker(telegram_id: int, ops: int) -> int:
+    """Цикл операций одного пользователя, возвращает количество ошибок"""
+    errors = 0
+    for i in range(ops):
+        try:
+            await context_service.add_message(telegram_id, "user", f"message {i}")
+            await context_service.get_context(telegram_id)
+        except OperationalError:
+            # "database is locked" при исчерпании busy_timeout
+            errors += 1
+    return errors
+
+
+async def run_config(database_url: str, options: dict, concurrency: int, ops: int) -> dict:
+    settings.database_url = database_url
+    for key, value in options.items():
+        setattr(settings, key, value)
+    
+    await db_manager.init_db()
+    for telegram_id in range(concurrency):
+        await context_service.get_or_create_user(telegram_id)
+    
+    with Timer() as timer:
+        errors = await asyncio.gather(*(worker(telegram_id, ops) for telegram_id in range(concurrency)))
+    
+    await db_manager.close()
+    total_ops = concurrency * ops * 2
+    return {
+        "ops/sec": total_ops / timer.elapsed,
+        "ms/op": timer.elapsed / total_ops * 1000,
+        "errors": sum(errors),
+    }
+
+
+async def run(concurrency: int, ops: int, database_url: str) -> None:
+    # Кэш контекстов скрыл бы обращения к БД
+    context_service.cache = None
+    rows = {}
+    
+    for name, options in CONFIGS.items():
+        url = database_url or f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'pool.db')}"
+        rows[name] = await run_config(url, options, concurrency, ops)
+    
+    report(f"Конкурентный доступ к БД: {concurrency} пользователей, {ops} итераций", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--ops", type=int, default=50)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.ops, args.database_url))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Справедливая очередь к OpenAI: один пользователь с потоком длинных
+промптов против множества обычных пользователей
+
+Заглушка OpenAI обрабатывает длинный промпт дольше короткого
+(prompt_token_delay), слотов одновременных запросов мало. Тяжелый
+пользователь держит --heavy-concurrency запросов постоянно; легкие
+пользователи отправляют короткие запросы с паузой на чтение ответа.
+Сравниваются очередь в порядке поступления (прежнее поведение),
+взвешенная справедливая очередь с ограничением одновременных запросов
+пользователя (и без него) и она же с повышенным весом части легких
+пользователей.
+Замеряются задержка и ожидание в очереди легких пользователей, доля
+слотов, занятая тяжелым пользователем, и задержка пользователей с
+повышенным весом.
+
+Запуск: python -m benchmarks.bench_fair_queue [--duration 10] [--light-users 40]
+        [--heavy-concurrency 16] [--slots 4]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks._env import setup_env, free_port, percentile, report
+
+PORT = free_port()
+setup_env(
+    openai_api_base=f"http://127.0.0.1:{PORT}/v1",
+    openai_max_retries="0",
+    openai_queue_size="10000",
+    openai_prewarm_connections="0"
+)
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.services.openai_service import get_openai_service  # noqa: E402
+from src.services.rate_limiter import RateLimiter  # noqa: E402
+
+HEAVY_USER = 1
+HEAVY_PROMPT = [{"role": "user", "content": "Очень длинный вопрос с подробностями. " * 200}]
+LIGHT_PROMPT = [{"role": "user", "content": "Короткий вопрос, как дела?"}]
+
+CASES = {
+    "FIFO": {"fair": False, "cap": 0, "weights": {}},
+    "WFQ без лимита": {"fair": True, "cap": 0, "weights": {}},
+    "WFQ": {"fair": True, "cap": 2, "weights": {}},
+    "WFQ + приоритет": {"fair": True, "cap": 2, "weights": "priority"},
+}
+
+
+async def heavy_loop(service, deadline: float, done: list) -> None:
+    while time.perf_counter() < deadline:
+        await service.get_chat_completion(HEAVY_PROMPT, user_id=HEAVY_USER)
+        done.append(time.perf_counter())
+
+
+async def light_loop(service, user_id: int, deadline: float, latencies: list, rng: random.Random) -> None:
+    await asyncio.sleep(rng.uniform(0, 0.5))
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await service.get_chat_completion(LIGHT_PROMPT, user_id=user_id)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(rng.uniform(0.2, 0.6))
+
+
+async def run_case(config: dict, duration: float, light_users: int, heavy_concurrency: int, slots: int) -> dict:
+    service = get_openai_service()
+    light_ids = list(range(100, 100 + light_users))
+    priority_ids = set(light_ids[:max(1, light_users // 8)]) if config["weights"] == "priority" else set()
+    settings.user_priority_weights = {user_id: 4.0 for user_id in priority_ids}
+    service.limiter = RateLimiter(
+        max_concurrency=slots,
+        requests_per_minute=0,
+        tokens_per_minute=0,
+        max_queue=settings.openai_queue_size,
+        max_in_flight_per_user=config["cap"],
+        user_weight=service._user_weight,
+        fair_queuing=config["fair"]
+    )
+    
+    rng = random.Random(1)
+    deadline = time.perf_counter() + duration
+    heavy_done = []
+    latencies = {user_id: [] for user_id in light_ids}
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(heavy_loop(service, deadline, heavy_done) for _ in range(heavy_concurrency)),
+        *(light_loop(service, user_id, deadline, latencies[user_id], rng) for user_id in light_ids)
+    )
+    elapsed = time.perf_counter() - started
+    
+    regular = [value for user_id in light_ids if user_id not in priority_ids for value in latencies[user_id]]
+    priority = [value for user_id in priority_ids for value in latencies[user_id]]
+    light_count = sum(len(values) for values in latencies.values())
+    waits = [
+        service.limiter.scheduler.wait_stats(user_id)["wait_time_avg"]
+        for user_id in light_ids if user_id not in priority_ids
+    ]
+    row = {
+        "light p50 ms": percentile(regular, 50) * 1000,
+        "light p99 ms": percentile(regular, 99) * 1000,
+        "light wait ms": sum(waits) / len(waits) * 1000,
+        "light req/s": light_count / elapsed,
+        "heavy req/s": len(heavy_done) / elapsed,
+        "heavy wait ms": service.limiter.scheduler.wait_stats(HEAVY_USER)["wait_time_avg"] * 1000,
+    }
+    if priority:
+        row["prio p50 ms"] = percentile(priority, 50) * 1000
+    return row
+
+
+async def run(duration: float, light_users: int, heavy_concurrency: int, slots: int) -> None:
+    server = FakeOpenAIServer(
+        first_token_delay=0.05,
+        token_delay=0.0,
+        reply_tokens=20,
+        prompt_token_delay=0.0001,
+        port=PORT
+    )
+    await server.start()
+    
+    rows = {}
+    for name, config in CASES.items():
+        rows[name] = await run_case(config, duration, light_users, heavy_concurrency, slots)
+    
+    await get_openai_service().close()
+    await server.stop()
+    report(
+        f"{slots} слотов, тяжелый пользователь x{heavy_concurrency} длинных запросов, "
+        f"{light_users} легких пользователей, {duration:.0f} с",
+        rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--light-users", type=int, default=40)
+    parser.add_argument("--heavy-concurrency", type=int, default=16)
+    parser.add_argument("--slots", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(run(args.duration, args.light_users, args.heavy_concurrency, args.slots))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Накладные расходы логирования на горячем пути
+
+Для каждого режима логирования замеряются стоимость одного вызова
+logger.debug в потоке цикла событий и время хода диалога в БД
+(begin_turn + append_message, по три отладочные записи на ход).
+Консольный обработчик пишет в /dev/null, файловый - во временный файл.
+Режимы: логи выключены, прежняя синхронная запись DEBUG, запись через
+очередь фонового потока, JSON, прореживание DEBUG и уровень INFO.
+Последние два режима имитируют медленную консоль (переполненный pipe,
+медленный сборщик логов): каждая запись в нее занимает --stall секунд.
+
+Запуск: python -m benchmarks.bench_logging [--calls 20000] [--turns 1000] [--users 50]
+        [--stall 0.0002]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks._env import setup_env, report, Timer
+
+setup_env()
+
+from loguru import logger  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.database.connection import db_manager  # noqa: E402
+from src.logging_setup import setup_logging  # noqa: E402
+from src.services.context_service import context_service  # noqa: E402
+
+
+MODES = {
+    "выключено": None,
+    "синхр. DEBUG": {"log_level": "DEBUG", "log_enqueue": False},
+    "очередь DEBUG": {"log_level": "DEBUG", "log_enqueue": True},
+    "очередь JSON": {"log_level": "DEBUG", "log_enqueue": True, "log_json": True},
+    "DEBUG 1/100": {"log_level": "DEBUG", "log_enqueue": True, "log_debug_sample_every": 100},
+    "очередь INFO": {"log_level": "INFO", "log_enqueue": True},
+    "медл., синхр.": {"log_level": "DEBUG", "log_enqueue": False, "stall": True},
+    "медл., очередь": {"log_level": "DEBUG", "log_enqueue": True, "stall": True},
+}
+
+
+class SlowWriter:
+    """Консоль, запись в которую блокируется на stall секунд"""
+    
+    def __init__(self, stall: float):
+        self.stall = stall
+    
+    def write(self, text: str) -> None:
+        time.sleep(self.stall)
+    
+    def flush(self) -> None:
+        pass
+
+
+def configure(mode, log_file: str, stall: float) -> None:
+    """Настройка логирования для режима"""
+    logger.remove()
+    if mode is None:
+        return
+    
+    settings.log_file = log_file
+    settings.log_level = "INFO"
+    settings.log_enqueue = True
+    settings.log_json = False
+    settings.log_debug_sample_every = 1
+    for key, value in mode.items():
+        if key != "stall":
+            setattr(settings, key, value)
+    
+    stdout = sys.stdout
+    sys.stdout = SlowWriter(stall) if mode.get("stall") else open(os.devnull, "w")
+    try:
+        setup_logging()
+    finally:
+        sys.stdout = stdout
+
+
+async def run_mode(mode, log_file: str, calls: int, turns: int, users: int, offset: int, stall: float) -> dict:
+    configure(mode, log_file, stall)
+    
+    with Timer() as call_timer:
+        for i in range(calls):
+            logger.debug("Добавлено сообщение от {} для пользователя {}", "user", i)
+    
+    with Timer() as turn_timer:
+        for i in range(turns):
+            telegram_id = offset + i % users
+            user_id, _ = await context_service.begin_turn(telegram_id, ["Привет!"], username="bench")
+            await context_service.append_message(user_id, telegram_id, "assistant", "Здравствуйте!")
+    
+    # Время, за которое фоновый поток дописывает очередь, в замер не входит
+    await logger.complete()
+    logger.remove()
+    
+    return {
+        "us/вызов": call_timer.elapsed / calls * 1e6,
+        "ms/ход": turn_timer.elapsed / turns * 1000,
+        "ходов/с": turns / turn_timer.elapsed,
+        "KiB лога": os.path.getsize(log_file) / 1024 if os.path.exists(log_file) else 0,
+    }
+
+
+async def run(calls: int, turns: int, users: int, stall: float) -> None:
+    await db_manager.init_db()
+    log_dir = tempfile.mkdtemp(prefix="bot-bench-logs-")
+    
+    rows = {}
+    for index, (name, mode) in enumerate(MODES.items()):
+        log_file = os.path.join(log_dir, f"mode{index}.log")
+        rows[name] = await run_mode(mode, log_file, calls, turns, users, offset=(index + 1) * 100000, stall=stall)
+    
+    await db_manager.close()
+    report(f"Логирование: {calls} вызовов logger.debug, {turns} ходов диалога", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--stall", type=float, default=0.0002)
+    args = parser.parse_args()
+    asyncio.run(run(args.calls, args.turns, args.users, args.stall))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Метрики Prometheus: накладные расходы и разбивка задержки по этапам
+
+Сначала замеряется стоимость одного замера этапа (track_stage) в
+сравнении с пустым циклом. Затем настоящий TelegramBot с включенным
+эндпоинтом /metrics обрабатывает сообщения от заглушек Bot API и
+OpenAI, после чего эндпоинт опрашивается и печатаются средние
+длительности этапов из гистограмм.
+
+Запуск: python -m benchmarks.bench_metrics [--users 50] [--iterations 200000]
+        [--telegram-latency 0.02] [--openai-latency 0.2]
+"""
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+from benchmarks._env import setup_env, free_port, report, Timer
+
+OPENAI_PORT = free_port()
+TELEGRAM_PORT = free_port()
+METRICS_PORT = free_port()
+
+setup_env(
+    openai_api_base=f"http://127.0.0.1:{OPENAI_PORT}/v1",
+    telegram_api_base=f"http://127.0.0.1:{TELEGRAM_PORT}/bot",
+    message_debounce_seconds="0",
+    metrics_enabled="true",
+    metrics_port=str(METRICS_PORT)
+)
+
+from prometheus_client.parser import text_string_to_metric_families  # noqa: E402
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegramServer  # noqa: E402
+from src.bot import TelegramBot  # noqa: E402
+from src.metrics import track_stage  # noqa: E402
+
+
+async def wait_until_polling(telegram: FakeTelegramServer) -> None:
+    """Ожидание первого getUpdates: до него deleteWebhook сбрасывает очередь"""
+    while not telegram.calls.get("getUpdates"):
+        await asyncio.sleep(0.05)
+
+
+def measure_overhead(iterations: int) -> dict:
+    """Стоимость одного замера этапа в микросекундах"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        pass
+    empty = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    for _ in range(iterations):
+        with track_stage("bench"):
+            pass
+    tracked = time.perf_counter() - started
+    
+    return {"us/замер": (tracked - empty) / iterations * 1e6}
+
+
+async def scrape() -> tuple:
+    """Опрос /metrics: текст ответа и время запроса"""
+    async with aiohttp.ClientSession() as session:
+        with Timer() as timer:
+            async with session.get(f"http://127.0.0.1:{METRICS_PORT}/metrics") as response:
+                text = await response.text()
+    return text, timer.elapsed
+
+
+def stage_rows(text: str) -> dict:
+    """Средняя длительность и число замеров по этапам"""
+    sums, counts = {}, {}
+    for family in text_string_to_metric_families(text):
+        if family.name != "bot_stage_seconds":
+            continue
+        for sample in family.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                sums[stage] = sample.value
+            elif sample.name.endswith("_count"):
+                counts[stage] = sample.value
+    return {
+        stage: {"count": counts[stage], "avg ms": sums[stage] / counts[stage] * 1000}
+        for stage in counts if counts[stage] and stage != "bench"
+    }
+
+
+async def run(users: int, iterations: int, telegram_latency: float, openai_latency: float) -> None:
+    report("Накладные расходы track_stage", {"замер": measure_overhead(iterations)})
+    
+    openai = FakeOpenAIServer(first_token_delay=openai_latency, token_delay=0.0, reply_tokens=10, port=OPENAI_PORT)
+    telegram = FakeTelegramServer(latency=telegram_latency, port=TELEGRAM_PORT)
+    await openai.start()
+    await telegram.start()
+    
+    bot = TelegramBot()
+    task = asyncio.create_task(bot.start())
+    await wait_until_polling(telegram)
+    
+    for i in range(users):
+        telegram.enqueue_update(i + 1, "Привет!")
+    await telegram.wait_for_sent(users, timeout=300)
+    
+    text, elapsed = await scrape()
+    
+    await bot.stop()
+    task.cancel()
+    await telegram.stop()
+    await openai.stop()
+    
+    report(f"Этапы обработки, {users} польз.", stage_rows(text))
+    report("Опрос /metrics", {"scrape": {"ms": elapsed * 1000, "KiB": len(text) / 1024}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--openai-latency", type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.iterations, args.telegram_latency, args.openai_latency))
+
+
+if __name__ == "__main__":
+    main()
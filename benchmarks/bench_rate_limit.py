@@ -0,0 +1,94 @@
+"""
+Всплеск запросов к OpenAI при лимите запросов на стороне сервера:
+без ограничителя против ограничителя с учетом заголовков
+
+Сервер-заглушка считает лимит в окне 1 с, чтобы прогон был коротким.
+
+Запуск: python -m benchmarks.bench_rate_limit [--users 100] [--server-rps 10]
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._env import setup_env, free_port, percentile, report
+
+PORT = free_port()
+setup_env(openai_api_base=f"http://127.0.0.1:{PORT}/v1")
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.services.openai_service import get_openai_service  # noqa: E402
+from src.services.rate_limiter import RateLimiter, RateLimitQueueFull  # noqa: E402
+
+
+async def user_request(latencies: list, outcomes: dict) -> None:
+    started = time.perf_counter()
+    try:
+        await get_openai_service().get_chat_completion([{"role": "user", "content": "Привет"}])
+        outcomes["ok"] += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    except RateLimitQueueFull:
+        outcomes["rejected"] += 1
+    except Exception:
+        outcomes["errors"] += 1
+
+
+async def run(users: int, server_rps: int) -> None:
+    server = FakeOpenAIServer(
+        first_token_delay=0.2,
+        token_delay=0.0,
+        reply_tokens=10,
+        requests_per_minute=server_rps,
+        rate_window=1.0,
+        port=PORT
+    )
+    await server.start()
+    rows = {}
+    
+    configs = {
+        # Прежнее поведение: без ограничений, ошибка сразу уходит пользователю
+        "no limiter": dict(max_concurrency=10 ** 6, requests_per_minute=0, retries=0),
+        "limiter": dict(max_concurrency=8, requests_per_minute=server_rps * 60, retries=2),
+    }
+    
+    for name, config in configs.items():
+        # Свежее окно лимита сервера для каждого прогона
+        await asyncio.sleep(server.rate_window)
+        server._window.clear()
+        server.rate_limited = 0
+        settings.openai_max_retries = config["retries"]
+        service = get_openai_service()
+        service.limiter = RateLimiter(
+            max_concurrency=config["max_concurrency"],
+            requests_per_minute=config["requests_per_minute"],
+            tokens_per_minute=0,
+            max_queue=users
+        )
+        
+        latencies = []
+        outcomes = {"ok": 0, "errors": 0, "rejected": 0}
+        await asyncio.gather(*(user_request(latencies, outcomes) for _ in range(users)))
+        
+        rows[name] = {
+            **outcomes,
+            "server 429": server.rate_limited,
+            "p50 ms": percentile(latencies, 50),
+            "p95 ms": percentile(latencies, 95),
+            **{key: service.limiter.stats()[key] for key in ("wait_time_avg", "wait_time_max")},
+        }
+    
+    await get_openai_service().close()
+    await server.stop()
+    report(f"Всплеск из {users} запросов, лимит сервера {server_rps}/с", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--server-rps", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.server_rps))
+
+
+if __name__ == "__main__":
+    main()
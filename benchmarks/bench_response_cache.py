@@ -0,0 +1,69 @@
+"""
+Одинаковые первые вопросы от разных пользователей: количество запросов
+к OpenAI и задержка без кэша и с кэшем ответов в памяти и в БД
+
+Запуск: python -m benchmarks.bench_response_cache [--users 50] [--waves 3]
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._env import setup_env, free_port, percentile, report
+
+PORT = free_port()
+setup_env(openai_api_base=f"http://127.0.0.1:{PORT}/v1", response_cache_max_temperature="1.0")
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.database.connection import db_manager  # noqa: E402
+from src.services.openai_service import get_openai_service  # noqa: E402
+
+QUESTION = [{"role": "user", "content": "Что ты умеешь?"}]
+
+
+async def ask(latencies: list) -> None:
+    started = time.perf_counter()
+    await get_openai_service().get_chat_completion(QUESTION)
+    latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def run(users: int, waves: int) -> None:
+    server = FakeOpenAIServer(first_token_delay=0.5, token_delay=0.0, reply_tokens=30, port=PORT)
+    await server.start()
+    await db_manager.init_db()
+    rows = {}
+    
+    for backend in ("none", "memory", "database"):
+        settings.response_cache_backend = backend
+        service = get_openai_service()
+        service.cache = service._init_cache()
+        server.requests = 0
+        latencies = []
+        
+        # Первая волна - одновременные одинаковые запросы, следующие - повторные
+        for _ in range(waves):
+            await asyncio.gather(*(ask(latencies) for _ in range(users)))
+        
+        rows[backend] = {
+            "requests": users * waves,
+            "upstream calls": server.requests,
+            "p50 ms": percentile(latencies, 50),
+            "p95 ms": percentile(latencies, 95),
+        }
+    
+    await get_openai_service().close()
+    await db_manager.close()
+    await server.stop()
+    report(f"{waves} волны по {users} одинаковых запросов", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--waves", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.waves))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Запросы истории на большой таблице сообщений: схема до и после
+составного индекса (telegram_id, created_at)
+
+Синтетическая база в прежней схеме (индексы только по user_id и
+created_at, без внешнего ключа) заполняется заданным числом сообщений
+средствами SQLite. Замеряются запрос истории get_context (тот же SQL,
+что строит ContextService) и удаление истории clear_context (с откатом)
+для случайных пользователей; затем DatabaseManager.init_db обновляет
+базу на месте, и замеры повторяются, в том числе через сам
+ContextService.get_context.
+
+Запуск: python -m benchmarks.bench_schema [--rows 2000000] [--users 20000] [--queries 200]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from benchmarks._env import setup_env, percentile, report, Timer
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bot-bench-schema-"), "schema.db")
+setup_env(db_path=DB_PATH)
+
+from sqlalchemy import delete, select  # noqa: E402
+from sqlalchemy.dialects import sqlite  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.database.connection import db_manager  # noqa: E402
+from src.database.models import Message  # noqa: E402
+from src.services.context_service import context_service  # noqa: E402
+
+# Схема таблиц в том виде, в каком ее создавали предыдущие версии
+LEGACY_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY, telegram_id BIGINT NOT NULL, username VARCHAR(255),
+    first_name VARCHAR(255), last_name VARCHAR(255), created_at DATETIME, last_active DATETIME
+);
+CREATE UNIQUE INDEX ix_users_telegram_id ON users (telegram_id);
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, telegram_id BIGINT NOT NULL,
+    role VARCHAR(50) NOT NULL, content TEXT NOT NULL, token_count INTEGER,
+    replaced_tokens INTEGER, created_at DATETIME
+);
+CREATE INDEX ix_messages_user_id ON messages (user_id);
+CREATE INDEX ix_messages_created_at ON messages (created_at);
+"""
+
+
+def fill_legacy(rows: int, users: int) -> None:
+    """Заполнение базы прежней схемы: сообщения пользователей перемешаны во времени"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.execute(
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+        "INSERT INTO users (id, telegram_id) SELECT i, i FROM n",
+        (users,)
+    )
+    conn.execute(
+        "WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < ? - 1) "
+        "INSERT INTO messages (user_id, telegram_id, role, content, token_count, created_at) "
+        "SELECT i % ? + 1, i % ? + 1, CASE i % 2 WHEN 0 THEN 'user' ELSE 'assistant' END, "
+        "'Сообщение номер ' || i || ' с обычным текстом средней длины', 12, "
+        "strftime('%Y-%m-%d %H:%M:%f000', '2024-01-01', '+' || (i / 10) || ' seconds') FROM n",
+        (rows, users, users)
+    )
+    conn.commit()
+    conn.close()
+
+
+def compile_sql(statement) -> str:
+    return str(statement.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def history_sql(telegram_id: int) -> str:
+    """Запрос истории в том виде, в каком его выполняет ContextService"""
+    return compile_sql(
+        select(Message.role, Message.content, Message.token_count, Message.replaced_tokens)
+        .where(Message.telegram_id == telegram_id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(settings.context_window_rows)
+    )
+
+
+def measure_queries(user_ids) -> dict:
+    """Задержка запроса истории и удаления истории напрямую через SQLite"""
+    conn = sqlite3.connect(DB_PATH)
+    plan = " / ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + history_sql(user_ids[0])))
+    
+    history = []
+    for telegram_id in user_ids:
+        started = time.perf_counter()
+        conn.execute(history_sql(telegram_id)).fetchall()
+        history.append(time.perf_counter() - started)
+    
+    clears = []
+    for telegram_id in user_ids[:max(1, len(user_ids) // 10)]:
+        started = time.perf_counter()
+        conn.execute(compile_sql(delete(Message).where(Message.telegram_id == telegram_id)))
+        clears.append(time.perf_counter() - started)
+        conn.rollback()
+    
+    conn.close()
+    return {
+        "history p50 ms": percentile(history, 50) * 1000,
+        "history p99 ms": percentile(history, 99) * 1000,
+        "clear p50 ms": percentile(clears, 50) * 1000,
+    }, plan
+
+
+async def measure_service(user_ids) -> dict:
+    """Задержка ContextService.get_context без кэша"""
+    context_service.cache = None
+    latencies = []
+    for telegram_id in user_ids:
+        started = time.perf_counter()
+        await context_service.get_context(telegram_id)
+        latencies.append(time.perf_counter() - started)
+    return {
+        "history p50 ms": percentile(latencies, 50) * 1000,
+        "history p99 ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def run(rows: int, users: int, queries: int) -> None:
+    with Timer() as fill_timer:
+        fill_legacy(rows, users)
+    print(f"Заполнено {rows} сообщений {users} пользователей за {fill_timer.elapsed:.1f} с")
+    
+    user_ids = random.Random(1).sample(range(1, users + 1), min(queries, users))
+    results = {}
+    plans = {}
+    results["прежняя схема"], plans["прежняя схема"] = measure_queries(user_ids)
+    
+    with Timer() as migrate_timer:
+        await db_manager.init_db()
+    results["новая схема"], plans["новая схема"] = measure_queries(user_ids)
+    results["get_context"] = await measure_service(user_ids)
+    await db_manager.close()
+    
+    report(
+        f"{rows} сообщений, {users} пользователей, {len(user_ids)} запросов; "
+        f"миграция заняла {migrate_timer.elapsed:.1f} с",
+        results
+    )
+    for name, plan in plans.items():
+        print(f"План запроса истории ({name}): {plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.users, args.queries))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Отправка длинных ответов при лимитах Bot API
+
+Настоящий TelegramBot работает с заглушками OpenAI (ответ длиннее 4096
+символов) и Bot API, которая, как Telegram, отклоняет слишком длинный
+текст и отвечает 429 с retry_after сверх общего лимита бота (~30
+сообщений в секунду) и лимита чата (1 в секунду с коротким всплеском).
+Все пользователи пишут одновременно, каждый ответ разбивается на
+несколько сообщений. Сравнивается отправка без учета лимитов (каждый
+429 превращается в ответ с ошибкой) и очередь отправки с ведрами
+токенов и повтором после RetryAfter. Проверяется, что каждый ответ
+дошел целиком и по порядку, замеряются 429 от сервера, время до
+последней части ответа и пиковая частота отправок.
+
+Запуск: python -m benchmarks.bench_send_queue [--users 60] [--reply-tokens 1500]
+        [--telegram-latency 0.02] [--timeout 60]
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._env import setup_env, free_port, percentile, report
+
+OPENAI_PORT = free_port()
+TELEGRAM_PORT = free_port()
+setup_env(
+    openai_api_base=f"http://127.0.0.1:{OPENAI_PORT}/v1",
+    telegram_api_base=f"http://127.0.0.1:{TELEGRAM_PORT}/bot",
+    message_debounce_seconds="0",
+    openai_max_concurrency="256",
+    openai_prewarm_connections="0",
+    log_level="ERROR",
+    log_file=""
+)
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegramServer  # noqa: E402
+from src.bot import TelegramBot  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.handlers import message_handler  # noqa: E402
+from src.services.send_queue import SendQueue, split_message  # noqa: E402
+
+CASES = {
+    "без лимитов": dict(global_rate=0, chat_rate=0, chat_burst=1, group_rate_per_minute=0, max_retries=0),
+    "очередь": dict(
+        global_rate=settings.telegram_global_rate,
+        chat_rate=settings.telegram_chat_rate,
+        chat_burst=settings.telegram_chat_burst,
+        group_rate_per_minute=settings.telegram_group_rate_per_minute,
+        max_retries=settings.telegram_send_retries
+    ),
+}
+
+
+def peak_rate(times) -> int:
+    """Наибольшее число отправок за любую секунду"""
+    times = sorted(times)
+    peak = 0
+    first = 0
+    for last, sent_at in enumerate(times):
+        while sent_at - times[first] >= 1.0:
+            first += 1
+        peak = max(peak, last - first + 1)
+    return peak
+
+
+async def run_case(telegram: FakeTelegramServer, first_user: int, users: int,
+                   expected, timeout: float) -> dict:
+    sent_before = len(telegram.sent)
+    flood_before = telegram.flood_rejected
+    too_long_before = telegram.too_long_rejected
+    chats = list(range(first_user, first_user + users))
+    
+    started = time.perf_counter()
+    for chat_id in chats:
+        telegram.enqueue_update(chat_id, "Расскажи подробно")
+    
+    def by_chat():
+        replies = {chat_id: [] for chat_id in chats}
+        for sent in telegram.sent[sent_before:]:
+            replies[sent["chat_id"]].append(sent)
+        return replies
+    
+    def finished(replies) -> bool:
+        return len(replies) >= len(expected) or any(reply["text"].startswith("😔") for reply in replies)
+    
+    deadline = started + timeout
+    while time.perf_counter() < deadline and not all(finished(replies) for replies in by_chat().values()):
+        await asyncio.sleep(0.1)
+    
+    replies = by_chat()
+    complete = [chat_id for chat_id, sent in replies.items() if [s["text"] for s in sent] == expected]
+    durations = [replies[chat_id][-1]["time"] - started for chat_id in complete]
+    return {
+        "complete": len(complete),
+        "errors": sum(
+            1 for sent in replies.values() if any(reply["text"].startswith("😔") for reply in sent)
+        ),
+        "server 429": telegram.flood_rejected - flood_before,
+        "too long": telegram.too_long_rejected - too_long_before,
+        "last part p50 s": percentile(durations, 50),
+        "last part p99 s": percentile(durations, 99),
+        "peak msg/s": peak_rate(sent["time"] for sent in telegram.sent[sent_before:]),
+    }
+
+
+async def run(users: int, reply_tokens: int, telegram_latency: float, timeout: float) -> None:
+    openai = FakeOpenAIServer(first_token_delay=0.05, token_delay=0.0, reply_tokens=reply_tokens, port=OPENAI_PORT)
+    telegram = FakeTelegramServer(
+        latency=telegram_latency,
+        port=TELEGRAM_PORT,
+        global_rate=30,
+        chat_rate=1,
+        chat_burst=3
+    )
+    await openai.start()
+    await telegram.start()
+    expected = split_message("".join(openai._tokens()))
+    
+    bot = TelegramBot()
+    bot_task = asyncio.create_task(bot.start())
+    while not telegram.calls.get("getUpdates"):
+        if bot_task.done():
+            bot_task.result()
+        await asyncio.sleep(0.05)
+    
+    rows = {}
+    for number, (name, config) in enumerate(CASES.items()):
+        message_handler.send_queue = SendQueue(**config)
+        rows[name] = await run_case(telegram, 1000 + number * users, users, expected, timeout)
+        # Лимиты сервера восстанавливаются перед следующим прогоном
+        await asyncio.sleep(3)
+    
+    await bot.stop()
+    bot_task.cancel()
+    await telegram.stop()
+    await openai.stop()
+    
+    report(
+        f"{users} пользователей одновременно, ответ {len(''.join(expected))} символов = "
+        f"{len(expected)} сообщ.; лимиты сервера: 30/с на бота, 1/с (всплеск 3) на чат",
+        rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--reply-tokens", type=int, default=1500)
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.reply_tokens, args.telegram_latency, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Время запуска бота до приема первого обновления
+
+Бот запускается отдельным процессом через run.py (как в продакшене)
+против локальных заглушек Bot API и OpenAI с сетевыми задержками.
+Замеряется время от запуска процесса до первого getUpdates (бот готов
+принимать обновления) и до первого ответа на сообщение, отправленное
+сразу после этого. С --tree замеряется другая копия репозитория
+(например, git worktree предыдущей версии) для сравнения. Отчет о
+запуске из лога бота (этапы и импорты) печатается для последнего
+прогона.
+
+Запуск: python -m benchmarks.bench_startup [--runs 5] [--telegram-latency 0.1]
+        [--openai-connect 0.3] [--tree PATH ...]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks._env import setup_env, free_port, report
+
+TELEGRAM_PORT = free_port()
+OPENAI_PORT = free_port()
+
+setup_env(
+    openai_api_base=f"http://127.0.0.1:{OPENAI_PORT}/v1",
+    telegram_api_base=f"http://127.0.0.1:{TELEGRAM_PORT}/bot",
+    message_debounce_seconds="0",
+    log_level="INFO",
+    log_file="",
+    log_enqueue="false"
+)
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegramServer  # noqa: E402
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def start_once(tree: str, telegram: FakeTelegramServer, user_id: int) -> dict:
+    """Один запуск бота: время до первого getUpdates и до первого ответа"""
+    env = dict(os.environ)
+    env["DATABASE_URL"] = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bot-bench-"), "bot.db")
+    polls_before = telegram.calls.get("getUpdates", 0)
+    
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "run.py",
+        cwd=tree, env=env,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+    )
+    while telegram.calls.get("getUpdates", 0) <= polls_before:
+        if process.returncode is not None:
+            raise RuntimeError(f"Бот завершился с кодом {process.returncode}")
+        await asyncio.sleep(0.005)
+    ready = time.perf_counter() - started
+    
+    telegram.enqueue_update(user_id, "Привет!")
+    replied = await telegram.wait_for_reply(user_id, 0, timeout=30)
+    first_reply = replied - started if replied is not None else float("nan")
+    
+    process.send_signal(signal.SIGINT)
+    output, _ = await process.communicate()
+    lines = output.decode(errors="replace").splitlines()
+    summary = next((line for line in reversed(lines) if "Время запуска" in line), "")
+    return {"ready s": ready, "first reply s": first_reply, "summary": summary}
+
+
+async def run(trees, runs: int, telegram_latency: float, openai_connect: float) -> None:
+    openai = FakeOpenAIServer(first_token_delay=0.05, token_delay=0.0, reply_tokens=10,
+                              port=OPENAI_PORT, models_delay=openai_connect)
+    telegram = FakeTelegramServer(latency=telegram_latency, port=TELEGRAM_PORT)
+    await openai.start()
+    await telegram.start()
+    
+    rows = {}
+    summaries = {}
+    user_id = 1
+    for tree in trees:
+        results = []
+        for _ in range(runs):
+            results.append(await start_once(tree, telegram, user_id))
+            user_id += 1
+        name = os.path.basename(os.path.normpath(tree)) or tree
+        rows[name] = {
+            "ready s": statistics.median(r["ready s"] for r in results),
+            "ready min s": min(r["ready s"] for r in results),
+            "first reply s": statistics.median(r["first reply s"] for r in results),
+        }
+        summaries[name] = results[-1]["summary"]
+    
+    await telegram.stop()
+    await openai.stop()
+    
+    report(
+        f"Запуск run.py, медиана {runs} прогонов; Bot API {telegram_latency} с, "
+        f"прогрев OpenAI {openai_connect} с",
+        rows
+    )
+    for name, summary in summaries.items():
+        if summary:
+            print(f"{name}: {summary.split(' - ', 1)[-1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--telegram-latency", type=float, default=0.1)
+    parser.add_argument("--openai-connect", type=float, default=0.3)
+    parser.add_argument("--tree", action="append", default=[])
+    args = parser.parse_args()
+    asyncio.run(run(args.tree or [REPO], args.runs, args.telegram_latency, args.openai_connect))
+
+
+if __name__ == "__main__":
+    main()
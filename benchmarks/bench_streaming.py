@@ -0,0 +1,74 @@
+"""
+Время до первого видимого текста: обычный ответ против потокового
+режима с редактированием сообщения
+
+Обработчик handle_message работает с заглушкой OpenAI, объекты Telegram
+заменены простыми классами, которые фиксируют моменты отправки.
+Объединение сообщений отключено, чтобы окно ожидания не входило в замер.
+
+Запуск: python -m benchmarks.bench_streaming [--requests 20] [--tokens 200]
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._env import setup_env, free_port, percentile, report
+
+PORT = free_port()
+setup_env(
+    openai_api_base=f"http://127.0.0.1:{PORT}/v1",
+    stream_edit_interval="0.3",
+    message_debounce_seconds="0"
+)
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from benchmarks.fake_updates import FakeContext, FakeUpdate  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.database.connection import db_manager  # noqa: E402
+from src.handlers.message_handler import handle_message, message_queue  # noqa: E402
+from src.services.openai_service import get_openai_service  # noqa: E402
+
+
+async def run(requests: int, tokens: int) -> None:
+    server = FakeOpenAIServer(first_token_delay=0.2, token_delay=0.01, reply_tokens=tokens, port=PORT)
+    await server.start()
+    await db_manager.init_db()
+    rows = {}
+    
+    for stream in (False, True):
+        settings.openai_stream = stream
+        first_visible, total, edits = [], [], 0
+        
+        for i in range(requests):
+            update = FakeUpdate(1000 + i, "Расскажи длинную историю")
+            started = time.perf_counter()
+            await handle_message(update, FakeContext())
+            await message_queue.close()
+            finished = time.perf_counter()
+            first_visible.append((update.message.first_visible - started) * 1000)
+            total.append((finished - started) * 1000)
+            edits += update.message.edits
+        
+        rows["stream" if stream else "blocking"] = {
+            "ttfv p50 ms": percentile(first_visible, 50),
+            "ttfv p95 ms": percentile(first_visible, 95),
+            "total p50 ms": percentile(total, 50),
+            "edits/reply": edits / requests,
+        }
+    
+    await get_openai_service().close()
+    await db_manager.close()
+    await server.stop()
+    report(f"Время до первого видимого текста: {requests} запросов, {tokens} токенов в ответе", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.tokens))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Размер промпта в длинных диалогах: без сжатия истории против сжатия
+старых сообщений в краткое содержание
+
+Каждый пользователь ведет длинный диалог, отправляя следующее сообщение
+после ответа на предыдущее. Считаются токены промпта всех запросов к
+OpenAI отдельно для ответов и для запросов на сжатие. Токены считаются
+заглушкой (4 символа на токен), поэтому оценка экономии из статистики
+сервиса сжатия (2,5 символа кириллицы на токен) выше.
+
+Запуск: python -m benchmarks.bench_summary [--users 10] [--turns 40] [--reply-tokens 80]
+"""
+import argparse
+import asyncio
+
+from benchmarks._env import setup_env, free_port, report, Timer
+
+PORT = free_port()
+setup_env(
+    openai_api_base=f"http://127.0.0.1:{PORT}/v1",
+    message_debounce_seconds="0"
+)
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from benchmarks.fake_updates import FakeContext, FakeUpdate  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.database.connection import db_manager  # noqa: E402
+from src.handlers.message_handler import handle_message, message_queue  # noqa: E402
+from src.services.context_service import context_service  # noqa: E402
+from src.services.openai_service import get_openai_service  # noqa: E402
+from src.services.summary_service import summarizer  # noqa: E402
+
+
+async def conversation(user_id: int, turns: int) -> None:
+    for turn in range(turns):
+        update = FakeUpdate(user_id, f"Вопрос номер {turn}: расскажи подробнее о предыдущем ответе")
+        await handle_message(update, FakeContext())
+        # Следующее сообщение пользователь пишет после ответа
+        while message_queue.stats()["pending"] or user_id in message_queue._workers:
+            await asyncio.sleep(0.01)
+
+
+async def run(users: int, turns: int, reply_tokens: int) -> None:
+    server = FakeOpenAIServer(first_token_delay=0.05, token_delay=0.0, reply_tokens=reply_tokens, port=PORT)
+    await server.start()
+    await db_manager.init_db()
+    rows = {}
+    
+    for index, enabled in enumerate((False, True)):
+        settings.summary_enabled = enabled
+        server.prompt_tokens.clear()
+        for key in context_service.summary_stats:
+            context_service.summary_stats[key] = 0
+        offset = index * users
+        
+        with Timer() as timer:
+            await asyncio.gather(*(conversation(offset + user_id, turns) for user_id in range(users)))
+            await summarizer.close()
+        
+        # Запросы на сжатие отличаются заданным max_tokens
+        chat = [tokens for tokens, max_tokens in server.prompt_tokens if max_tokens is None]
+        compaction = [tokens for tokens, max_tokens in server.prompt_tokens if max_tokens is not None]
+        stats = summarizer.stats()
+        rows["summary" if enabled else "no summary"] = {
+            "chat tok/turn": sum(chat) / len(chat),
+            "compactions": len(compaction),
+            "compact tokens": sum(compaction),
+            "total tokens": sum(chat) + sum(compaction),
+            "saved est/turn": stats["prompt_tokens_saved_per_turn"],
+            "seconds": timer.elapsed,
+        }
+    
+    await get_openai_service().close()
+    await db_manager.close()
+    await server.stop()
+    report(
+        f"{users} пользователей по {turns} сообщений, ответ {reply_tokens} токенов, "
+        f"окно {settings.max_context_messages} сообщений",
+        rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--reply-tokens", type=int, default=80)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.turns, args.reply_tokens))
+
+
+if __name__ == "__main__":
+    main()
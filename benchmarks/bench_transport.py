@@ -0,0 +1,100 @@
+"""
+Задержка первого запроса к OpenAI: холодный клиент против прогретого
+
+Запросы идут через локальный SOCKS5-прокси, который добавляет задержку
+на установку каждого соединения (модель рукопожатий SOCKS и TLS).
+Для каждого замера создается новый пул клиентов. Отдельно показан
+запрос после простоя дольше времени жизни соединения с поддерживающими
+запросами и без них.
+
+Запуск: python -m benchmarks.bench_transport [--trials 20] [--handshake 0.15]
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._env import setup_env, free_port, percentile, report
+
+PORT = free_port()
+setup_env(openai_api_base=f"http://127.0.0.1:{PORT}/v1")
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from benchmarks.fake_socks import FakeSocksProxy  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.services.openai_service import get_openai_service  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Привет"}]
+
+
+async def timed_request() -> float:
+    started = time.perf_counter()
+    await get_openai_service().get_chat_completion(MESSAGES)
+    return (time.perf_counter() - started) * 1000
+
+
+async def keep_warm(interval: float, duration: float) -> None:
+    """Упрощенный цикл поддержки соединений из TelegramBot"""
+    deadline = time.monotonic() + duration
+    while time.monotonic() + interval < deadline:
+        await asyncio.sleep(interval)
+        service = get_openai_service()
+        if service.idle_for() >= interval:
+            await service.warm_up()
+
+
+async def run_case(trials: int, prewarm: bool, idle: float = 0.0, ping: float = 0.0) -> dict:
+    first, second = [], []
+    for _ in range(trials):
+        service = get_openai_service()
+        service._init_client()
+        if prewarm:
+            await service.warm_up()
+        if idle:
+            if ping:
+                await keep_warm(ping, idle)
+            else:
+                await asyncio.sleep(idle)
+        first.append(await timed_request())
+        second.append(await timed_request())
+        await service.close()
+    
+    return {
+        "first p50 ms": percentile(first, 50),
+        "first p95 ms": percentile(first, 95),
+        "next p50 ms": percentile(second, 50),
+    }
+
+
+async def run(trials: int, handshake: float) -> None:
+    server = FakeOpenAIServer(first_token_delay=0.02, token_delay=0.0, reply_tokens=10, port=PORT)
+    proxy = FakeSocksProxy(handshake_delay=handshake)
+    await server.start()
+    await proxy.start()
+    settings.proxy_url = proxy.url
+    settings.openai_prewarm_connections = 1
+    
+    rows = {
+        "cold": await run_case(trials, prewarm=False),
+        "prewarmed": await run_case(trials, prewarm=True),
+    }
+    
+    # Простой дольше времени жизни соединения
+    settings.openai_keepalive_expiry = 1.0
+    rows["idle 1.5s, no ping"] = await run_case(trials // 4 or 1, prewarm=True, idle=1.5)
+    rows["idle 1.5s, ping 0.5s"] = await run_case(trials // 4 or 1, prewarm=True, idle=1.5, ping=0.5)
+    
+    await proxy.stop()
+    await server.stop()
+    report(f"Первый запрос через SOCKS5 с задержкой соединения {handshake * 1000:.0f} мс", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--handshake", type=float, default=0.15)
+    args = parser.parse_args()
+    asyncio.run(run(args.trials, args.handshake))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Стоимость одного хода диалога в БД: прежний путь из четырех сессий
+против begin_turn + append_message, с кэшем контекстов и без него,
+с кэшем пользователей (отложенная запись last_active) и без него
+
+Запросы к таблице users считаются отдельно; при включенном кэше
+пользователей в них входит и периодическая пакетная запись last_active.
+
+Запуск: python -m benchmarks.bench_turn_pipeline [--turns 2000] [--users 50] [--flush-seconds 1]
+"""
+import argparse
+import asyncio
+
+from benchmarks._env import setup_env, report, Timer
+
+setup_env()
+
+from sqlalchemy import event  # noqa: E402
+
+from src.database.connection import db_manager  # noqa: E402
+from src.services.user_cache import UserCache  # noqa: E402
+from src.services.context_service import context_service  # noqa: E402
+
+
+class StatementCounter:
+    """Подсчет SQL-запросов и транзакций движка"""
+    
+    def __init__(self, engine):
+        self.statements = 0
+        self.user_statements = 0
+        self.commits = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "commit", self._on_commit)
+    
+    def _on_execute(self, conn, cursor, statement, *args):
+        self.statements += 1
+        if "users" in statement:
+            self.user_statements += 1
+    
+    def _on_commit(self, *args):
+        self.commits += 1
+    
+    def reset(self):
+        self.statements = 0
+        self.user_statements = 0
+        self.commits = 0
+
+
+async def legacy_turn(telegram_id: int, text: str) -> None:
+    """Ход диалога в том виде, в каком его выполнял handle_message раньше"""
+    await context_service.get_or_create_user(telegram_id=telegram_id, username="bench")
+    await context_service.add_message(telegram_id=telegram_id, role="user", content=text)
+    await context_service.get_context(telegram_id)
+    await context_service.add_message(telegram_id=telegram_id, role="assistant", content=text)
+
+
+async def pipelined_turn(telegram_id: int, text: str) -> None:
+    """Ход диалога через begin_turn и append_message"""
+    user_id, _ = await context_service.begin_turn(telegram_id, [text], username="bench")
+    await context_service.append_message(user_id, telegram_id, "assistant", text)
+
+
+async def run(turns: int, users: int, flush_seconds: float) -> None:
+    await db_manager.init_db()
+    counter = StatementCounter(db_manager.engine.sync_engine)
+    rows = {}
+    cache = context_service.cache
+    user_cache = None
+    
+    for name, turn, offset, use_cache, use_users in (
+        ("legacy", legacy_turn, 0, False, False),
+        ("begin_turn", pipelined_turn, users, False, False),
+        ("begin_turn + cache", pipelined_turn, 2 * users, True, False),
+        ("+ user cache", pipelined_turn, 3 * users, True, True),
+    ):
+        context_service.cache = cache if use_cache else None
+        if use_users:
+            user_cache = UserCache(max_users=10 * users, flush_interval=flush_seconds)
+        context_service.users = user_cache if use_users else None
+        
+        # Прогрев: создаем пользователей заранее
+        for i in range(users):
+            await turn(offset + i, "warmup")
+        
+        counter.reset()
+        with Timer() as timer:
+            for i in range(turns):
+                await turn(offset + i % users, f"message {i}")
+            if use_users:
+                await user_cache.close()
+        
+        rows[name] = {
+            "ms/turn": timer.elapsed / turns * 1000,
+            "stmts/turn": counter.statements / turns,
+            "users/turn": counter.user_statements / turns,
+            "commits/turn": counter.commits / turns,
+        }
+    
+    await db_manager.close()
+    if cache:
+        print(f"Кэш контекстов: {cache.stats()}")
+    if user_cache:
+        print(f"Кэш пользователей: {user_cache.stats()}")
+    report(f"Ход диалога: {turns} ходов, {users} пользователей", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--flush-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.turns, args.users, args.flush_seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Пропускная способность приема обновлений: polling против webhook
+
+Настоящий TelegramBot работает с заглушками Bot API и OpenAI. В режиме
+polling обновления отдаются через getUpdates, в режиме webhook
+отправляются POST-запросами на webhook-сервер бота из отдельного
+процесса, как это делает Telegram (до 40 одновременных соединений).
+В режиме "webhook xN" на одном порту слушают N процессов бота
+(WEBHOOK_REUSE_PORT) с общей базой SQLite. Замеряется время, за которое
+бот ответил на все сообщения.
+
+Запуск: python -m benchmarks.bench_updates [--updates 300] [--openai-latency 0.2] [--processes 4]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+
+from benchmarks._env import setup_env, free_port, report, Timer
+
+# Порты и база передаются процессам-воркерам через окружение
+for name in ("BENCH_OPENAI_PORT", "BENCH_TELEGRAM_PORT"):
+    os.environ.setdefault(name, str(free_port()))
+OPENAI_PORT = int(os.environ["BENCH_OPENAI_PORT"])
+TELEGRAM_PORT = int(os.environ["BENCH_TELEGRAM_PORT"])
+SECRET = "bench-secret"
+
+os.environ["BENCH_DB_PATH"] = setup_env(
+    db_path=os.environ.get("BENCH_DB_PATH"),
+    openai_api_base=f"http://127.0.0.1:{OPENAI_PORT}/v1",
+    telegram_api_base=f"http://127.0.0.1:{TELEGRAM_PORT}/bot",
+    webhook_listen="127.0.0.1",
+    webhook_port=os.environ.get("WEBHOOK_PORT") or free_port(),
+    webhook_secret_token=SECRET,
+    webhook_set_on_start="false",
+    message_debounce_seconds="0",
+    openai_max_concurrency="64"
+)
+
+import httpx  # noqa: E402
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegramServer, make_text_update  # noqa: E402
+from src.bot import TelegramBot  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.database.connection import db_manager  # noqa: E402
+from src.services.openai_service import get_openai_service  # noqa: E402
+
+
+async def wait_until_running(bot: TelegramBot) -> None:
+    while True:
+        application = bot.application
+        if application and application.running:
+            if settings.bot_mode == "webhook" and bot.webhook_server:
+                return
+            if settings.bot_mode == "polling" and application.updater.running:
+                return
+        await asyncio.sleep(0.05)
+
+
+async def wait_until_listening(url: str) -> None:
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+
+
+async def post_updates(updates) -> None:
+    """Доставка обновлений на webhook так же, как это делает Telegram"""
+    process = multiprocessing.Process(target=_post_process, args=(updates,))
+    process.start()
+    await asyncio.get_running_loop().run_in_executor(None, process.join)
+
+
+def _post_process(updates) -> None:
+    """Отправитель работает в отдельном процессе и не отнимает CPU у бота"""
+    asyncio.run(_post(updates))
+
+
+async def _post(updates) -> None:
+    url = f"http://127.0.0.1:{settings.webhook_port}{settings.webhook_path}"
+    limits = httpx.Limits(max_connections=40)
+    semaphore = asyncio.Semaphore(40)
+    
+    async with httpx.AsyncClient(limits=limits) as client:
+        async def post(update):
+            async with semaphore:
+                while True:
+                    response = await client.post(
+                        url,
+                        content=json.dumps(update),
+                        headers={"X-Telegram-Bot-Api-Secret-Token": SECRET, "Content-Type": "application/json"}
+                    )
+                    if response.status_code == 200:
+                        return
+                    await asyncio.sleep(0.1)
+        
+        await asyncio.gather(*(post(update) for update in updates))
+
+
+def make_updates(count: int, first_user: int):
+    return [make_text_update(first_user + i, first_user + i, "Привет!") for i in range(count)]
+
+
+async def run_in_process(mode: str, telegram: FakeTelegramServer, count: int, first_user: int) -> dict:
+    settings.bot_mode = mode
+    get_openai_service()._init_client()
+    telegram.sent.clear()
+    
+    bot = TelegramBot()
+    task = asyncio.create_task(bot.start())
+    await wait_until_running(bot)
+    
+    with Timer() as timer:
+        if mode == "polling":
+            for i in range(count):
+                telegram.enqueue_update(first_user + i, "Привет!")
+        else:
+            await post_updates(make_updates(count, first_user))
+        await telegram.wait_for_sent(count)
+    
+    await bot.stop()
+    task.cancel()
+    
+    return {"updates/sec": count / timer.elapsed, "seconds": timer.elapsed}
+
+
+async def run_processes(processes: int, telegram: FakeTelegramServer, count: int, first_user: int) -> dict:
+    """Несколько процессов бота на одном порту webhook"""
+    telegram.sent.clear()
+    env = dict(os.environ, WEBHOOK_PORT=str(settings.webhook_port), WEBHOOK_REUSE_PORT="true", BOT_MODE="webhook")
+    workers = [
+        subprocess.Popen([sys.executable, "-m", "benchmarks.bench_updates", "--worker"], env=env)
+        for _ in range(processes)
+    ]
+    await wait_until_listening(f"http://127.0.0.1:{settings.webhook_port}/healthz")
+    # Даем остальным процессам занять порт
+    await asyncio.sleep(1.0)
+    
+    with Timer() as timer:
+        await post_updates(make_updates(count, first_user))
+        await telegram.wait_for_sent(count)
+    
+    for worker in workers:
+        worker.send_signal(signal.SIGTERM)
+    for worker in workers:
+        await asyncio.get_running_loop().run_in_executor(None, worker.wait)
+    
+    return {"updates/sec": count / timer.elapsed, "seconds": timer.elapsed}
+
+
+async def worker() -> None:
+    """Процесс бота для режима с несколькими процессами"""
+    bot = TelegramBot()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, bot._stop_event.set)
+    await bot.start()
+    await bot.stop()
+
+
+async def run(count: int, openai_latency: float, processes: int) -> None:
+    openai = FakeOpenAIServer(first_token_delay=openai_latency, token_delay=0.0, reply_tokens=10, port=OPENAI_PORT)
+    telegram = FakeTelegramServer(port=TELEGRAM_PORT)
+    await openai.start()
+    await telegram.start()
+    
+    rows = {}
+    for index, mode in enumerate(("polling", "webhook")):
+        rows[mode] = await run_in_process(mode, telegram, count, first_user=index * count + 1)
+    if processes > 1:
+        # Схема уже создана, воркеры не конкурируют за CREATE TABLE
+        await db_manager.init_db()
+        rows[f"webhook x{processes}"] = await run_processes(processes, telegram, count, first_user=2 * count + 1)
+    
+    await telegram.stop()
+    await openai.stop()
+    report(f"{count} обновлений от разных пользователей, задержка OpenAI {openai_latency} с", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=300)
+    parser.add_argument("--openai-latency", type=float, default=0.2)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.worker:
+        asyncio.run(worker())
+    else:
+        asyncio.run(run(args.updates, args.openai_latency, args.processes))
+
+
+if __name__ == "__main__":
+    main()
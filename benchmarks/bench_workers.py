@@ -0,0 +1,167 @@
+"""
+Пропускная способность в режиме нескольких процессов
+
+Супервизор с N воркерами работает против локальных заглушек Bot API и
+OpenAI (без задержек, так что узким местом становится процессор:
+разбор JSON, ORM, логирование). Прогон состоит из раундов: в каждом
+все пользователи присылают по сообщению, следующий раунд начинается
+после ответов всем (сообщения одного пользователя, присланные до
+ответа, бот объединил бы в одну пачку). Замеряется число ответов в
+секунду за все раунды. Рост числа ответов в секунду с числом
+воркеров ограничен количеством ядер: на одном ядре процессы только
+делят его между собой.
+
+С --kill один воркер аварийно завершается посреди последнего прогона:
+супервизор перезапускает его, обновления из очереди доставляются после
+перезапуска, потеряны могут быть только уже принятые им сообщения
+(раунд с потерями ждет ответов --round-timeout секунд).
+В конце каждого прогона сверяются метрики, суммированные супервизором.
+
+Запуск: python -m benchmarks.bench_workers [--workers 1,2,4] [--users 200]
+        [--messages 5] [--kill] [--round-timeout 10]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks._env import setup_env, free_port, report
+
+# Модуль заново импортируется в процессах воркеров (spawn), поэтому порты
+# выбираются один раз и передаются через окружение
+if "BENCH_WORKERS_TELEGRAM_PORT" not in os.environ:
+    os.environ["BENCH_WORKERS_TELEGRAM_PORT"] = str(free_port())
+    os.environ["BENCH_WORKERS_OPENAI_PORT"] = str(free_port())
+    os.environ["BENCH_WORKERS_DB"] = setup_env()
+TELEGRAM_PORT = int(os.environ["BENCH_WORKERS_TELEGRAM_PORT"])
+OPENAI_PORT = int(os.environ["BENCH_WORKERS_OPENAI_PORT"])
+
+setup_env(
+    db_path=os.environ["BENCH_WORKERS_DB"],
+    openai_api_base=f"http://127.0.0.1:{OPENAI_PORT}/v1",
+    telegram_api_base=f"http://127.0.0.1:{TELEGRAM_PORT}/bot",
+    message_debounce_seconds="0",
+    openai_max_concurrency="256",
+    openai_max_retries="0",
+    openai_prewarm_connections="0",
+    metrics_enabled="true",
+    metrics_port=str(free_port()),
+    worker_restart_delay_seconds="0.2",
+    log_level="WARNING",
+    log_file=""
+)
+
+import aiohttp  # noqa: E402
+from prometheus_client.parser import text_string_to_metric_families  # noqa: E402
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegramServer  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.supervisor import Supervisor  # noqa: E402
+
+
+async def wait_ready(supervisor: Supervisor, telegram: FakeTelegramServer, polls_before: int) -> float:
+    """Ожидание, пока все воркеры отвечают и супервизор опрашивает Bot API"""
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        for index in range(supervisor.workers):
+            url = f"http://127.0.0.1:{supervisor.update_port(index)}/healthz"
+            while True:
+                try:
+                    async with session.get(url) as response:
+                        if response.status == 200:
+                            break
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.1)
+    while telegram.calls.get("getUpdates", 0) <= polls_before:
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - started
+
+
+def aggregated_messages(text: bytes) -> float:
+    """Обработанные пачки сообщений по сумме метрик воркеров"""
+    for family in text_string_to_metric_families(text.decode()):
+        if family.name == "bot_messages":
+            return sum(sample.value for sample in family.samples if sample.name == "bot_messages_total")
+    return 0.0
+
+
+async def run_case(workers: int, telegram: FakeTelegramServer, first_user: int,
+                   users: int, messages: int, kill: bool, round_timeout: float) -> dict:
+    settings.worker_base_port = free_port()
+    supervisor = Supervisor(workers)
+    polls_before = telegram.calls.get("getUpdates", 0)
+    task = asyncio.create_task(supervisor.start())
+    startup = await wait_ready(supervisor, telegram, polls_before)
+    
+    sent_before = len(telegram.sent)
+    total = users * messages
+    started = time.perf_counter()
+    for round_number in range(messages):
+        target = len(telegram.sent) + users
+        for user in range(users):
+            telegram.enqueue_update(first_user + user, f"Сообщение {round_number}")
+        if kill and round_number == messages // 2:
+            await asyncio.sleep(0.05)
+            supervisor.kill_worker(0)
+        try:
+            await telegram.wait_for_sent(target, timeout=round_timeout)
+        except TimeoutError:
+            pass
+    elapsed = time.perf_counter() - started
+    received = len(telegram.sent) - sent_before
+    
+    metrics = await supervisor.collect_metrics()
+    stats = supervisor.stats()
+    await supervisor.stop()
+    await task
+    
+    return {
+        "replies/sec": received / elapsed,
+        "elapsed s": elapsed,
+        "startup s": startup,
+        "lost": total - received,
+        "restarts": sum(stats["restarts"]),
+        "agg messages": aggregated_messages(metrics),
+    }
+
+
+async def run(worker_counts, users: int, messages: int, kill: bool, round_timeout: float) -> None:
+    openai = FakeOpenAIServer(first_token_delay=0.0, token_delay=0.0, reply_tokens=20, port=OPENAI_PORT)
+    telegram = FakeTelegramServer(port=TELEGRAM_PORT)
+    await openai.start()
+    await telegram.start()
+    
+    rows = {}
+    for number, workers in enumerate(worker_counts):
+        last = number == len(worker_counts) - 1
+        name = f"{workers} воркеров" + (", сбой" if kill and last else "")
+        rows[name] = await run_case(
+            workers, telegram, 1000 + number * users, users, messages, kill and last, round_timeout
+        )
+    
+    await telegram.stop()
+    await openai.stop()
+    report(
+        f"{users} пользователей x {messages} сообщений, ядер: {os.cpu_count()}",
+        rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--kill", action="store_true")
+    parser.add_argument("--round-timeout", type=float, default=10.0)
+    args = parser.parse_args()
+    asyncio.run(run(
+        [int(count) for count in args.workers.split(",")],
+        args.users, args.messages, args.kill, args.round_timeout
+    ))
+
+
+if __name__ == "__main__":
+    main()
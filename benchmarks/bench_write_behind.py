@@ -0,0 +1,133 @@
+"""
+Устойчивая скорость записи сообщений: отдельная транзакция на каждое
+сообщение против пакетной записи из буфера
+
+Несколько одновременных пользователей в течение заданного времени
+выполняют ходы диалога: begin_turn сохраняет сообщение пользователя,
+append_message - ответ, то есть две вставки на ход. Замеряются
+сохраненные сообщения в секунду, задержка хода и ошибки блокировки
+SQLite; после остановки проверяется, что все сообщения попали в БД и
+что get_context сразу видит последний ответ каждого пользователя. Режимы синхронизации SQLite задаются
+списком (NORMAL - по умолчанию в WAL, FULL - fsync на каждую фиксацию).
+
+Запуск: python -m benchmarks.bench_write_behind [--writers 50] [--duration 5]
+        [--synchronous NORMAL,FULL] [--interval-ms 50] [--max-rows 200]
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._env import setup_env, percentile, report
+
+setup_env()
+
+from sqlalchemy import func, select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.database.connection import db_manager  # noqa: E402
+from src.database.models import Message  # noqa: E402
+from src.services.context_service import context_service  # noqa: E402
+from src.services.write_buffer import MessageWriteBuffer  # noqa: E402
+
+
+async def writer(telegram_id: int, deadline: float, latencies: list, errors: list) -> int:
+    """Ходы диалога одного пользователя; возвращает число ответов"""
+    written = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            user_id, _ = await context_service.begin_turn(telegram_id, ["Привет!"], username="bench")
+            await context_service.append_message(user_id, telegram_id, "assistant", f"Ответ {written}")
+        except OperationalError:
+            errors.append(telegram_id)
+            continue
+        latencies.append(time.perf_counter() - started)
+        written += 1
+    return written
+
+
+async def run_case(write_behind: bool, writers: int, duration: float, first_user: int,
+                   interval_ms: int, max_rows: int) -> dict:
+    # С кэшем пользователей ход с буфером вообще не обращается к БД и
+    # писатели не уступают друг другу; сравнение касается только вставок
+    context_service.users = None
+    context_service.write_buffer = (
+        MessageWriteBuffer(flush_interval=interval_ms / 1000, max_rows=max_rows)
+        if write_behind else None
+    )
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    counts = await asyncio.gather(*(
+        writer(first_user + i, deadline, latencies, errors) for i in range(writers)
+    ))
+    elapsed = time.perf_counter() - started
+    
+    # Последний ответ каждого пользователя должен быть виден сразу,
+    # в том числе при чтении мимо кэша контекстов
+    visible = 0
+    for i, count in enumerate(counts):
+        context_service.cache.invalidate(first_user + i)
+        context = await context_service.get_context(first_user + i)
+        visible += int(bool(context) and context[-1]["content"] == f"Ответ {count - 1}")
+    
+    await context_service.close()
+    
+    async with db_manager.get_session() as session:
+        stored = await session.scalar(
+            select(func.count(Message.id))
+            .where(Message.telegram_id.between(first_user, first_user + writers - 1))
+        )
+    
+    # Сообщение пользователя и ответ на каждый ход
+    total = sum(counts) * 2
+    row = {
+        "msg/sec": total / elapsed,
+        "turn p50 ms": percentile(latencies, 50) * 1000,
+        "turn p99 ms": percentile(latencies, 99) * 1000,
+        "lock errors": len(errors),
+        "lost": total - stored,
+        "visible %": visible / writers * 100,
+    }
+    if write_behind:
+        row["avg batch"] = context_service.write_buffer.stats()["avg_batch"]
+    context_service.write_buffer = None
+    return row
+
+
+async def run(writers: int, duration: float, modes, interval_ms: int, max_rows: int) -> None:
+    rows = {}
+    first_user = 1
+    for synchronous in modes:
+        settings.sqlite_synchronous = synchronous
+        await db_manager.init_db()
+        for write_behind in (False, True):
+            label = "пакетами" if write_behind else "по одному"
+            rows[f"{synchronous}, {label}"] = await run_case(
+                write_behind, writers, duration, first_user, interval_ms, max_rows
+            )
+            first_user += writers
+        await db_manager.close()
+    
+    report(
+        f"{writers} писателей, {duration} с, интервал {interval_ms} мс, пакет до {max_rows}",
+        rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--synchronous", default="NORMAL,FULL")
+    parser.add_argument("--interval-ms", type=int, default=50)
+    parser.add_argument("--max-rows", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(
+        args.writers, args.duration, args.synchronous.split(","), args.interval_ms, args.max_rows
+    ))
+
+
+if __name__ == "__main__":
+    main()
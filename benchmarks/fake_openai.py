@@ -0,0 +1,176 @@
+"""
+Локальная заглушка OpenAI-совместимого API
+
+Отвечает на /v1/chat/completions (обычный и потоковый режим) и /v1/models
+с настраиваемыми задержками, долей ошибок и лимитом запросов в минуту.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import deque
+
+from benchmarks._http import HttpServer, Request, Responder
+
+
+class FakeOpenAIServer:
+    """Заглушка OpenAI с управляемой задержкой генерации"""
+    
+    def __init__(
+        self,
+        first_token_delay: float = 0.3,
+        token_delay: float = 0.02,
+        reply_tokens: int = 50,
+        error_rate: float = 0.0,
+        requests_per_minute: int = 0,
+        rate_window: float = 60.0,
+        port: int = 0,
+        models_delay: float = 0.0,
+        prompt_token_delay: float = 0.0
+    ):
+        """
+        Args:
+            first_token_delay: Задержка до первого токена в секундах
+            token_delay: Задержка между токенами в секундах
+            reply_tokens: Количество токенов в ответе
+            error_rate: Доля запросов, завершающихся ошибкой 500
+            requests_per_minute: Лимит запросов, сверх которого отвечает 429 (0 - нет)
+            rate_window: Окно лимита в секундах (для коротких прогонов меньше минуты)
+            port: Порт (0 - выбрать свободный)
+            models_delay: Задержка ответа /v1/models (прогрев соединений)
+            prompt_token_delay: Дополнительная задержка первого токена на
+                токен промпта (длинный промпт дольше обрабатывается)
+        """
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.requests_per_minute = requests_per_minute
+        self.rate_window = rate_window
+        self.models_delay = models_delay
+        self.prompt_token_delay = prompt_token_delay
+        self.requests = 0
+        self.rate_limited = 0
+        self.prompt_tokens = []  # (токены промпта, max_tokens запроса)
+        self._window = deque()
+        self.server = HttpServer(self._handle, port=port)
+    
+    @property
+    def base_url(self) -> str:
+        return f"{self.server.url}/v1"
+    
+    async def start(self) -> None:
+        await self.server.start()
+    
+    async def stop(self) -> None:
+        await self.server.stop()
+    
+    def _tokens(self):
+        return [f"слово{i} " for i in range(self.reply_tokens)]
+    
+    async def _handle(self, request: Request, responder: Responder) -> None:
+        if request.path.endswith("/models"):
+            if self.models_delay:
+                await asyncio.sleep(self.models_delay)
+            await responder.send_json(200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+            return
+        
+        if not request.path.endswith("/chat/completions"):
+            return
+        
+        self.requests += 1
+        payload = request.json()
+        self.prompt_tokens.append((self._prompt_tokens(payload), payload.get("max_tokens")))
+        
+        if self.requests_per_minute:
+            limit_headers = self._check_rate_limit()
+            if limit_headers is None:
+                return await self._reject(responder)
+        else:
+            limit_headers = {}
+        
+        if self.error_rate and random.random() < self.error_rate:
+            await asyncio.sleep(self.first_token_delay)
+            await responder.send_json(500, {"error": {"message": "injected failure", "type": "server_error"}})
+            return
+        
+        if payload.get("stream"):
+            await self._stream(payload, responder, limit_headers)
+        else:
+            await asyncio.sleep(self._first_token_delay(payload) + self.token_delay * self.reply_tokens)
+            await responder.send_json(200, self._completion(payload, "".join(self._tokens())), limit_headers)
+    
+    def _check_rate_limit(self):
+        """Скользящее окно лимита; None, если лимит исчерпан"""
+        now = time.monotonic()
+        while self._window and now - self._window[0] >= self.rate_window:
+            self._window.popleft()
+        
+        if len(self._window) >= self.requests_per_minute:
+            return None
+        
+        self._window.append(now)
+        reset = self.rate_window - (now - self._window[0])
+        return {
+            "x-ratelimit-limit-requests": str(self.requests_per_minute),
+            "x-ratelimit-remaining-requests": str(self.requests_per_minute - len(self._window)),
+            "x-ratelimit-reset-requests": f"{reset:.3f}s",
+        }
+    
+    async def _reject(self, responder: Responder) -> None:
+        self.rate_limited += 1
+        retry_after = self.rate_window - (time.monotonic() - self._window[0])
+        await responder.send_json(
+            429,
+            {"error": {"message": "Rate limit reached", "type": "requests"}},
+            {
+                "retry-after-ms": str(int(retry_after * 1000)),
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-reset-requests": f"{retry_after:.3f}s",
+            },
+        )
+    
+    def _first_token_delay(self, payload) -> float:
+        return self.first_token_delay + self.prompt_token_delay * self._prompt_tokens(payload)
+    
+    @staticmethod
+    def _prompt_tokens(payload) -> int:
+        return sum(len(m.get("content", "")) // 4 for m in payload.get("messages", []))
+    
+    def _completion(self, payload, text: str):
+        prompt_tokens = self._prompt_tokens(payload)
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": self.reply_tokens,
+                "total_tokens": prompt_tokens + self.reply_tokens,
+            },
+        }
+    
+    async def _stream(self, payload, responder: Responder, headers=None) -> None:
+        await responder.start_chunked(200, {"Content-Type": "text/event-stream", **(headers or {})})
+        await asyncio.sleep(self._first_token_delay(payload))
+        
+        for index, token in enumerate(self._tokens()):
+            if index:
+                await asyncio.sleep(self.token_delay)
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": payload.get("model", "fake"),
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            await responder.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        
+        await responder.write_chunk(b"data: [DONE]\n\n")
+        await responder.end_chunked()
@@ -0,0 +1,93 @@
+"""
+Локальный SOCKS5-прокси с искусственной задержкой установки соединения
+
+Задержка добавляется один раз на соединение и моделирует сетевые
+обходы при рукопожатиях SOCKS и TLS до удаленного сервера. Данные
+внутри установленного соединения пересылаются без задержки.
+"""
+import asyncio
+import struct
+
+
+class FakeSocksProxy:
+    """SOCKS5 без аутентификации, только команда CONNECT"""
+    
+    def __init__(self, handshake_delay: float = 0.1, port: int = 0):
+        """
+        Args:
+            handshake_delay: Задержка установки каждого соединения в секундах
+            port: Порт (0 - выбрать свободный)
+        """
+        self.handshake_delay = handshake_delay
+        self.port = port
+        self.connections = 0
+        self._server = None
+        self._handlers = set()
+    
+    @property
+    def url(self) -> str:
+        return f"socks5://127.0.0.1:{self.port}"
+    
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+    
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        # Обработчики соединений должны завершиться до остановки цикла событий
+        for task in list(self._handlers):
+            task.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+    
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            # Приветствие: версия и список методов аутентификации
+            _, methods = await reader.readexactly(2)
+            await reader.readexactly(methods)
+            writer.write(b"\x05\x00")
+            
+            # Запрос CONNECT
+            _, command, _, address_type = await reader.readexactly(4)
+            if address_type == 1:
+                host = ".".join(str(part) for part in await reader.readexactly(4))
+            elif address_type == 3:
+                length = (await reader.readexactly(1))[0]
+                host = (await reader.readexactly(length)).decode()
+            else:
+                writer.close()
+                return
+            port = struct.unpack("!H", await reader.readexactly(2))[0]
+            
+            await asyncio.sleep(self.handshake_delay)
+            upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+            writer.write(b"\x05\x00\x00\x01" + bytes(4) + struct.pack("!H", 0))
+            await writer.drain()
+            
+            await asyncio.gather(
+                self._pipe(reader, upstream_writer),
+                self._pipe(upstream_reader, writer)
+            )
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+            self._handlers.discard(task)
+    
+    @staticmethod
+    async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,307 @@
+"""
+Локальная заглушка Telegram Bot API
+
+Поддерживает методы, которые использует бот: getMe, getUpdates (long
+polling), setWebhook/deleteWebhook, sendMessage, editMessageText и
+sendChatAction. Входящие обновления подкладываются через enqueue_update,
+отправленные ботом сообщения записываются для проверки. Для проверки
+устойчивости доля вызовов sendMessage и editMessageText может
+завершаться ошибкой 500.
+
+Как настоящий Bot API, заглушка отклоняет текст длиннее 4096 символов
+(UTF-16) и может ограничивать частоту отправок: общий лимит бота и
+лимит на чат моделируются ведрами токенов, сверх них - ответ 429 с
+parameters.retry_after.
+"""
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from benchmarks._http import HttpServer, Request, Responder
+
+BOT_ID = 123456
+MESSAGE_LIMIT = 4096
+
+# Допуск ведер на сетевой разброс времени прихода запросов
+FLOOD_TOLERANCE = 0.1
+
+
+def make_text_update(update_id: int, user_id: int, text: str) -> Dict:
+    """Обновление с текстовым сообщением от пользователя в личном чате"""
+    user = {"id": user_id, "is_bot": False, "first_name": "User", "username": f"user{user_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "User"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+class _FloodBucket:
+    """Ведро токенов лимита отправок"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+    
+    def wait(self) -> float:
+        """Секунды до следующего токена (0 - отправка разрешена)"""
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.level < 1 - FLOOD_TOLERANCE:
+            return (1 - self.level) / self.rate
+        return 0.0
+
+
+class FakeTelegramServer:
+    """Заглушка Bot API с записью исходящих сообщений"""
+    
+    def __init__(
+        self,
+        latency: float = 0.0,
+        port: int = 0,
+        error_rate: float = 0.0,
+        global_rate: float = 0.0,
+        chat_rate: float = 0.0,
+        chat_burst: int = 3
+    ):
+        """
+        Args:
+            latency: Задержка ответа на каждый вызов метода в секундах
+            port: Порт (0 - выбрать свободный)
+            error_rate: Доля отправок сообщений, завершающихся ошибкой 500
+            global_rate: Лимит отправок бота в секунду (0 - без ограничения)
+            chat_rate: Лимит отправок в один чат в секунду (0 - без ограничения)
+            chat_burst: Отправок в чат подряд сверх лимита
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.injected_errors = 0
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global_bucket = _FloodBucket(global_rate, max(global_rate, 1)) if global_rate else None
+        self._chat_buckets: Dict[int, _FloodBucket] = {}
+        self.flood_rejected = 0
+        self.too_long_rejected = 0
+        self.server = HttpServer(self._handle, port=port)
+        
+        self.updates: List[Dict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._new_updates = asyncio.Event()
+        
+        self.sent: List[Dict] = []
+        self.calls: Dict[str, int] = {}
+        self._sent_changed = asyncio.Event()
+        self._sent_by_chat: Dict[int, List[float]] = {}
+        self._chat_events: Dict[int, asyncio.Event] = {}
+    
+    @property
+    def base_url(self) -> str:
+        """Значение для TELEGRAM_API_BASE"""
+        return f"{self.server.url}/bot"
+    
+    async def start(self) -> None:
+        await self.server.start()
+    
+    async def stop(self) -> None:
+        # Отпускаем незавершенные long polling запросы
+        self._new_updates.set()
+        await asyncio.sleep(0)
+        await self.server.stop()
+    
+    def enqueue_update(self, user_id: int, text: str) -> Dict:
+        """Добавление входящего сообщения для getUpdates"""
+        update = make_text_update(next(self._update_ids), user_id, text)
+        self.updates.append(update)
+        self._new_updates.set()
+        return update
+    
+    async def wait_for_sent(self, count: int, timeout: float = 60.0) -> None:
+        """Ожидание, пока бот отправит count сообщений"""
+        deadline = time.monotonic() + timeout
+        while len(self.sent) < count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Отправлено {len(self.sent)} из {count} сообщений")
+            self._sent_changed.clear()
+            try:
+                await asyncio.wait_for(self._sent_changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+    
+    def replies(self, chat_id: int) -> int:
+        """Количество сообщений, отправленных ботом в чат"""
+        return len(self._sent_by_chat.get(chat_id, ()))
+    
+    async def wait_for_reply(self, chat_id: int, seen: int, timeout: float) -> Optional[float]:
+        """
+        Ожидание сообщения бота в чат сверх уже полученных seen
+        
+        Returns:
+            Время отправки (time.perf_counter) или None по таймауту
+        """
+        deadline = time.monotonic() + timeout
+        while self.replies(chat_id) <= seen:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            event = self._chat_events.setdefault(chat_id, asyncio.Event())
+            event.clear()
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        return self._sent_by_chat[chat_id][seen]
+    
+    def _check_limits(self, params):
+        """Ответ 429 или 400 (слишком длинный текст), если отправка не проходит"""
+        text = params.get("text", "")
+        if len(text.encode("utf-16-le")) // 2 > MESSAGE_LIMIT:
+            self.too_long_rejected += 1
+            return 400, {"ok": False, "error_code": 400, "description": "Bad Request: message is too long"}, {}
+        
+        buckets = [self._global_bucket] if self._global_bucket else []
+        if self.chat_rate:
+            chat_id = int(params["chat_id"])
+            if chat_id not in self._chat_buckets:
+                self._chat_buckets[chat_id] = _FloodBucket(self.chat_rate, self.chat_burst)
+            buckets.append(self._chat_buckets[chat_id])
+        
+        wait = max((bucket.wait() for bucket in buckets), default=0.0)
+        if wait <= 0:
+            for bucket in buckets:
+                bucket.level -= 1
+            return None
+        self.flood_rejected += 1
+        retry_after = max(1, math.ceil(wait))
+        return 429, {
+            "ok": False,
+            "error_code": 429,
+            "description": f"Too Many Requests: retry after {retry_after}",
+            "parameters": {"retry_after": retry_after},
+        }, {}
+    
+    def _inject_error(self):
+        """Ответ с ошибкой сервера для доли вызовов error_rate"""
+        if self.error_rate and random.random() < self.error_rate:
+            self.injected_errors += 1
+            return 500, {"ok": False, "error_code": 500, "description": "Internal Server Error: injected"}, {}
+        return None
+    
+    @staticmethod
+    def _params(request: Request) -> Dict:
+        content_type = request.headers.get("content-type", "")
+        if "json" in content_type:
+            return request.json()
+        
+        params = {}
+        for key, value in parse_qsl(request.body.decode()):
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+    
+    async def _handle(self, request: Request, responder: Responder) -> None:
+        method = request.path.rsplit("/", 1)[-1]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = self._params(request)
+        
+        handler = getattr(self, f"_method_{method}", None)
+        if handler is None:
+            await responder.send_json(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+            return
+        
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        
+        result = await handler(params)
+        if isinstance(result, tuple):
+            status, payload, headers = result
+            await responder.send_json(status, payload, headers)
+        else:
+            await responder.send_json(200, {"ok": True, "result": result})
+    
+    async def _method_getMe(self, params):
+        return {
+            "id": BOT_ID,
+            "is_bot": True,
+            "first_name": "Bench",
+            "username": "bench_bot",
+            "can_join_groups": False,
+            "can_read_all_group_messages": False,
+            "supports_inline_queries": False,
+        }
+    
+    async def _method_getUpdates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        limit = int(params.get("limit") or 100)
+        
+        # Подтвержденные обновления больше не нужны
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        
+        if not self.updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        
+        return self.updates[:limit]
+    
+    async def _method_setWebhook(self, params):
+        return True
+    
+    async def _method_deleteWebhook(self, params):
+        if params.get("drop_pending_updates"):
+            self.updates.clear()
+        return True
+    
+    async def _method_sendChatAction(self, params):
+        return True
+    
+    def _message(self, params, message_id: Optional[int] = None) -> Dict:
+        chat_id = int(params["chat_id"])
+        return {
+            "message_id": message_id or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": BOT_ID, "is_bot": True, "first_name": "Bench"},
+            "text": params.get("text", ""),
+        }
+    
+    async def _method_sendMessage(self, params):
+        error = self._check_limits(params) or self._inject_error()
+        if error:
+            return error
+        
+        message = self._message(params)
+        chat_id = message["chat"]["id"]
+        sent_at = time.perf_counter()
+        self.sent.append({"chat_id": chat_id, "text": message["text"], "time": sent_at})
+        self._sent_by_chat.setdefault(chat_id, []).append(sent_at)
+        self._sent_changed.set()
+        if chat_id in self._chat_events:
+            self._chat_events[chat_id].set()
+        return message
+    
+    async def _method_editMessageText(self, params):
+        error = self._check_limits(params) or self._inject_error()
+        if error:
+            return error
+        return self._message(params, int(params["message_id"]))
@@ -0,0 +1,63 @@
+"""
+Упрощенные объекты Telegram для вызова обработчиков напрямую
+
+Фиксируют моменты отправки и редактирования ответов без сетевых вызовов.
+"""
+import itertools
+import time
+
+_message_ids = itertools.count(1)
+
+
+class FakeSentMessage:
+    """Отправленное ботом сообщение"""
+    
+    def __init__(self, recorder, text):
+        self.recorder = recorder
+        self.text = text
+    
+    async def edit_text(self, text, **kwargs):
+        self.recorder.edits += 1
+        self.text = text
+        return self
+
+
+class FakeMessage:
+    """Входящее сообщение пользователя"""
+    
+    def __init__(self, text, chat_id):
+        self.message_id = next(_message_ids)
+        self.text = text
+        self.chat_id = chat_id
+        self.first_visible = None
+        self.replies = []
+        self.edits = 0
+    
+    async def reply_text(self, text, **kwargs):
+        if self.first_visible is None:
+            self.first_visible = time.perf_counter()
+        self.replies.append(text)
+        return FakeSentMessage(self, text)
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.username = f"user{user_id}"
+        self.first_name = "Bench"
+        self.last_name = None
+
+
+class FakeUpdate:
+    def __init__(self, user_id, text):
+        self.effective_user = FakeUser(user_id)
+        self.message = FakeMessage(text, user_id)
+
+
+class FakeBot:
+    async def send_chat_action(self, **kwargs):
+        pass
+
+
+class FakeContext:
+    bot = FakeBot()
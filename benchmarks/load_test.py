@@ -0,0 +1,342 @@
+"""
+Нагрузочный тест бота целиком
+
+Настоящий TelegramBot с обработчиками работает в режиме polling против
+локальных заглушек Bot API и OpenAI, сеть не нужна. N имитируемых
+пользователей ведут диалог: пауза на размышление (экспоненциальное
+распределение), сообщение разной длины или серия из 2-3 сообщений
+подряд, ожидание ответа; изредка /clear. Пользователи подключаются
+равномерно в течение --ramp секунд.
+
+Отчет: пропускная способность (ответов и входящих сообщений в секунду),
+задержка от первого сообщения хода до ответа бота (p50/p95/p99; в
+потоковом режиме - до первого фрагмента), ходы без ответа и ответы с
+ошибкой, время в сессиях БД, средняя длительность этапов обработки из
+метрик и память процесса (RSS в начале, пик и в конце).
+
+Пороговые значения (--max-p95-ms, --max-p99-ms, --min-throughput,
+--max-error-rate) превращают тест в проверку регрессий: при нарушении
+процесс завершается с кодом 1. --json сохраняет результаты в файл.
+
+Запуск: python -m benchmarks.load_test [--users 50] [--duration 30]
+        [--think-time 2] [--burst-prob 0.15] [--clear-prob 0.01]
+        [--openai-latency 0.5] [--token-delay 0.01] [--reply-tokens 40]
+        [--stream] [--openai-error-rate 0] [--telegram-latency 0.02]
+        [--telegram-error-rate 0] [--concurrency 16] [--debounce 0.5]
+        [--max-p95-ms 0] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import time
+from typing import Dict, List, Optional
+
+from benchmarks._env import setup_env, free_port, percentile, report
+
+OPENAI_PORT = free_port()
+TELEGRAM_PORT = free_port()
+
+WORDS = (
+    "как сделать чтобы бот отвечал быстрее почему не работает код напиши пример "
+    "объясни разницу между списком и кортежем что такое асинхронность помоги "
+    "составить письмо переведи на английский сколько стоит какой лучше выбрать"
+).split()
+
+ERROR_PREFIX = ("😔", "⏳")
+
+
+def make_text(rng: random.Random) -> str:
+    """Текст сообщения: в основном короткие, иногда длинные"""
+    roll = rng.random()
+    if roll < 0.7:
+        length = rng.randint(3, 15)
+    elif roll < 0.95:
+        length = rng.randint(30, 80)
+    else:
+        length = rng.randint(200, 400)
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def rss_bytes() -> int:
+    """Текущий размер резидентной памяти процесса"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Вне Linux доступен только пик
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LoadStats:
+    """Результаты имитируемых пользователей"""
+    
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.turns = 0
+        self.messages = 0
+        self.timeouts = 0
+        self.error_replies = 0
+        self.clears = 0
+
+
+class SimulatedUser:
+    """Пользователь, ведущий диалог с ботом"""
+    
+    def __init__(self, user_id: int, telegram, stats: LoadStats, args, seed: int):
+        self.user_id = user_id
+        self.telegram = telegram
+        self.stats = stats
+        self.args = args
+        self.rng = random.Random(seed)
+    
+    async def run(self, start_delay: float, deadline: float) -> None:
+        await asyncio.sleep(start_delay)
+        while time.perf_counter() < deadline:
+            think = self.rng.expovariate(1 / self.args.think_time) if self.args.think_time else 0
+            await asyncio.sleep(min(think, max(0.0, deadline - time.perf_counter())))
+            if time.perf_counter() >= deadline:
+                break
+            
+            if self.rng.random() < self.args.clear_prob:
+                await self._command("/clear")
+            else:
+                await self._turn()
+    
+    async def _command(self, text: str) -> None:
+        seen = self.telegram.replies(self.user_id)
+        self.telegram.enqueue_update(self.user_id, text)
+        if await self.telegram.wait_for_reply(self.user_id, seen, self.args.reply_timeout) is None:
+            self.stats.timeouts += 1
+        self.stats.clears += 1
+    
+    async def _turn(self) -> None:
+        """Одно сообщение или серия, отправленная быстрее окна объединения"""
+        count = self.rng.choice((2, 3)) if self.rng.random() < self.args.burst_prob else 1
+        seen = self.telegram.replies(self.user_id)
+        
+        started = time.perf_counter()
+        for index in range(count):
+            if index:
+                await asyncio.sleep(self.rng.uniform(0.2, 0.6) * self.args.debounce)
+            self.telegram.enqueue_update(self.user_id, make_text(self.rng))
+        self.stats.messages += count
+        
+        replied_at = await self.telegram.wait_for_reply(self.user_id, seen, self.args.reply_timeout)
+        self.stats.turns += 1
+        if replied_at is None:
+            self.stats.timeouts += 1
+            return
+        
+        self.stats.latencies.append(replied_at - started)
+        reply = self._last_reply_text()
+        if reply.startswith(ERROR_PREFIX):
+            self.stats.error_replies += 1
+        
+        # Пачка могла разделиться на два ответа: ждем, пока бот закончит с пользователем
+        while message_queue.is_busy(self.user_id):
+            await asyncio.sleep(0.01)
+    
+    def _last_reply_text(self) -> str:
+        for sent in reversed(self.telegram.sent):
+            if sent["chat_id"] == self.user_id:
+                return sent["text"]
+        return ""
+
+
+async def sample_memory(samples: List[int], stop: asyncio.Event) -> None:
+    """Периодический замер RSS для поиска пика"""
+    while not stop.is_set():
+        samples.append(rss_bytes())
+        try:
+            await asyncio.wait_for(stop.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+def metric_rows() -> Dict[str, Dict[str, float]]:
+    """Средняя длительность этапов обработки и сессий БД из метрик"""
+    rows = {}
+    for family in REGISTRY.collect():
+        if family.name not in ("bot_stage_seconds", "bot_db_session_seconds"):
+            continue
+        sums, counts = {}, {}
+        for sample in family.samples:
+            name = sample.labels.get("stage", "db_session")
+            if sample.name.endswith("_sum"):
+                sums[name] = sample.value
+            elif sample.name.endswith("_count"):
+                counts[name] = sample.value
+        for name, count in counts.items():
+            if count:
+                rows[name] = {"count": count, "avg ms": sums[name] / count * 1000, "total s": sums[name]}
+    return rows
+
+
+async def run(args) -> Dict[str, float]:
+    openai = FakeOpenAIServer(
+        first_token_delay=args.openai_latency,
+        token_delay=args.token_delay,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.openai_error_rate,
+        port=OPENAI_PORT
+    )
+    telegram = FakeTelegramServer(
+        latency=args.telegram_latency,
+        port=TELEGRAM_PORT,
+        error_rate=args.telegram_error_rate
+    )
+    await openai.start()
+    await telegram.start()
+    
+    memory: List[int] = [rss_bytes()]
+    stop_sampling = asyncio.Event()
+    sampler = asyncio.create_task(sample_memory(memory, stop_sampling))
+    
+    bot = TelegramBot()
+    bot_task = asyncio.create_task(bot.start())
+    while not telegram.calls.get("getUpdates"):
+        if bot_task.done():
+            bot_task.result()
+        await asyncio.sleep(0.05)
+    
+    stats = LoadStats()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    users = [
+        SimulatedUser(1000 + i, telegram, stats, args, seed=args.seed + i)
+        for i in range(args.users)
+    ]
+    await asyncio.gather(*(
+        user.run(args.ramp * i / max(1, args.users), deadline)
+        for i, user in enumerate(users)
+    ))
+    elapsed = time.perf_counter() - started
+    
+    stop_sampling.set()
+    await sampler
+    end_rss = rss_bytes()
+    
+    await bot.stop()
+    bot_task.cancel()
+    await telegram.stop()
+    await openai.stop()
+    
+    stages = metric_rows()
+    db = stages.pop("db_session", {"count": 0, "avg ms": 0.0, "total s": 0.0})
+    replies = len(stats.latencies)
+    results = {
+        "replies/sec": replies / elapsed,
+        "messages/sec": stats.messages / elapsed,
+        "turns": stats.turns,
+        "p50 ms": percentile(stats.latencies, 50) * 1000,
+        "p95 ms": percentile(stats.latencies, 95) * 1000,
+        "p99 ms": percentile(stats.latencies, 99) * 1000,
+        "timeouts": stats.timeouts,
+        "error replies": stats.error_replies,
+        "error rate": (stats.timeouts + stats.error_replies) / stats.turns if stats.turns else 0.0,
+        "db sessions": db["count"],
+        "db total s": db["total s"],
+        "db ms/reply": db["total s"] / replies * 1000 if replies else 0.0,
+        "rss start MiB": memory[0] / 2 ** 20,
+        "rss peak MiB": max(memory + [end_rss]) / 2 ** 20,
+        "rss end MiB": end_rss / 2 ** 20,
+    }
+    
+    mode = "поток" if args.stream else "без потока"
+    print(
+        f"\n{args.users} польз., {elapsed:.0f} с, OpenAI {args.openai_latency} с ({mode}), "
+        f"Bot API {args.telegram_latency} с"
+    )
+    groups = {
+        "Пропускная способность": ("replies/sec", "messages/sec", "turns"),
+        "Задержка ответа": ("p50 ms", "p95 ms", "p99 ms"),
+        "Ошибки": ("timeouts", "error replies", "error rate"),
+        "БД": ("db sessions", "db total s", "db ms/reply"),
+        "Память": ("rss start MiB", "rss peak MiB", "rss end MiB"),
+    }
+    for title, keys in groups.items():
+        report(title, {"": {key: results[key] for key in keys}})
+    report("Этапы обработки", stages)
+    return results
+
+
+def check_gates(results: Dict[str, float], args) -> List[str]:
+    """Нарушенные пороговые значения"""
+    failures = []
+    if args.max_p95_ms and results["p95 ms"] > args.max_p95_ms:
+        failures.append(f"p95 {results['p95 ms']:.0f} мс > {args.max_p95_ms:.0f} мс")
+    if args.max_p99_ms and results["p99 ms"] > args.max_p99_ms:
+        failures.append(f"p99 {results['p99 ms']:.0f} мс > {args.max_p99_ms:.0f} мс")
+    if args.min_throughput and results["replies/sec"] < args.min_throughput:
+        failures.append(f"{results['replies/sec']:.1f} ответов/с < {args.min_throughput}")
+    if args.max_error_rate is not None and results["error rate"] > args.max_error_rate:
+        failures.append(f"доля ошибок {results['error rate']:.3f} > {args.max_error_rate}")
+    return failures
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--ramp", type=float, default=1.0)
+    parser.add_argument("--think-time", type=float, default=2.0)
+    parser.add_argument("--burst-prob", type=float, default=0.15)
+    parser.add_argument("--clear-prob", type=float, default=0.01)
+    parser.add_argument("--reply-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--openai-latency", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--debounce", type=float, default=0.5)
+    parser.add_argument("--max-p95-ms", type=float, default=0.0)
+    parser.add_argument("--max-p99-ms", type=float, default=0.0)
+    parser.add_argument("--min-throughput", type=float, default=0.0)
+    parser.add_argument("--max-error-rate", type=float, default=None)
+    parser.add_argument("--json", default="")
+    return parser.parse_args(argv)
+
+
+ARGS = parse_args()
+
+setup_env(
+    openai_api_base=f"http://127.0.0.1:{OPENAI_PORT}/v1",
+    telegram_api_base=f"http://127.0.0.1:{TELEGRAM_PORT}/bot",
+    openai_stream=str(ARGS.stream).lower(),
+    update_concurrency=str(ARGS.concurrency),
+    message_debounce_seconds=str(ARGS.debounce),
+    openai_max_concurrency="256",
+    openai_max_retries="0"
+)
+
+from prometheus_client import REGISTRY  # noqa: E402
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegramServer  # noqa: E402
+from src.bot import TelegramBot  # noqa: E402
+from src.handlers.message_handler import message_queue  # noqa: E402
+
+
+def main():
+    results = asyncio.run(run(ARGS))
+    
+    if ARGS.json:
+        with open(ARGS.json, "w") as output:
+            json.dump({"args": vars(ARGS), "results": results}, output, indent=2, ensure_ascii=False)
+    
+    failures = check_gates(results, ARGS)
+    for failure in failures:
+        print(f"ПОРОГ НАРУШЕН: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,38 +2,59 @@
 Точка входа для запуска телеграм-бота
 """
 import asyncio
-import sys
+import signal
+
+# Отсчет времени запуска начинается до остальных импортов
+from src.startup import startup_report
+
 from loguru import logger
 
+with startup_report.phase("settings"):
+    from src.config import settings
+
+from src.logging_setup import setup_logging
+
 # Настройка логирования
-logger.remove()
-logger.add(
-    sys.stdout,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    level="INFO"
-)
-logger.add(
-    "logs/bot.log",
-    rotation="10 MB",
-    retention="7 days",
-    level="DEBUG"
-)
+setup_logging()
+
+# Зависимости, нужные до приема первого обновления; импортируются по
+# отдельности, чтобы их время попало в отчет о запуске. Пакет openai
+# загружается в фоне при инициализации бота.
+CORE_IMPORTS = ("sqlalchemy.ext.asyncio", "telegram.ext", "prometheus_client")
 
 
 async def main():
     """Главная функция запуска бота"""
-    from src.bot import bot
+    if settings.workers > 1:
+        from src.supervisor import run_supervisor
+        
+        logger.info(f"Запуск телеграм-бота в {settings.workers} процессах...")
+        await run_supervisor()
+        await logger.complete()
+        return
+    
+    with startup_report.phase("imports"):
+        for module in CORE_IMPORTS:
+            startup_report.import_module(module)
+        from src.bot import bot
+    
+    # SIGTERM (systemctl restart) и Ctrl+C завершают бота через stop(),
+    # чтобы буферы и очереди успели сохраниться
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, bot.request_stop)
     
     try:
         logger.info("Запуск телеграм-бота...")
         await bot.start()
-    except KeyboardInterrupt:
         logger.info("Получен сигнал остановки")
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
     finally:
         logger.info("Остановка бота...")
         await bot.stop()
+        # Записи из очереди фонового потока успевают попасть в лог
+        await logger.complete()
 
 
 if __name__ == "__main__":
@@ -2,18 +2,32 @@
 Основной модуль телеграм-бота
 """
 import asyncio
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
+import time
+from telegram import Update
+from telegram.ext import Application, CommandHandler, MessageHandler, TypeHandler, filters
 from loguru import logger
 
 from src.config import settings
+from src.metrics import (
+    MESSAGE_QUEUE_PENDING,
+    OPENAI_IN_FLIGHT,
+    OPENAI_QUEUE_DEPTH,
+    STARTUP_SECONDS,
+    MetricsServer
+)
+from src.startup import startup_report
+from src.update_processor import ChatOrderedUpdateProcessor
 from src.database.connection import db_manager
 from src.services.context_service import context_service
 from src.handlers.message_handler import (
     start_command,
     help_command,
     clear_command,
-    handle_message
+    handle_message,
+    message_queue
 )
+from src.services.send_queue import send_queue
+from src.services.summary_service import summarizer
 
 
 class TelegramBot:
@@ -21,29 +35,93 @@ class TelegramBot:
     
     def __init__(self):
         self.application = None
+        self.webhook_server = None
+        self.metrics_server = None
+        self._cleanup_task = None
+        self._keepalive_task = None
+        self._openai_task = None
+        self._openai_construction = None
+        self._stop_event = asyncio.Event()
     
     async def initialize(self):
-        """Инициализация бота и всех сервисов"""
-        # Инициализируем базу данных
-        await db_manager.init_db()
+        """
+        Инициализация бота и всех сервисов
+        
+        Клиент OpenAI нужен только к первому сообщению: пакет openai
+        импортируется и соединения прогреваются в фоне, пока
+        параллельно инициализируются БД и подключение к Telegram.
+        """
+        self._openai_task = asyncio.create_task(self._start_openai())
         
         # Создаем приложение
-        self.application = (
+        builder = (
             Application.builder()
             .token(settings.telegram_bot_token)
-            .build()
+            .base_url(settings.telegram_api_base)
         )
         
+        if settings.update_concurrency > 1:
+            # Долгий ответ одному пользователю не задерживает остальных
+            builder = builder.concurrent_updates(
+                ChatOrderedUpdateProcessor(settings.update_concurrency)
+            )
+        
+        if settings.bot_mode == "webhook":
+            # Обновления принимает собственный сервер
+            builder = builder.updater(None)
+        
+        self.application = builder.build()
+        
+        # Глубина очереди снимается в момент запроса метрик
+        MESSAGE_QUEUE_PENDING.set_function(lambda: message_queue.stats()["pending"])
+        
         # Регистрируем обработчики
         self._register_handlers()
         
+        # Схема БД и getMe не зависят друг от друга
+        await asyncio.gather(
+            startup_report.timed("db_init", db_manager.init_db()),
+            startup_report.timed("telegram_init", self.application.initialize())
+        )
+        
         # Запускаем периодическую очистку контекстов
-        asyncio.create_task(self._periodic_cleanup())
+        self._cleanup_task = asyncio.create_task(self._periodic_cleanup())
+        
+        if settings.openai_keepalive_ping_seconds > 0:
+            self._keepalive_task = asyncio.create_task(self._keep_connections_warm())
         
         logger.info("Бот инициализирован")
     
+    async def _start_openai(self):
+        """Создание клиента OpenAI в фоновом потоке и прогрев соединений"""
+        from src.services.openai_service import get_openai_service
+        
+        # Поток нельзя прервать: stop() дожидается его, чтобы закрыть созданный клиент
+        self._openai_construction = asyncio.ensure_future(asyncio.to_thread(get_openai_service))
+        try:
+            service = await startup_report.timed("openai_client", asyncio.shield(self._openai_construction))
+            OPENAI_QUEUE_DEPTH.set_function(lambda: service.limiter.waiting)
+            OPENAI_IN_FLIGHT.set_function(lambda: service.limiter.in_flight)
+            await startup_report.timed("openai_warm_up", service.warm_up())
+            
+            elapsed = time.perf_counter() - startup_report.started
+            STARTUP_SECONDS.labels("openai_ready").set(elapsed)
+            logger.info(f"Клиент OpenAI готов через {elapsed:.3f} с после запуска")
+        except Exception as e:
+            logger.error(f"Ошибка инициализации клиента OpenAI: {e}")
+    
+    async def _on_update(self, update: Update, context) -> None:
+        """Отметка первого обновления после запуска"""
+        elapsed = startup_report.mark_first_update()
+        if elapsed is not None:
+            STARTUP_SECONDS.labels("first_update").set(elapsed)
+            logger.info(f"Первое обновление получено через {elapsed:.3f} с после запуска")
+    
     def _register_handlers(self):
         """Регистрация обработчиков команд и сообщений"""
+        # Раньше остальных групп, обработку не прерывает
+        self.application.add_handler(TypeHandler(Update, self._on_update), group=-1)
+        
         # Команды
         self.application.add_handler(CommandHandler("start", start_command))
         self.application.add_handler(CommandHandler("help", help_command))
@@ -60,30 +138,107 @@ class TelegramBot:
         """Периодическая очистка устаревших контекстов"""
         while True:
             try:
-                await asyncio.sleep(3600)  # Каждый час
+                await asyncio.sleep(settings.cleanup_interval_seconds)
                 await context_service.cleanup_old_contexts()
+                if settings.summary_enabled:
+                    logger.info(f"Статистика сжатия истории: {summarizer.stats()}")
+                logger.info(f"Статистика отправки сообщений: {send_queue.stats()}")
             except Exception as e:
                 logger.error(f"Ошибка при очистке контекстов: {e}")
     
+    async def _keep_connections_warm(self):
+        """Поддержка соединений с OpenAI открытыми во время простоя"""
+        from src.services.openai_service import get_openai_service
+        
+        openai_service = get_openai_service()
+        interval = settings.openai_keepalive_ping_seconds
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                if openai_service.idle_for() >= interval:
+                    await openai_service.warm_up()
+            except Exception as e:
+                logger.error(f"Ошибка при поддержке соединений с OpenAI: {e}")
+    
     async def start(self):
-        """Запуск бота"""
-        await self.initialize()
+        """Запуск бота и ожидание остановки"""
+        with startup_report.phase("initialize"):
+            await self.initialize()
+        
+        if settings.metrics_enabled:
+            self.metrics_server = MetricsServer()
+            await self.metrics_server.start()
+        
+        await self.application.start()
         
-        # Запускаем polling
-        logger.info("Запуск бота...")
-        await self.application.run_polling(drop_pending_updates=True)
+        if settings.bot_mode == "webhook":
+            from src.webhook import WebhookServer
+            
+            logger.info("Запуск бота в режиме webhook...")
+            self.webhook_server = WebhookServer(self.application)
+            await self.webhook_server.start()
+            if settings.webhook_set_on_start:
+                await self.webhook_server.register()
+        else:
+            logger.info("Запуск бота в режиме polling...")
+            await self.application.updater.start_polling(
+                drop_pending_updates=settings.polling_drop_pending_updates
+            )
+        
+        STARTUP_SECONDS.labels("ready").set(startup_report.mark_ready())
+        for phase, seconds in {**startup_report.phases, **startup_report.imports}.items():
+            STARTUP_SECONDS.labels(phase).set(seconds)
+        logger.info(f"Время запуска: {startup_report.summary()}")
+        
+        await self._stop_event.wait()
+    
+    def request_stop(self):
+        """Запрос остановки (из обработчика сигнала)"""
+        self._stop_event.set()
     
     async def stop(self):
         """Остановка бота"""
+        self._stop_event.set()
+        
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+        if self._openai_task:
+            self._openai_task.cancel()
+        
+        if self.webhook_server:
+            await self.webhook_server.stop()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        
         if self.application:
-            await self.application.stop()
+            if self.application.updater and self.application.updater.running:
+                await self.application.updater.stop()
+            if self.application.running:
+                await self.application.stop()
+        
+        # Дожидаемся ответов на уже принятые сообщения
+        await message_queue.close()
+        
+        # Начатые сжатия истории успевают сохраниться
+        await summarizer.close()
+        
+        # Сообщения из буфера пакетной записи сохраняются до закрытия БД
+        await context_service.close()
         
         # Закрываем соединения
         await db_manager.close()
         
-        # Закрываем OpenAI клиент
-        from src.services.openai_service import openai_service
-        await openai_service.close()
+        # Закрываем OpenAI клиент, если он успел создаться; создание в потоке
+        # отменить нельзя, поэтому сначала дожидаемся его
+        if self._openai_construction:
+            await asyncio.gather(self._openai_construction, return_exceptions=True)
+        from src.services.openai_service import close_openai_service
+        await close_openai_service()
+        
+        if self.application:
+            await self.application.shutdown()
         
         logger.info("Бот остановлен")
 
@@ -1,7 +1,7 @@
 """
 Конфигурация приложения с валидацией через Pydantic
 """
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pydantic_settings import BaseSettings
 from pydantic import Field, validator
 
@@ -11,6 +11,103 @@ class Settings(BaseSettings):
     
     # Telegram
     telegram_bot_token: str = Field(..., description="Токен телеграм-бота")
+    telegram_api_base: str = Field(
+        default="https://api.telegram.org/bot",
+        description="Базовый URL Bot API (для локального сервера Bot API)"
+    )
+    bot_mode: str = Field(
+        default="polling",
+        description="Способ получения обновлений: polling или webhook"
+    )
+    polling_drop_pending_updates: bool = Field(
+        default=True,
+        description="Пропускать накопившиеся обновления при запуске polling"
+    )
+    update_concurrency: int = Field(
+        default=16,
+        description="Обновлений, обрабатываемых одновременно (1 - последовательно); порядок внутри чата сохраняется"
+    )
+    
+    telegram_global_rate: float = Field(
+        default=30.0,
+        description="Лимит исходящих сообщений бота в секунду (0 - без ограничения)"
+    )
+    telegram_chat_rate: float = Field(
+        default=1.0,
+        description="Лимит сообщений в личный чат в секунду (0 - без ограничения)"
+    )
+    telegram_chat_burst: int = Field(
+        default=3,
+        description="Сообщений в один личный чат подряд без паузы (в группах всплесков нет)"
+    )
+    telegram_group_rate_per_minute: float = Field(
+        default=20.0,
+        description="Лимит сообщений в группу в минуту (0 - без ограничения)"
+    )
+    telegram_send_retries: int = Field(
+        default=3,
+        description="Повторов отправки после ответа RetryAfter"
+    )
+    
+    # Несколько процессов
+    workers: int = Field(
+        default=1,
+        description="Количество процессов-воркеров; больше 1 - обновления принимает "
+                    "супервизор и распределяет их по воркерам по ID пользователя"
+    )
+    worker_base_port: int = Field(
+        default=8470,
+        description="Первый порт воркеров на 127.0.0.1: прием обновлений на "
+                    "base..base+N-1, метрики на base+N..base+2N-1"
+    )
+    worker_restart_delay_seconds: float = Field(
+        default=1.0,
+        description="Пауза перед перезапуском упавшего воркера"
+    )
+    worker_stop_timeout_seconds: float = Field(
+        default=30.0,
+        description="Ожидание штатной остановки воркера, затем процесс завершается принудительно"
+    )
+    worker_index: int = Field(
+        default=0,
+        description="Номер воркера (задается супервизором)"
+    )
+    worker_count: int = Field(
+        default=1,
+        description="Количество воркеров, между которыми разделены пользователи (задается супервизором)"
+    )
+    
+    # Webhook
+    webhook_url: str = Field(
+        default="",
+        description="Публичный адрес бота для webhook, например https://bot.example.com"
+    )
+    webhook_path: str = Field(
+        default="/telegram/webhook",
+        description="Путь, на который Telegram отправляет обновления"
+    )
+    webhook_listen: str = Field(default="0.0.0.0", description="Адрес webhook-сервера")
+    webhook_port: int = Field(default=8080, description="Порт webhook-сервера")
+    webhook_secret_token: Optional[str] = Field(
+        None,
+        description="Секрет для проверки заголовка X-Telegram-Bot-Api-Secret-Token"
+    )
+    webhook_max_pending: int = Field(
+        default=1000,
+        description="Максимум необработанных обновлений, сверх него ответ 503"
+    )
+    webhook_max_connections: int = Field(
+        default=40,
+        description="Максимум одновременных соединений от Telegram"
+    )
+    webhook_set_on_start: bool = Field(
+        default=True,
+        description="Регистрировать webhook при запуске (выключить для всех процессов, кроме одного)"
+    )
+    webhook_reuse_port: bool = Field(
+        default=False,
+        description="Разрешить нескольким процессам слушать один порт (SO_REUSEPORT)"
+    )
     
     # OpenAI
     openai_api_key: str = Field(..., description="API ключ OpenAI")
@@ -22,6 +119,143 @@ class Settings(BaseSettings):
         default="gpt-3.5-turbo",
         description="Модель OpenAI для использования"
     )
+    openai_temperature: float = Field(
+        default=0.7,
+        description="Температура генерации по умолчанию"
+    )
+    openai_stream: bool = Field(
+        default=False,
+        description="Потоковая выдача ответа с постепенным редактированием сообщения"
+    )
+    stream_edit_interval: float = Field(
+        default=1.0,
+        description="Минимальный интервал между редактированиями сообщения в секундах"
+    )
+    openai_max_concurrency: int = Field(
+        default=8,
+        description="Максимум одновременных запросов к OpenAI"
+    )
+    openai_requests_per_minute: int = Field(
+        default=0,
+        description="Лимит запросов к OpenAI в минуту (0 - без ограничения)"
+    )
+    openai_tokens_per_minute: int = Field(
+        default=0,
+        description="Лимит токенов OpenAI в минуту (0 - без ограничения)"
+    )
+    openai_fair_queuing: bool = Field(
+        default=True,
+        description="Распределять запросы к OpenAI между пользователями справедливой очередью"
+    )
+    openai_user_max_in_flight: int = Field(
+        default=2,
+        description="Максимум одновременных запросов к OpenAI одного пользователя (0 - без ограничения); "
+                    "действует и без справедливой очереди"
+    )
+    openai_queue_size: int = Field(
+        default=100,
+        description="Максимум запросов, ожидающих отправки в OpenAI"
+    )
+    openai_max_retries: int = Field(
+        default=2,
+        description="Количество повторов при 429, ошибках сети и сервера"
+    )
+    openai_reply_tokens_estimate: int = Field(
+        default=500,
+        description="Оценка длины ответа в токенах, если max_tokens не задан"
+    )
+    openai_request_timeout: float = Field(
+        default=60.0,
+        description="Таймаут чтения ответа OpenAI в секундах, после него запрос уходит на другой сервер"
+    )
+    openai_connect_timeout: float = Field(
+        default=10.0,
+        description="Таймаут установки соединения с OpenAI (включая прокси и TLS) в секундах"
+    )
+    openai_write_timeout: float = Field(
+        default=10.0,
+        description="Таймаут отправки запроса в OpenAI в секундах"
+    )
+    openai_pool_timeout: float = Field(
+        default=10.0,
+        description="Ожидание свободного соединения из пула в секундах"
+    )
+    openai_max_connections: int = Field(
+        default=100,
+        description="Максимум соединений с одним сервером OpenAI"
+    )
+    openai_max_keepalive_connections: int = Field(
+        default=20,
+        description="Максимум простаивающих соединений, которые держатся открытыми"
+    )
+    openai_keepalive_expiry: float = Field(
+        default=60.0,
+        description="Время жизни простаивающего соединения в секундах"
+    )
+    openai_http2: bool = Field(
+        default=False,
+        description="Использовать HTTP/2 (нужен пакет h2)"
+    )
+    openai_prewarm_connections: int = Field(
+        default=2,
+        description="Соединений с каждым сервером, открываемых при запуске (0 - не прогревать)"
+    )
+    openai_keepalive_ping_seconds: float = Field(
+        default=45.0,
+        description="Интервал запросов, не дающих соединениям закрыться при простое (0 - выключено)"
+    )
+    openai_backends: List[Dict[str, Optional[str]]] = Field(
+        default_factory=list,
+        description=(
+            "Пул OpenAI-совместимых серверов (JSON): "
+            '[{"name": "...", "base_url": "...", "api_key": "...", "proxy_url": "..."}]; '
+            "пустой - один сервер из openai_api_base, openai_api_key и proxy_url"
+        )
+    )
+    openai_breaker_failures: int = Field(
+        default=3,
+        description="Ошибок подряд, после которых сервер из пула временно отключается"
+    )
+    openai_breaker_cooldown_seconds: float = Field(
+        default=30.0,
+        description="Длительность отключения сбойного сервера в секундах"
+    )
+    openai_latency_window: int = Field(
+        default=50,
+        description="Количество последних запросов для оценки задержки и доли ошибок сервера"
+    )
+    
+    # Кэш ответов
+    response_cache_backend: str = Field(
+        default="none",
+        description="Хранилище кэша ответов: none, memory или database"
+    )
+    response_cache_ttl_seconds: int = Field(
+        default=3600,
+        description="Время жизни закэшированного ответа в секундах"
+    )
+    response_cache_max_entries: int = Field(
+        default=10000,
+        description="Максимальное количество ответов в кэше"
+    )
+    response_cache_max_temperature: float = Field(
+        default=0.3,
+        description="Кэшируются только запросы с температурой не выше этой"
+    )
+    
+    # Очередь сообщений
+    message_debounce_seconds: float = Field(
+        default=0.5,
+        description="Окно ожидания следующего сообщения пользователя перед запросом (0 - без объединения)"
+    )
+    message_debounce_max_seconds: float = Field(
+        default=2.0,
+        description="Максимальная задержка запроса при непрерывном потоке сообщений"
+    )
+    max_pending_messages: int = Field(
+        default=10,
+        description="Максимум необработанных сообщений одного пользователя"
+    )
     
     # Прокси
     proxy_url: Optional[str] = Field(None, description="URL прокси-сервера")
@@ -31,15 +265,72 @@ class Settings(BaseSettings):
         default_factory=list,
         description="Список разрешенных пользователей"
     )
+    user_priority_weights: Dict[int, float] = Field(
+        default_factory=dict,
+        description="Веса пользователей в очереди к OpenAI (уровни приоритета), остальные - 1"
+    )
     
     # База данных
     database_url: str = Field(
         default="sqlite+aiosqlite:///./bot_database.db",
         description="URL подключения к БД"
     )
+    db_pool_size: int = Field(
+        default=5,
+        description="Размер пула соединений с БД (0 - без пула)"
+    )
+    db_max_overflow: int = Field(
+        default=10,
+        description="Дополнительные соединения сверх размера пула"
+    )
+    db_pool_timeout: float = Field(
+        default=30.0,
+        description="Время ожидания свободного соединения в секундах"
+    )
+    db_pool_recycle: int = Field(
+        default=1800,
+        description="Время жизни соединения с сетевой БД в секундах"
+    )
+    sqlite_journal_mode: str = Field(
+        default="WAL",
+        description="Режим журнала SQLite"
+    )
+    sqlite_synchronous: str = Field(
+        default="NORMAL",
+        description="Режим синхронизации SQLite"
+    )
+    sqlite_busy_timeout_ms: int = Field(
+        default=5000,
+        description="Ожидание снятия блокировки SQLite в миллисекундах"
+    )
+    sqlite_mmap_size: int = Field(
+        default=268435456,
+        description="Размер отображаемой в память области SQLite в байтах"
+    )
     
     # Логирование
-    log_level: str = Field(default="INFO", description="Уровень логирования")
+    log_level: str = Field(
+        default="INFO",
+        description="Уровень логирования; уровни модулей через запятую: INFO,src.services=DEBUG"
+    )
+    log_file: str = Field(default="logs/bot.log", description="Файл логов (пусто - только консоль)")
+    log_enqueue: bool = Field(
+        default=True,
+        description="Писать логи в фоновом потоке, не блокируя цикл событий"
+    )
+    log_json: bool = Field(default=False, description="Логи в формате JSON, по записи на строку")
+    log_debug_sample_every: int = Field(
+        default=1,
+        description="Пропускать в лог только каждую N-ю DEBUG-запись с одного места вызова"
+    )
+    
+    # Метрики
+    metrics_enabled: bool = Field(
+        default=False,
+        description="Отдавать метрики Prometheus по HTTP на /metrics"
+    )
+    metrics_listen: str = Field(default="127.0.0.1", description="Адрес сервера метрик")
+    metrics_port: int = Field(default=9101, description="Порт сервера метрик")
     
     # Контекст
     max_context_messages: int = Field(
@@ -50,6 +341,118 @@ class Settings(BaseSettings):
         default=24,
         description="Время жизни контекста в часах"
     )
+    cleanup_interval_seconds: int = Field(
+        default=3600,
+        description="Интервал запуска очистки устаревших сообщений в секундах"
+    )
+    cleanup_batch_size: int = Field(
+        default=500,
+        description="Количество сообщений, удаляемых одной транзакцией"
+    )
+    cleanup_batch_pause_seconds: float = Field(
+        default=0.01,
+        description="Пауза между пакетами очистки в секундах"
+    )
+    cleanup_time_budget_seconds: float = Field(
+        default=10.0,
+        description="Максимальная длительность одного запуска очистки в секундах"
+    )
+    context_archive_enabled: bool = Field(
+        default=False,
+        description="Переносить устаревшие сообщения в сжатый архив вместо удаления"
+    )
+    context_archive_codec: str = Field(
+        default="gzip",
+        description="Сжатие сегментов архива: gzip или zstd (нужен пакет zstandard)"
+    )
+    context_archive_retention_days: int = Field(
+        default=0,
+        description="Срок хранения архива в днях (0 - бессрочно)"
+    )
+    context_token_budget: bool = Field(
+        default=False,
+        description="Ограничивать контекст бюджетом токенов вместо количества сообщений"
+    )
+    openai_context_tokens: Dict[str, int] = Field(
+        default_factory=lambda: {
+            "gpt-3.5-turbo": 16385,
+            "gpt-4": 8192,
+            "gpt-4-turbo": 128000,
+            "gpt-4o": 128000,
+            "gpt-4o-mini": 128000,
+        },
+        description="Размер окна контекста модели в токенах"
+    )
+    default_context_tokens: int = Field(
+        default=4096,
+        description="Размер окна контекста для моделей, отсутствующих в openai_context_tokens"
+    )
+    reply_reserve_tokens: int = Field(
+        default=1024,
+        description="Токены, резервируемые под ответ модели"
+    )
+    context_max_rows: int = Field(
+        default=200,
+        description="Максимум сообщений, просматриваемых в режиме бюджета токенов"
+    )
+    context_cache_enabled: bool = Field(
+        default=True,
+        description="Кэшировать контексты диалогов в памяти"
+    )
+    context_cache_max_users: int = Field(
+        default=10000,
+        description="Максимальное количество пользователей в кэше контекстов"
+    )
+    user_cache_enabled: bool = Field(
+        default=True,
+        description="Кэшировать внутренние ID пользователей и записывать время "
+                    "активности пакетами"
+    )
+    user_cache_max_users: int = Field(
+        default=100000,
+        description="Максимальное количество пользователей в кэше ID"
+    )
+    user_activity_flush_seconds: float = Field(
+        default=60.0,
+        description="Интервал пакетной записи времени последней активности пользователей; "
+                    "при аварийном завершении (SIGKILL) теряются отметки за последний интервал"
+    )
+    message_write_behind: bool = Field(
+        default=False,
+        description="Записывать сообщения пакетами из буфера в памяти; при остановке по "
+                    "SIGTERM/SIGINT буфер записывается, при аварийном завершении (SIGKILL) "
+                    "теряются сообщения за последний интервал записи"
+    )
+    message_flush_interval_ms: int = Field(
+        default=50,
+        description="Максимальное время ожидания записи сообщения из буфера"
+    )
+    message_flush_max_rows: int = Field(
+        default=200,
+        description="Количество сообщений в буфере, при котором пакет записывается сразу"
+    )
+    
+    # Сжатие истории
+    summary_enabled: bool = Field(
+        default=False,
+        description="Сжимать старые сообщения диалога в краткое содержание"
+    )
+    summary_trigger_messages: int = Field(
+        default=16,
+        description="Количество сообщений в контексте, после которого история сжимается"
+    )
+    summary_keep_messages: int = Field(
+        default=6,
+        description="Последние сообщения, которые остаются в контексте без сжатия"
+    )
+    summary_max_concurrency: int = Field(
+        default=2,
+        description="Максимум одновременных запросов на сжатие истории"
+    )
+    summary_max_tokens: int = Field(
+        default=400,
+        description="Максимальная длина краткого содержания в токенах"
+    )
     
     @validator("allowed_users", pre=True)
     def parse_allowed_users(cls, v):
@@ -58,6 +461,19 @@ class Settings(BaseSettings):
             return [int(user_id.strip()) for user_id in v.split(",") if user_id.strip()]
         return v
     
+    @property
+    def context_window_rows(self) -> int:
+        """Количество последних сообщений, из которых собирается контекст"""
+        if self.context_token_budget:
+            return self.context_max_rows
+        return self.max_context_messages
+    
+    @property
+    def max_prompt_tokens(self) -> int:
+        """Бюджет токенов на контекст текущей модели с учетом резерва под ответ"""
+        window = self.openai_context_tokens.get(self.openai_model, self.default_context_tokens)
+        return max(window - self.reply_reserve_tokens, 0)
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -1,13 +1,19 @@
 """
 Управление подключением к базе данных
 """
+import time
 from contextlib import asynccontextmanager
+from typing import Any, Dict
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, StaticPool
 from loguru import logger
 
 from src.config import settings
+from src.database import migrations
 from src.database.models import Base
+from src.metrics import DB_SESSION_SECONDS
 
 
 class DatabaseManager:
@@ -20,16 +26,19 @@ class DatabaseManager:
     async def init_db(self):
         """Инициализация базы данных"""
         try:
-            # Создаем асинхронный движок
+            # Создаем асинхронный движок с параметрами под тип БД
             self.engine = create_async_engine(
                 settings.database_url,
                 echo=False,
-                poolclass=NullPool,  # Для SQLite
+                **self._engine_options()
             )
             
-            # Создаем таблицы
+            if self.is_sqlite:
+                event.listen(self.engine.sync_engine, "connect", self._apply_sqlite_pragmas)
+            
+            # Создаем таблицы или обновляем схему существующей базы
             async with self.engine.begin() as conn:
-                await conn.run_sync(Base.metadata.create_all)
+                await conn.run_sync(self._create_or_upgrade)
             
             # Создаем фабрику сессий
             self.async_session_maker = async_sessionmaker(
@@ -44,6 +53,71 @@ class DatabaseManager:
             logger.error(f"Ошибка инициализации БД: {e}")
             raise
     
+    @property
+    def is_sqlite(self) -> bool:
+        """Используется ли SQLite"""
+        return make_url(settings.database_url).get_backend_name() == "sqlite"
+    
+    def _engine_options(self) -> Dict[str, Any]:
+        """
+        Параметры пула соединений в зависимости от типа БД
+        
+        Returns:
+            Аргументы для create_async_engine
+        """
+        url = make_url(settings.database_url)
+        
+        # БД в памяти существует только внутри одного соединения
+        if self.is_sqlite and url.database in (None, "", ":memory:"):
+            return {"poolclass": StaticPool}
+        
+        if settings.db_pool_size <= 0:
+            return {"poolclass": NullPool}
+        
+        options = {
+            "poolclass": AsyncAdaptedQueuePool,
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+            "pool_timeout": settings.db_pool_timeout,
+        }
+        
+        # Сетевым БД нужна проверка и периодическое обновление соединений
+        if not self.is_sqlite:
+            options["pool_recycle"] = settings.db_pool_recycle
+            options["pool_pre_ping"] = True
+        
+        return options
+    
+    @staticmethod
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        """Настройка каждого нового соединения SQLite"""
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+            cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+            cursor.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}")
+            cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size}")
+            # Внешние ключи в SQLite включаются для каждого соединения
+            cursor.execute("PRAGMA foreign_keys=ON")
+        finally:
+            cursor.close()
+    
+    @classmethod
+    def _create_or_upgrade(cls, sync_conn):
+        """Создание схемы новой базы или миграция существующей"""
+        if migrations.is_new_database(sync_conn):
+            Base.metadata.create_all(sync_conn)
+            migrations.stamp_latest(sync_conn)
+            return
+        
+        # Новые таблицы создаются до миграций, изменения существующих
+        # выполняют только миграции
+        Base.metadata.create_all(sync_conn)
+        
+        applied = migrations.upgrade(sync_conn)
+        if applied:
+            logger.info(f"Схема БД обновлена до версии {migrations.LATEST_VERSION}")
+    
     async def close(self):
         """Закрытие соединения с БД"""
         if self.engine:
@@ -56,6 +130,7 @@ class DatabaseManager:
         if not self.async_session_maker:
             raise RuntimeError("База данных не инициализирована")
         
+        started = time.perf_counter()
         async with self.async_session_maker() as session:
             try:
                 yield session
@@ -65,6 +140,7 @@ class DatabaseManager:
                 raise
             finally:
                 await session.close()
+                DB_SESSION_SECONDS.observe(time.perf_counter() - started)
 
 
 # Глобальный экземпляр менеджера БД
@@ -0,0 +1,190 @@
+"""
+Обновление схемы существующих баз данных
+
+Номер версии схемы хранится в таблице schema_version. Новая база
+создается сразу в актуальной схеме и получает последний номер; база
+предыдущей версии при запуске проходит по порядку все миграции с
+номером больше сохраненного. Каждая миграция выполняется в транзакции
+инициализации вместе с записью нового номера.
+"""
+from typing import Callable, List, Tuple
+
+from loguru import logger
+from sqlalchemy import (
+    BigInteger, Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+    inspect, select, text
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateTable
+
+
+schema_metadata = MetaData()
+
+schema_version = Table(
+    "schema_version",
+    schema_metadata,
+    Column("version", Integer, nullable=False),
+)
+
+# Миграции описывают таблицы такими, какими они были на момент выпуска,
+# а не через модели: модели меняются дальше, а миграция должна делать
+# с базой то же, что и при выпуске
+
+# Версия 1: для индекса нужны только его колонки
+_v1 = MetaData()
+_messages_v1 = Table(
+    "messages",
+    _v1,
+    Column("telegram_id", BigInteger, nullable=False),
+    Column("created_at", DateTime(timezone=True)),
+)
+_history_index_v1 = Index(
+    "ix_messages_telegram_id_created_at",
+    _messages_v1.c.telegram_id,
+    _messages_v1.c.created_at,
+)
+
+# Версия 2: таблица сообщений с внешним ключом, создается под временным именем
+_v2 = MetaData()
+Table("users", _v2, Column("id", Integer, primary_key=True))
+_messages_v2 = Table(
+    "messages_rebuild",
+    _v2,
+    Column("id", Integer, primary_key=True),
+    Column(
+        "user_id",
+        Integer,
+        ForeignKey("users.id", name="fk_messages_user_id", ondelete="CASCADE"),
+        nullable=False
+    ),
+    Column("telegram_id", BigInteger, nullable=False),
+    Column("role", String(50), nullable=False),
+    Column("content", Text, nullable=False),
+    Column("token_count", Integer),
+    Column("replaced_tokens", Integer),
+    Column("created_at", DateTime(timezone=True)),
+)
+_messages_indexes_v2 = [
+    "CREATE INDEX ix_messages_user_id ON messages (user_id)",
+    "CREATE INDEX ix_messages_created_at ON messages (created_at)",
+    "CREATE INDEX ix_messages_telegram_id_created_at ON messages (telegram_id, created_at)",
+]
+
+
+def add_history_index(conn: Connection) -> None:
+    """Составной индекс (telegram_id, created_at) для выборки истории и очистки контекста"""
+    _history_index_v1.create(conn, checkfirst=True)
+
+
+def add_user_foreign_key(conn: Connection) -> None:
+    """
+    Внешний ключ messages.user_id -> users.id
+    
+    Сообщения пользователей, которых нет в users, удаляются: с ними
+    ограничение не создать. SQLite не добавляет ограничения в
+    существующую таблицу, поэтому таблица пересоздается с копированием
+    строк; остальные СУБД получают ALTER TABLE.
+    """
+    orphans = conn.execute(text(
+        "DELETE FROM messages WHERE user_id NOT IN (SELECT id FROM users)"
+    )).rowcount
+    if orphans:
+        logger.warning(f"Удалено {orphans} сообщений без пользователя")
+    
+    if conn.dialect.name != "sqlite":
+        conn.execute(text(
+            "ALTER TABLE messages ADD CONSTRAINT fk_messages_user_id "
+            "FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE"
+        ))
+        return
+    
+    # Базы до учета токенов не имеют части колонок: копируются только существующие
+    existing = {column["name"] for column in inspect(conn).get_columns("messages")}
+    columns = ", ".join(column.name for column in _messages_v2.columns if column.name in existing)
+    
+    conn.execute(CreateTable(_messages_v2))
+    conn.execute(text(f"INSERT INTO messages_rebuild ({columns}) SELECT {columns} FROM messages"))
+    conn.execute(text("DROP TABLE messages"))
+    conn.execute(text("ALTER TABLE messages_rebuild RENAME TO messages"))
+    
+    for statement in _messages_indexes_v2:
+        conn.execute(text(statement))
+
+
+def _add_column(conn: Connection, table: str, column: Column) -> None:
+    """
+    Добавление nullable-колонки, если ее еще нет
+    
+    Базы, созданные до учета версий, могут уже содержать колонку, а в
+    SQLite ее создает пересоздание таблицы в миграции 2.
+    """
+    if column.name in {existing["name"] for existing in inspect(conn).get_columns(table)}:
+        return
+    column_type = column.type.compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}"))
+
+
+def add_token_count(conn: Connection) -> None:
+    """Колонка messages.token_count: токены сообщения с учетом служебных"""
+    _add_column(conn, "messages", Column("token_count", Integer))
+
+
+def add_replaced_tokens(conn: Connection) -> None:
+    """Колонка messages.replaced_tokens: токены сообщений, замененных сводкой"""
+    _add_column(conn, "messages", Column("replaced_tokens", Integer))
+
+
+# Номер версии, описание, функция обновления; новые миграции добавляются в конец
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "составной индекс истории сообщений", add_history_index),
+    (2, "внешний ключ messages.user_id", add_user_foreign_key),
+    (3, "колонка messages.token_count", add_token_count),
+    (4, "колонка messages.replaced_tokens", add_replaced_tokens),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: Connection) -> int:
+    """Сохраненный номер версии схемы (0 - база без учета версий)"""
+    if not inspect(conn).has_table("schema_version"):
+        return 0
+    return conn.execute(select(schema_version.c.version)).scalar() or 0
+
+
+def _set_version(conn: Connection, version: int) -> None:
+    conn.execute(schema_version.delete())
+    conn.execute(schema_version.insert().values(version=version))
+
+
+def is_new_database(conn: Connection) -> bool:
+    """В базе еще нет таблиц приложения"""
+    return not inspect(conn).has_table("messages")
+
+
+def stamp_latest(conn: Connection) -> None:
+    """Отметка новой базы, созданной сразу в актуальной схеме"""
+    schema_metadata.create_all(conn)
+    _set_version(conn, LATEST_VERSION)
+
+
+def upgrade(conn: Connection) -> int:
+    """
+    Применение миграций, которых еще нет в базе
+    
+    Returns:
+        Количество примененных миграций
+    """
+    schema_metadata.create_all(conn)
+    version = current_version(conn)
+    
+    applied = 0
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        logger.info(f"Миграция схемы БД {number}: {description}")
+        migrate(conn)
+        _set_version(conn, number)
+        applied += 1
+    
+    return applied
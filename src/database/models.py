@@ -2,7 +2,10 @@
 Модели базы данных для хранения контекста диалогов
 """
 from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, String, DateTime, Text, BigInteger
+from sqlalchemy import (
+    Column, Integer, String, DateTime, Date, Text, BigInteger, LargeBinary,
+    ForeignKey, Index, UniqueConstraint
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -22,19 +25,71 @@ class User(Base):
     last_active = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     
     # Связь с сообщениями
-    messages = relationship("Message", back_populates="user", cascade="all, delete-orphan")
+    messages = relationship(
+        "Message",
+        back_populates="user",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
 
 
 class Message(Base):
     """Модель сообщения в диалоге"""
     __tablename__ = "messages"
+    __table_args__ = (
+        # История пользователя: выборка по telegram_id с сортировкой по времени,
+        # очистка контекста по telegram_id
+        Index("ix_messages_telegram_id_created_at", "telegram_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", name="fk_messages_user_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True
+    )
     telegram_id = Column(BigInteger, nullable=False)
-    role = Column(String(50), nullable=False)  # 'user' или 'assistant'
+    role = Column(String(50), nullable=False)  # 'user', 'assistant' или 'summary'
     content = Column(Text, nullable=False)
+    token_count = Column(Integer, nullable=True)  # Токены с учетом служебных, считаются при записи
+    replaced_tokens = Column(Integer, nullable=True)  # Для 'summary': токены замененных сообщений
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True)
     
     # Связь с пользователем
-    user = relationship("User", back_populates="messages") 
\ No newline at end of file
+    user = relationship("User", back_populates="messages")
+
+
+class ArchiveSegment(Base):
+    """Сжатые сообщения пользователя за один день, вынесенные из messages"""
+    __tablename__ = "message_archive"
+    __table_args__ = (
+        # Один сегмент на пользователя и день; выборка архива пользователя по дням
+        UniqueConstraint("telegram_id", "day", name="uq_message_archive_telegram_id_day"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", name="fk_message_archive_user_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True
+    )
+    telegram_id = Column(BigInteger, nullable=False)
+    day = Column(Date, nullable=False, index=True)  # День created_at сообщений (UTC)
+    codec = Column(String(16), nullable=False)  # 'gzip' или 'zstd'
+    message_count = Column(Integer, nullable=False)
+    raw_bytes = Column(Integer, nullable=False)  # Размер до сжатия
+    payload = Column(LargeBinary, nullable=False)
+    first_created_at = Column(DateTime(timezone=True), nullable=False)
+    last_created_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class ResponseCacheEntry(Base):
+    """Модель закэшированного ответа OpenAI"""
+    __tablename__ = "response_cache"
+    
+    key = Column(String(64), primary_key=True)  # SHA-256 параметров запроса
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
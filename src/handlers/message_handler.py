@@ -1,13 +1,26 @@
 """
 Обработчики сообщений телеграм-бота
 """
-from telegram import Update
+import time
+from typing import Dict, List
+
+from telegram import Message, Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 from loguru import logger
 
 from src.config import settings
-from src.services.openai_service import openai_service
+from src.metrics import MESSAGES_TOTAL, observe_stage, track_stage
+from src.services.openai_service import get_openai_service
 from src.services.context_service import context_service
+from src.services.message_queue import UserMessageQueue
+from src.services.rate_limiter import RateLimitQueueFull
+from src.services.send_queue import MESSAGE_LIMIT, send_queue, split_message, utf16_length
+from src.services.summary_service import summarizer
+
+
+# Ответ вместо пустого текста от модели
+EMPTY_REPLY_TEXT = "🤔 Не получилось сформулировать ответ. Попробуйте переформулировать вопрос."
 
 
 async def check_access(user_id: int) -> bool:
@@ -32,14 +45,15 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     user = update.effective_user
     
     if not await check_access(user.id):
-        await update.message.reply_text(
+        await send_queue.reply(
+            update.message,
             "⛔ Извините, у вас нет доступа к этому боту.\n"
             "Обратитесь к администратору для получения доступа."
         )
         return
     
     # Создаем или обновляем пользователя в БД
-    await context_service.get_or_create_user(
+    await context_service.ensure_user(
         telegram_id=user.id,
         username=user.username,
         first_name=user.first_name,
@@ -56,7 +70,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         "Просто напишите мне сообщение, и я отвечу!"
     )
     
-    await update.message.reply_text(welcome_text)
+    await send_queue.reply(update.message, welcome_text)
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -78,7 +92,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "Просто отправьте любое сообщение, чтобы начать диалог!"
     )
     
-    await update.message.reply_text(help_text, parse_mode='Markdown')
+    await send_queue.reply(update.message, help_text, parse_mode='Markdown')
 
 
 async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -91,49 +105,110 @@ async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     # Очищаем контекст пользователя
     await context_service.clear_context(user_id)
     
-    await update.message.reply_text(
+    await send_queue.reply(
+        update.message,
         "🧹 Контекст диалога очищен.\n"
         "Начнем с чистого листа!"
     )
 
 
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Обработчик текстовых сообщений"""
-    user = update.effective_user
-    message = update.message
+async def stream_reply(message: Message, messages: List[Dict[str, str]], telegram_id: int) -> str:
+    """
+    Потоковый ответ: первое сообщение отправляется с первым фрагментом
+    текста и затем редактируется не чаще, чем раз в stream_edit_interval
     
-    # Проверка доступа
-    if not await check_access(user.id):
-        await message.reply_text(
-            "⛔ У вас нет доступа к этому боту."
-        )
-        return
+    Промежуточное редактирование пропускается, если лимит отправок в чат
+    исчерпан. Текст, не помещающийся в одно сообщение, продолжается в
+    следующем. На пустой ответ модели отправляется EMPTY_REPLY_TEXT.
     
-    # Показываем индикатор "печатает..."
-    await context.bot.send_chat_action(
-        chat_id=message.chat_id,
-        action="typing"
-    )
+    Args:
+        message: Сообщение пользователя, на которое отвечаем
+        messages: Контекст диалога в формате OpenAI
+        telegram_id: ID пользователя в Telegram
+    
+    Returns:
+        Полный текст ответа
+    """
+    text = ""
+    start = 0  # Начало текста текущего сообщения
+    sent = None
+    shown = ""
+    last_edit = 0.0
+    
+    async def show(part: str) -> None:
+        nonlocal sent, shown
+        if sent is None:
+            sent = await send_queue.call(message.chat_id, lambda: message.reply_text(part))
+        elif part.rstrip() != shown.rstrip():
+            # Telegram обрезает пробелы в конце: текст, отличающийся только
+            # ими, считается неизмененным
+            try:
+                await send_queue.call(message.chat_id, lambda: sent.edit_text(part))
+            except BadRequest as e:
+                if "message is not modified" not in str(e).lower():
+                    raise
+        shown = part
+    
+    async for delta in get_openai_service().stream_chat_completion(messages, user_id=telegram_id):
+        text += delta
+        current = text[start:]
+        
+        # Telegram не принимает сообщения из одних пробелов
+        if not current.strip():
+            continue
+        
+        if utf16_length(current) > MESSAGE_LIMIT:
+            # Заполненное сообщение дописывается, текст продолжается в новом
+            *complete, current = split_message(current)
+            for part in complete:
+                if part.strip():
+                    await show(part)
+                sent, shown = None, ""
+            start = len(text) - len(current)
+            if not current.strip():
+                continue
+        
+        now = time.monotonic()
+        if sent is None or (
+            now - last_edit >= settings.stream_edit_interval and send_queue.ready(message.chat_id)
+        ):
+            await show(current)
+            last_edit = now
+    
+    current = text[start:]
+    if sent is not None or current.strip():
+        await show(current)
+    elif not text.strip():
+        # Пустой ответ модели: Telegram не принимает сообщение без текста
+        await send_queue.reply(message, EMPTY_REPLY_TEXT)
+    
+    return text
+
+
+async def process_messages(telegram_id: int, updates: List[Update]) -> None:
+    """
+    Обработка пачки сообщений пользователя одним запросом к OpenAI
+    
+    Args:
+        telegram_id: ID пользователя в Telegram
+        updates: Обновления с сообщениями пользователя в порядке получения
+    """
+    user = updates[-1].effective_user
+    message = updates[-1].message
+    started = time.perf_counter()
+    result = "ok"
     
     try:
-        # Создаем или обновляем пользователя
-        await context_service.get_or_create_user(
-            telegram_id=user.id,
+        # Создаем или обновляем пользователя, сохраняем сообщения
+        # и получаем контекст диалога одной транзакцией
+        user_db_id, messages = await context_service.begin_turn(
+            telegram_id=telegram_id,
+            contents=[update.message.text for update in updates],
             username=user.username,
             first_name=user.first_name,
             last_name=user.last_name
         )
         
-        # Сохраняем сообщение пользователя
-        await context_service.add_message(
-            telegram_id=user.id,
-            role="user",
-            content=message.text
-        )
-        
-        # Получаем контекст диалога
-        messages = await context_service.get_context(user.id)
-        
         # Добавляем системное сообщение если контекст пустой
         if not messages:
             messages.append({
@@ -142,22 +217,87 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             })
         
         # Получаем ответ от ChatGPT
-        logger.info(f"Отправка запроса к OpenAI для пользователя {user.id}")
-        ai_response = await openai_service.get_chat_completion(messages)
+        logger.info("Отправка запроса к OpenAI для пользователя {} ({} сообщ.)", telegram_id, len(updates))
+        # В потоковом режиме этап включает отправку фрагментов пользователю
+        with track_stage("completion"):
+            if settings.openai_stream:
+                ai_response = await stream_reply(message, messages, telegram_id)
+            else:
+                ai_response = await get_openai_service().get_chat_completion(messages, user_id=telegram_id)
         
         # Сохраняем ответ ассистента
-        await context_service.add_message(
-            telegram_id=user.id,
-            role="assistant",
-            content=ai_response
-        )
+        with track_stage("persist"):
+            await context_service.append_message(
+                user_id=user_db_id,
+                telegram_id=telegram_id,
+                role="assistant",
+                content=ai_response
+            )
+        
+        # Длинную историю сжимаем в фоне, ответ пользователю не ждет
+        if settings.summary_enabled:
+            summarizer.schedule(telegram_id, len(messages) + 1)
         
-        # Отправляем ответ пользователю
-        await message.reply_text(ai_response)
+        # Отвечаем на последнее сообщение пачки (в потоковом режиме уже отправлен)
+        if not settings.openai_stream:
+            with track_stage("send"):
+                await send_queue.reply(message, ai_response)
         
+    except RateLimitQueueFull:
+        result = "rate_limited"
+        await send_queue.reply(
+            message,
+            "⏳ Сейчас слишком много запросов.\n"
+            "Попробуйте еще раз через минуту."
+        )
     except Exception as e:
+        result = "error"
         logger.error(f"Ошибка обработки сообщения: {e}")
-        await message.reply_text(
+        await send_queue.reply(
+            message,
             "😔 Произошла ошибка при обработке вашего сообщения.\n"
             "Попробуйте еще раз или обратитесь к администратору."
-        ) 
\ No newline at end of file
+        )
+    finally:
+        observe_stage("turn", time.perf_counter() - started)
+        MESSAGES_TOTAL.labels(result).inc()
+
+
+# Очередь сообщений: ответы одному пользователю строго по порядку,
+# сообщения, отправленные подряд, объединяются в один запрос
+message_queue = UserMessageQueue(
+    processor=process_messages,
+    debounce_seconds=settings.message_debounce_seconds,
+    max_delay_seconds=settings.message_debounce_max_seconds,
+    max_pending=settings.max_pending_messages
+)
+
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик текстовых сообщений"""
+    user = update.effective_user
+    message = update.message
+    
+    # Проверка доступа
+    with track_stage("access_check"):
+        allowed = await check_access(user.id)
+    if not allowed:
+        await send_queue.reply(
+            message,
+            "⛔ У вас нет доступа к этому боту."
+        )
+        return
+    
+    if not message_queue.submit(user.id, update):
+        await send_queue.reply(
+            message,
+            "⏳ Слишком много сообщений подряд.\n"
+            "Дождитесь ответа на предыдущие."
+        )
+        return
+    
+    # Показываем индикатор "печатает..."
+    await context.bot.send_chat_action(
+        chat_id=message.chat_id,
+        action="typing"
+    )
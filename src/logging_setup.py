@@ -0,0 +1,128 @@
+"""
+Настройка логирования
+"""
+import sys
+from typing import Any, Dict, Tuple
+
+from loguru import logger
+
+from src.config import settings
+
+
+CONSOLE_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+)
+
+DEBUG_LEVEL_NO = logger.level("DEBUG").no
+INFO_LEVEL_NO = logger.level("INFO").no
+
+
+def parse_levels(spec: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Разбор строки уровней вида "INFO,src.services=DEBUG,src.bot=WARNING"
+    
+    Args:
+        spec: Общий уровень и уровни модулей через запятую
+    
+    Returns:
+        Общий уровень и уровни модулей по префиксу имени
+    """
+    default = "INFO"
+    modules = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "=" in part:
+            module, level = part.split("=", 1)
+            modules[module.strip()] = level.strip().upper()
+        else:
+            default = part.upper()
+    return default, modules
+
+
+class LogFilter:
+    """
+    Фильтр записей по уровню модуля и прореживание DEBUG-записей
+    
+    Уровень модуля ищется по самому длинному совпадающему префиксу имени
+    и запоминается. При sample_every > 1 с каждого места вызова проходит
+    только каждая N-я отладочная запись, так что частые события не
+    заполняют лог.
+    """
+    
+    def __init__(self, default_level: str, module_levels: Dict[str, str], sample_every: int = 1):
+        """
+        Args:
+            default_level: Уровень для модулей без собственного уровня
+            module_levels: Уровни модулей по префиксу имени
+            sample_every: Какая по счету DEBUG-запись с места вызова попадает в лог
+        """
+        self.default_no = logger.level(default_level).no
+        self.module_nos = {module: logger.level(level).no for module, level in module_levels.items()}
+        self.sample_every = max(1, sample_every)
+        self.min_no = min([self.default_no, *self.module_nos.values()])
+        
+        self._cache: Dict[str, int] = {}
+        self._counts: Dict[Tuple[str, int], int] = {}
+        self.sampled_out = 0
+    
+    def level_for(self, name: str) -> int:
+        """Номер минимального уровня для модуля"""
+        level_no = self._cache.get(name)
+        if level_no is None:
+            level_no = self.default_no
+            prefix = name
+            while prefix:
+                if prefix in self.module_nos:
+                    level_no = self.module_nos[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self._cache[name] = level_no
+        return level_no
+    
+    def __call__(self, record: Dict[str, Any]) -> bool:
+        level_no = record["level"].no
+        if level_no < self.level_for(record["name"] or ""):
+            return False
+        
+        if self.sample_every > 1 and DEBUG_LEVEL_NO <= level_no < INFO_LEVEL_NO:
+            key = (record["name"], record["line"])
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+            if count % self.sample_every:
+                self.sampled_out += 1
+                return False
+        return True
+
+
+def setup_logging() -> None:
+    """
+    Настройка обработчиков loguru по настройкам приложения
+    
+    При log_enqueue записи передаются в фоновый поток через очередь,
+    и цикл событий не ждет записи в файл и консоль. Перед выходом
+    нужно дождаться await logger.complete(), чтобы очередь опустела.
+    """
+    default_level, module_levels = parse_levels(settings.log_level)
+    
+    def options() -> Dict[str, Any]:
+        # У каждого обработчика свой фильтр: счетчики прореживания не общие
+        log_filter = LogFilter(default_level, module_levels, settings.log_debug_sample_every)
+        return {
+            "level": log_filter.min_no,
+            "filter": log_filter,
+            "enqueue": settings.log_enqueue,
+            "serialize": settings.log_json,
+        }
+    
+    logger.remove()
+    logger.add(sys.stdout, format=CONSOLE_FORMAT, **options())
+    if settings.log_file:
+        logger.add(
+            settings.log_file,
+            rotation="10 MB",
+            retention="7 days",
+            **options()
+        )
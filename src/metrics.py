@@ -0,0 +1,141 @@
+"""
+Метрики в формате Prometheus
+"""
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterator
+
+from loguru import logger
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+
+from src.config import settings
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+
+# Границы корзин: от миллисекунд (кэш, БД) до десятков секунд (OpenAI)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "bot_stage_seconds",
+    "Длительность этапов обработки сообщения",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+MESSAGES_TOTAL = Counter(
+    "bot_messages_total",
+    "Обработанные пачки сообщений пользователей по результату",
+    ["result"]
+)
+DB_SESSION_SECONDS = Histogram(
+    "bot_db_session_seconds",
+    "Длительность сессий БД от открытия до фиксации",
+    buckets=LATENCY_BUCKETS
+)
+OPENAI_REQUEST_SECONDS = Histogram(
+    "bot_openai_request_seconds",
+    "Длительность попыток запроса к OpenAI до получения ответа или ошибки",
+    ["backend", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+OPENAI_QUEUE_WAIT_SECONDS = Histogram(
+    "bot_openai_queue_wait_seconds",
+    "Ожидание разрешения ограничителя OpenAI по весу пользователя в очереди",
+    ["weight"],
+    buckets=LATENCY_BUCKETS
+)
+OPENAI_TOKENS_TOTAL = Counter(
+    "bot_openai_tokens_total",
+    "Токены OpenAI: из usage ответа или оценка для потоковых ответов",
+    ["kind", "source"]
+)
+
+TELEGRAM_SENDS_TOTAL = Counter(
+    "bot_telegram_sends_total",
+    "Отправки и редактирования сообщений в Telegram по результату",
+    ["result"]
+)
+
+USER_CACHE_LOOKUPS = Counter(
+    "bot_user_cache_lookups_total",
+    "Поиск внутреннего ID пользователя в кэше по результату",
+    ["result"]
+)
+
+MESSAGE_QUEUE_PENDING = Gauge(
+    "bot_message_queue_pending",
+    "Сообщения пользователей, ожидающие обработки"
+)
+OPENAI_QUEUE_DEPTH = Gauge(
+    "bot_openai_queue_depth",
+    "Запросы, ожидающие разрешения ограничителя OpenAI"
+)
+OPENAI_IN_FLIGHT = Gauge(
+    "bot_openai_in_flight",
+    "Выполняющиеся запросы к OpenAI"
+)
+STARTUP_SECONDS = Gauge(
+    "bot_startup_seconds",
+    "Длительность этапов запуска; ready - от начала запуска до приема обновлений",
+    ["phase"]
+)
+
+# Дочерние метрики этапов создаются один раз, чтобы не искать метку на каждом вызове
+_stage_children: Dict[str, Histogram] = {}
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Запись длительности этапа обработки"""
+    child = _stage_children.get(stage)
+    if child is None:
+        child = _stage_children[stage] = STAGE_SECONDS.labels(stage)
+    child.observe(seconds)
+
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """Замер длительности этапа обработки"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+class MetricsServer:
+    """HTTP-сервер с эндпоинтом /metrics для Prometheus"""
+    
+    def __init__(self):
+        self._runner = None
+    
+    async def start(self) -> None:
+        """Запуск HTTP-сервера"""
+        # aiohttp нужен только при включенных метриках
+        from aiohttp import web
+        
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        
+        site = web.TCPSite(self._runner, host=settings.metrics_listen, port=settings.metrics_port)
+        await site.start()
+        
+        logger.info(f"Метрики доступны на {settings.metrics_listen}:{settings.metrics_port}/metrics")
+    
+    async def stop(self) -> None:
+        """Остановка HTTP-сервера"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    async def _handle_metrics(self, request: "web.Request") -> "web.Response":
+        """Текущие значения метрик в текстовом формате Prometheus"""
+        from aiohttp import web
+        
+        return web.Response(
+            body=generate_latest(REGISTRY),
+            headers={"Content-Type": CONTENT_TYPE_LATEST}
+        )
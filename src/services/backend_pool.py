@@ -0,0 +1,230 @@
+"""
+Пул OpenAI-совместимых серверов с выбором по задержке и отключением сбойных
+"""
+import random
+import statistics
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+from loguru import logger
+
+
+class OpenAIBackend:
+    """
+    Один OpenAI-совместимый сервер со своим клиентом и статистикой
+    
+    Состояние автомата отключения: closed - запросы идут, open - сервер
+    отключен до истечения паузы, half-open - после паузы пропускается один
+    пробный запрос.
+    """
+    
+    def __init__(self, name: str, client: Any, latency_window: int):
+        """
+        Args:
+            name: Имя сервера для логов и статистики
+            client: Клиент AsyncOpenAI этого сервера
+            latency_window: Количество последних замеров задержки
+        """
+        self.name = name
+        self.client = client
+        
+        self.latencies: Deque[float] = deque(maxlen=latency_window)
+        self.outcomes: Deque[bool] = deque(maxlen=latency_window)
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.open_until = 0.0
+        self.limited_until = 0.0
+        self.trial_in_flight = False
+        self.in_flight = 0
+        
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.trips = 0
+    
+    @property
+    def p50(self) -> float:
+        """Медиана задержки (0, пока замеров нет)"""
+        return statistics.median(self.latencies) if self.latencies else 0.0
+    
+    @property
+    def error_rate(self) -> float:
+        """Доля ошибок среди последних запросов"""
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+    
+    def available(self, now: float) -> bool:
+        """Можно ли отправить запрос на сервер"""
+        if now < self.limited_until:
+            return False
+        if self.state == "open":
+            if now < self.open_until:
+                return False
+            self.state = "half-open"
+        if self.state == "half-open":
+            return not self.trial_in_flight
+        return True
+    
+    def score(self) -> float:
+        """Оценка для выбора: меньше - лучше"""
+        return self.p50 * (1.0 + 4.0 * self.error_rate) * (1 + self.in_flight * 0.1)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Состояние и счетчики сервера"""
+        return {
+            "state": self.state,
+            "p50": self.p50,
+            "error_rate": self.error_rate,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+            "trips": self.trips,
+        }
+
+
+class BackendPool:
+    """
+    Выбор сервера для запроса
+    
+    Запрос уходит на доступный сервер с наименьшей медианой задержки с
+    поправкой на долю ошибок и текущую загрузку; небольшая доля запросов
+    отправляется на случайный сервер, чтобы замеры не устаревали. После
+    failure_threshold ошибок подряд сервер отключается на cooldown_seconds.
+    """
+    
+    # Доля запросов на случайный доступный сервер
+    EXPLORE_RATIO = 0.05
+    
+    def __init__(
+        self,
+        backends: List[OpenAIBackend],
+        failure_threshold: int,
+        cooldown_seconds: float
+    ):
+        """
+        Args:
+            backends: Серверы пула
+            failure_threshold: Ошибок подряд до отключения сервера
+            cooldown_seconds: Длительность отключения
+        """
+        if not backends:
+            raise ValueError("Пул серверов OpenAI пуст")
+        
+        self.backends = backends
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.failovers = 0
+    
+    @property
+    def single(self) -> bool:
+        return len(self.backends) == 1
+    
+    def select(self, exclude: Iterable[OpenAIBackend] = ()) -> OpenAIBackend:
+        """
+        Выбор сервера для очередного запроса
+        
+        Args:
+            exclude: Серверы, уже не ответившие на этот запрос
+        
+        Returns:
+            Сервер; если доступных нет, тот, что включится раньше всех
+        """
+        now = time.monotonic()
+        excluded = set(exclude)
+        candidates = [
+            backend for backend in self.backends
+            if backend not in excluded and backend.available(now)
+        ]
+        
+        if not candidates:
+            # Лучше попытка на отключенном сервере, чем гарантированный отказ
+            pool = [backend for backend in self.backends if backend not in excluded] or self.backends
+            backend = min(pool, key=lambda b: max(b.open_until, b.limited_until))
+        elif len(candidates) > 1 and random.random() < self.EXPLORE_RATIO:
+            backend = random.choice(candidates)
+        else:
+            backend = min(candidates, key=OpenAIBackend.score)
+        
+        if backend.state == "half-open":
+            backend.trial_in_flight = True
+        if excluded:
+            self.failovers += 1
+        return backend
+    
+    def has_alternative(self, exclude: Iterable[OpenAIBackend]) -> bool:
+        """Есть ли доступный сервер кроме исключенных"""
+        now = time.monotonic()
+        excluded = set(exclude)
+        return any(
+            backend not in excluded and backend.available(now)
+            for backend in self.backends
+        )
+    
+    def time_until_available(self) -> float:
+        """Время в секундах до появления доступного сервера"""
+        now = time.monotonic()
+        if any(backend.available(now) for backend in self.backends):
+            return 0.0
+        return max(0.0, min(max(b.open_until, b.limited_until) for b in self.backends) - now)
+    
+    def record_success(self, backend: OpenAIBackend, latency: float) -> None:
+        """Учет успешного ответа"""
+        backend.requests += 1
+        backend.latencies.append(latency)
+        backend.outcomes.append(True)
+        backend.consecutive_failures = 0
+        backend.trial_in_flight = False
+        if backend.state != "closed":
+            logger.info(f"Сервер OpenAI {backend.name} снова доступен")
+            backend.state = "closed"
+    
+    def record_failure(self, backend: OpenAIBackend, trip: bool = False) -> None:
+        """
+        Учет ошибки сети, таймаута или ошибки сервера
+        
+        Args:
+            backend: Сервер
+            trip: Отключить сервер сразу, не дожидаясь failure_threshold
+                ошибок (неверный ключ или адрес)
+        """
+        backend.requests += 1
+        backend.failures += 1
+        backend.outcomes.append(False)
+        backend.consecutive_failures += 1
+        backend.trial_in_flight = False
+        
+        if trip or backend.state == "half-open" or backend.consecutive_failures >= self.failure_threshold:
+            backend.state = "open"
+            backend.open_until = time.monotonic() + self.cooldown_seconds
+            backend.trips += 1
+            logger.warning(
+                f"Сервер OpenAI {backend.name} отключен на {self.cooldown_seconds:.0f} с "
+                f"после {backend.consecutive_failures} ошибок подряд"
+            )
+    
+    def record_rate_limited(self, backend: OpenAIBackend, delay: Optional[float]) -> None:
+        """Учет ответа 429: сервер исключается из выбора на время паузы"""
+        backend.requests += 1
+        backend.rate_limited += 1
+        backend.trial_in_flight = False
+        backend.limited_until = time.monotonic() + (delay if delay is not None else 1.0)
+    
+    def release_trial(self, backend: OpenAIBackend) -> None:
+        """
+        Снятие пробного запроса без учета результата
+        
+        Вызывается, когда пробный запрос завершился без ответа, по
+        которому можно судить о сервере (отмена, ошибка до отправки):
+        следующий запрос к серверу снова станет пробным.
+        """
+        backend.trial_in_flight = False
+    
+    def stats(self) -> Dict[str, Any]:
+        """Состояние серверов пула"""
+        return {
+            "failovers": self.failovers,
+            "backends": {backend.name: backend.stats() for backend in self.backends},
+        }
@@ -0,0 +1,97 @@
+"""
+Кэш контекстов диалогов в памяти процесса
+"""
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, NamedTuple, Optional
+
+
+class CachedMessage(NamedTuple):
+    """Сообщение контекста вместе с количеством токенов"""
+    role: str
+    content: str
+    tokens: int
+    replaced_tokens: int = 0  # Для сводки: токены сообщений, которые она заменяет
+
+
+class ContextCache:
+    """
+    LRU-кэш контекстов: для каждого пользователя хранится кольцевой буфер
+    последних сообщений, при переполнении вытесняются давно неактивные
+    пользователи
+    """
+    
+    def __init__(self, max_users: int, max_messages: int):
+        """
+        Args:
+            max_users: Максимальное количество пользователей в кэше
+            max_messages: Размер буфера сообщений одного пользователя
+        """
+        self.max_users = max_users
+        self.max_messages = max_messages
+        self._entries: "OrderedDict[int, Deque[CachedMessage]]" = OrderedDict()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, telegram_id: int) -> Optional[List[CachedMessage]]:
+        """
+        Получение контекста пользователя из кэша
+        
+        Args:
+            telegram_id: ID пользователя в Telegram
+        
+        Returns:
+            Копия списка сообщений или None, если пользователя нет в кэше
+        """
+        buffer = self._entries.get(telegram_id)
+        if buffer is None:
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        self._entries.move_to_end(telegram_id)
+        return list(buffer)
+    
+    def put(self, telegram_id: int, messages: List[CachedMessage]) -> None:
+        """
+        Прогрев кэша контекстом, загруженным из БД
+        
+        Args:
+            telegram_id: ID пользователя в Telegram
+            messages: Сообщения в хронологическом порядке
+        """
+        self._entries[telegram_id] = deque(messages, maxlen=self.max_messages)
+        self._entries.move_to_end(telegram_id)
+        
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def append(self, telegram_id: int, message: CachedMessage) -> None:
+        """
+        Сквозная запись нового сообщения
+        
+        Если пользователя нет в кэше, запись пропускается: неполный буфер
+        нельзя выдавать как контекст, он будет загружен из БД при промахе.
+        """
+        buffer = self._entries.get(telegram_id)
+        if buffer is not None:
+            buffer.append(message)
+            self._entries.move_to_end(telegram_id)
+    
+    def invalidate(self, telegram_id: int) -> None:
+        """Удаление контекста пользователя из кэша"""
+        self._entries.pop(telegram_id, None)
+    
+    def stats(self) -> Dict[str, float]:
+        """Счетчики попаданий, промахов и вытеснений"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_users": self.max_users,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,20 +1,214 @@
 """
 Сервис управления контекстом диалогов
 """
-from datetime import datetime, timedelta
-from typing import List, Dict
-from sqlalchemy import select, delete
+import asyncio
+import time
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta
+from typing import Any, List, Dict, Optional, Tuple
+from sqlalchemy import select, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from loguru import logger
 
 from src.config import settings
 from src.database.connection import db_manager
 from src.database.models import User, Message
+from src.metrics import observe_stage
+from src.services.context_cache import CachedMessage, ContextCache
+from src.services.message_archive import MessageArchive
+from src.services.token_counter import count_message_tokens
+from src.services.user_cache import UserCache
+from src.services.write_buffer import MessageWriteBuffer
+
+# Краткое содержание передается модели системным сообщением с этим префиксом
+SUMMARY_PREFIX = "Краткое содержание предыдущей части диалога:\n"
 
 
 class ContextService:
     """Сервис для управления контекстом диалогов пользователей"""
     
+    def __init__(self):
+        self.cleanup_stats: Dict[str, Any] = {
+            "runs": 0,
+            "rows_deleted": 0,
+            "rows_archived": 0,
+            "batches": 0,
+            "lock_time_total": 0.0,
+            "lock_time_max": 0.0,
+            "budget_exhausted": 0,
+            "last_run": None,
+        }
+        self.summary_stats: Dict[str, int] = {
+            "turns": 0,
+            "turns_with_summary": 0,
+            "prompt_tokens_saved": 0,
+        }
+        self.cache = None
+        if settings.context_cache_enabled:
+            self.cache = ContextCache(
+                max_users=settings.context_cache_max_users,
+                max_messages=settings.context_window_rows
+            )
+        self.users = None
+        if settings.user_cache_enabled:
+            self.users = UserCache(
+                max_users=settings.user_cache_max_users,
+                flush_interval=settings.user_activity_flush_seconds
+            )
+        self.write_buffer = None
+        if settings.message_write_behind:
+            self.write_buffer = MessageWriteBuffer(
+                flush_interval=settings.message_flush_interval_ms / 1000,
+                max_rows=settings.message_flush_max_rows
+            )
+        # Архив читается и при выключенном переносе: в нем могут быть
+        # сообщения, перенесенные раньше
+        self.archive = MessageArchive(settings.context_archive_codec)
+    
+    def _consistent_read(self):
+        """Чтение истории, которое видит и незаписанные сообщения буфера"""
+        return self.write_buffer.consistent_read() if self.write_buffer else nullcontext()
+    
+    async def _find_or_create_user(
+        self,
+        session: AsyncSession,
+        telegram_id: int,
+        user_data: Dict[str, Any]
+    ) -> int:
+        """
+        Поиск или создание пользователя в открытой сессии
+        
+        Без кэша пользователей время активности обновляется здесь же, в
+        транзакции; с кэшем его отмечает вызывающий через touch().
+        
+        Returns:
+            Внутренний ID пользователя
+        """
+        result = await session.execute(
+            select(User).where(User.telegram_id == telegram_id)
+        )
+        user = result.scalar_one_or_none()
+        
+        if not user:
+            user = User(
+                telegram_id=telegram_id,
+                username=user_data.get('username'),
+                first_name=user_data.get('first_name'),
+                last_name=user_data.get('last_name')
+            )
+            session.add(user)
+            # Получаем ID пользователя без фиксации транзакции
+            await session.flush()
+            logger.info(f"Создан новый пользователь: {telegram_id}")
+        elif not self.users:
+            user.last_active = datetime.utcnow()
+        
+        return user.id
+    
+    @staticmethod
+    def _count_tokens(content: str) -> int:
+        """Количество токенов сообщения для текущей модели"""
+        return count_message_tokens(content, settings.openai_model)
+    
+    async def _load_entries(
+        self,
+        session: AsyncSession,
+        telegram_id: int
+    ) -> List[CachedMessage]:
+        """
+        Загрузка последних сообщений пользователя из БД
+        
+        При пакетной записи к ним добавляются еще не записанные сообщения
+        из буфера, поэтому вызывать нужно внутри _consistent_read().
+        
+        Args:
+            session: Открытая сессия БД
+            telegram_id: ID пользователя в Telegram
+        
+        Returns:
+            Сообщения в хронологическом порядке
+        """
+        result = await session.execute(
+            select(Message.role, Message.content, Message.token_count, Message.replaced_tokens)
+            .where(Message.telegram_id == telegram_id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(settings.context_window_rows)
+        )
+        
+        # Для сообщений, сохраненных до появления token_count, считаем на лету
+        entries = [
+            CachedMessage(
+                row.role,
+                row.content,
+                row.token_count if row.token_count is not None else self._count_tokens(row.content),
+                row.replaced_tokens or 0
+            )
+            for row in reversed(result.all())
+        ]
+        
+        if self.write_buffer:
+            pending = self.write_buffer.pending_for(telegram_id)
+            if pending:
+                entries.extend(
+                    CachedMessage(row["role"], row["content"], row["token_count"])
+                    for row in pending
+                )
+                entries = entries[-settings.context_window_rows:]
+        
+        return entries
+    
+    @staticmethod
+    def _build_context(entries: List[CachedMessage]) -> List[Dict[str, str]]:
+        """
+        Формирование контекста для OpenAI API
+        
+        В режиме бюджета токенов берутся самые новые сообщения, которые
+        помещаются в бюджет модели; последнее сообщение включается всегда.
+        Краткое содержание старой части диалога передается системным
+        сообщением.
+        
+        Args:
+            entries: Сообщения в хронологическом порядке
+        
+        Returns:
+            Список сообщений в формате для OpenAI API
+        """
+        if settings.context_token_budget:
+            budget = settings.max_prompt_tokens
+            used = 0
+            start = len(entries)
+            
+            while start > 0:
+                tokens = entries[start - 1].tokens
+                if start < len(entries) and used + tokens > budget:
+                    break
+                used += tokens
+                start -= 1
+            
+            entries = entries[start:]
+        
+        return [
+            {"role": "system", "content": SUMMARY_PREFIX + entry.content}
+            if entry.role == "summary"
+            else {"role": entry.role, "content": entry.content}
+            for entry in entries
+        ]
+    
+    def _record_turn(self, entries: List[CachedMessage]) -> None:
+        """Учет токенов промпта, сэкономленных сжатием истории (оценка сверху)"""
+        stats = self.summary_stats
+        stats["turns"] += 1
+        
+        saved = sum(
+            entry.replaced_tokens - entry.tokens
+            for entry in entries
+            if entry.role == "summary"
+        )
+        if saved:
+            stats["turns_with_summary"] += 1
+            stats["prompt_tokens_saved"] += saved
+    
     async def get_or_create_user(self, telegram_id: int, **user_data) -> User:
         """
         Получение или создание пользователя
@@ -44,13 +238,42 @@ class ContextService:
                 session.add(user)
                 await session.commit()
                 logger.info(f"Создан новый пользователь: {telegram_id}")
+            elif self.users:
+                # Время активности записывается пакетом
+                self.users.touch(user.id)
             else:
                 # Обновляем время последней активности
                 user.last_active = datetime.utcnow()
                 await session.commit()
             
+            if self.users:
+                self.users.put(telegram_id, user.id)
             return user
     
+    async def ensure_user(self, telegram_id: int, **user_data) -> int:
+        """
+        Внутренний ID пользователя с созданием записи при первом обращении
+        
+        При попадании в кэш пользователей обращения к БД нет.
+        
+        Args:
+            telegram_id: ID пользователя в Telegram
+            **user_data: Дополнительные данные пользователя
+        
+        Returns:
+            Внутренний ID пользователя
+        """
+        user_id = self.users.get(telegram_id) if self.users else None
+        if user_id is None:
+            async with db_manager.get_session() as session:
+                user_id = await self._find_or_create_user(session, telegram_id, user_data)
+            if self.users:
+                self.users.put(telegram_id, user_id)
+        
+        if self.users:
+            self.users.touch(user_id)
+        return user_id
+    
     async def add_message(
         self,
         telegram_id: int,
@@ -65,28 +288,160 @@ class ContextService:
             role: Роль отправителя ('user' или 'assistant')
             content: Текст сообщения
         """
-        async with db_manager.get_session() as session:
-            # Получаем пользователя
-            result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
-            )
-            user = result.scalar_one_or_none()
+        user_id = self.users.get(telegram_id) if self.users else None
+        if user_id is None:
+            async with db_manager.get_session() as session:
+                # Получаем пользователя
+                result = await session.execute(
+                    select(User.id).where(User.telegram_id == telegram_id)
+                )
+                user_id = result.scalar_one_or_none()
             
-            if not user:
+            if user_id is None:
                 logger.error(f"Пользователь {telegram_id} не найден")
                 return
+            if self.users:
+                self.users.put(telegram_id, user_id)
+        
+        await self.append_message(user_id, telegram_id, role, content)
+    
+    async def begin_turn(
+        self,
+        telegram_id: int,
+        contents: List[str],
+        **user_data
+    ) -> Tuple[int, List[Dict[str, str]]]:
+        """
+        Начало хода диалога в одной транзакции: создание или обновление
+        пользователя, сохранение его сообщений и загрузка контекста
+        
+        Args:
+            telegram_id: ID пользователя в Telegram
+            contents: Тексты сообщений пользователя в порядке получения
+            **user_data: Дополнительные данные пользователя
+        
+        Returns:
+            Внутренний ID пользователя и контекст в формате для OpenAI API
+        """
+        cached = self.cache.get(telegram_id) if self.cache else None
+        user_id = self.users.get(telegram_id) if self.users else None
+        new_entries = [
+            CachedMessage("user", content, self._count_tokens(content))
+            for content in contents
+        ]
+        
+        started = time.perf_counter()
+        load_time = 0.0
+        
+        # Пользователь и контекст в кэше, сообщения уходят в буфер: БД не нужна
+        needs_session = user_id is None or cached is None or not self.write_buffer
+        
+        if needs_session:
+            async with self._consistent_read() if cached is None else nullcontext():
+                async with db_manager.get_session() as session:
+                    if user_id is None:
+                        found_id = await self._find_or_create_user(session, telegram_id, user_data)
+                    else:
+                        found_id = user_id
+                    
+                    if not self.write_buffer:
+                        session.add_all([
+                            Message(
+                                user_id=found_id,
+                                telegram_id=telegram_id,
+                                role=entry.role,
+                                content=entry.content,
+                                token_count=entry.tokens
+                            )
+                            for entry in new_entries
+                        ])
+                    
+                    if cached is None:
+                        # Новые сообщения попадут в выборку благодаря autoflush
+                        load_started = time.perf_counter()
+                        entries = await self._load_entries(session, telegram_id)
+                        load_time = time.perf_counter() - load_started
+                        if self.write_buffer:
+                            entries = (entries + new_entries)[-settings.context_window_rows:]
             
-            # Создаем сообщение
-            message = Message(
-                user_id=user.id,
+            # ID нового пользователя запоминаем только после фиксации транзакции
+            if self.users and user_id is None:
+                self.users.put(telegram_id, found_id)
+            user_id = found_id
+        
+        if self.users:
+            self.users.touch(user_id)
+        
+        # При пакетной записи сообщения ставятся в буфер после сохранения пользователя
+        if self.write_buffer:
+            for entry in new_entries:
+                self.write_buffer.add(
+                    user_id=user_id,
+                    telegram_id=telegram_id,
+                    role=entry.role,
+                    content=entry.content,
+                    token_count=entry.tokens
+                )
+        
+        # Сохранение пользователя и его сообщений идет в той же транзакции
+        observe_stage("user_upsert", time.perf_counter() - started - load_time)
+        observe_stage("context_load", load_time)
+        
+        # Кэш обновляем только после успешной фиксации транзакции
+        if cached is not None:
+            for entry in new_entries:
+                self.cache.append(telegram_id, entry)
+            entries = (cached + new_entries)[-settings.context_window_rows:]
+        elif self.cache:
+            self.cache.put(telegram_id, entries)
+        
+        self._record_turn(entries)
+        context = self._build_context(entries)
+        logger.debug("Начат ход диалога пользователя {}: {} сообщений в контексте", telegram_id, len(context))
+        return user_id, context
+    
+    async def append_message(
+        self,
+        user_id: int,
+        telegram_id: int,
+        role: str,
+        content: str
+    ) -> None:
+        """
+        Добавление сообщения без повторного поиска пользователя
+        
+        Args:
+            user_id: Внутренний ID пользователя (из begin_turn)
+            telegram_id: ID пользователя в Telegram
+            role: Роль отправителя ('user' или 'assistant')
+            content: Текст сообщения
+        """
+        tokens = self._count_tokens(content)
+        
+        if self.write_buffer:
+            self.write_buffer.add(
+                user_id=user_id,
                 telegram_id=telegram_id,
                 role=role,
-                content=content
+                content=content,
+                token_count=tokens
             )
-            session.add(message)
-            await session.commit()
-            
-            logger.debug(f"Добавлено сообщение от {role} для пользователя {telegram_id}")
+        else:
+            async with db_manager.get_session() as session:
+                await session.execute(
+                    insert(Message).values(
+                        user_id=user_id,
+                        telegram_id=telegram_id,
+                        role=role,
+                        content=content,
+                        token_count=tokens
+                    )
+                )
+        
+        if self.cache:
+            self.cache.append(telegram_id, CachedMessage(role, content, tokens))
+        
+        logger.debug("Добавлено сообщение от {} для пользователя {}", role, telegram_id)
     
     async def get_context(self, telegram_id: int) -> List[Dict[str, str]]:
         """
@@ -98,51 +453,297 @@ class ContextService:
         Returns:
             Список сообщений в формате для OpenAI API
         """
+        if self.cache:
+            cached = self.cache.get(telegram_id)
+            if cached is not None:
+                return self._build_context(cached)
+        
+        async with self._consistent_read():
+            async with db_manager.get_session() as session:
+                # Получаем последние сообщения пользователя
+                entries = await self._load_entries(session, telegram_id)
+        
+        if self.cache:
+            self.cache.put(telegram_id, entries)
+        
+        context = self._build_context(entries)
+        logger.debug("Загружен контекст для пользователя {}: {} сообщений", telegram_id, len(context))
+        return context
+    
+    async def load_history(self, telegram_id: int) -> List[Any]:
+        """
+        Загрузка сообщений контекста вместе с ID и временем создания
+        
+        Args:
+            telegram_id: ID пользователя в Telegram
+        
+        Returns:
+            Строки с полями id, user_id, role, content, token_count,
+            created_at в хронологическом порядке
+        """
+        # Сжатию нужны ID сообщений, поэтому буфер сначала записывается
+        if self.write_buffer:
+            await self.write_buffer.flush()
+        
         async with db_manager.get_session() as session:
-            # Получаем последние сообщения пользователя
             result = await session.execute(
-                select(Message)
+                select(
+                    Message.id,
+                    Message.user_id,
+                    Message.role,
+                    Message.content,
+                    Message.token_count,
+                    Message.created_at
+                )
                 .where(Message.telegram_id == telegram_id)
-                .order_by(Message.created_at.desc())
-                .limit(settings.max_context_messages)
+                .order_by(Message.created_at.desc(), Message.id.desc())
+                .limit(settings.context_window_rows)
             )
-            messages = result.scalars().all()
-            
-            # Преобразуем в формат OpenAI и разворачиваем в правильном порядке
-            context = [
-                {"role": msg.role, "content": msg.content}
-                for msg in reversed(messages)
-            ]
+            return list(reversed(result.all()))
+    
+    async def replace_with_summary(
+        self,
+        telegram_id: int,
+        messages: List[Any],
+        summary: str
+    ) -> bool:
+        """
+        Замена сообщений кратким содержанием в одной транзакции
+        
+        Сводка получает время последнего замененного сообщения и занимает
+        его место в истории. Если часть сообщений уже удалена (очистка
+        контекста), замена отменяется.
+        
+        Args:
+            telegram_id: ID пользователя в Telegram
+            messages: Заменяемые строки из load_history
+            summary: Текст краткого содержания
+        
+        Returns:
+            True, если сообщения заменены
+        """
+        ids = [message.id for message in messages]
+        tokens = self._count_tokens(SUMMARY_PREFIX + summary)
+        replaced_tokens = sum(
+            message.token_count if message.token_count is not None else self._count_tokens(message.content)
+            for message in messages
+        )
+        
+        async with db_manager.get_session() as session:
+            result = await session.execute(
+                delete(Message).where(Message.id.in_(ids))
+            )
+            if result.rowcount != len(ids):
+                await session.rollback()
+                return False
             
-            logger.debug(f"Загружен контекст для пользователя {telegram_id}: {len(context)} сообщений")
-            return context
+            session.add(Message(
+                user_id=messages[-1].user_id,
+                telegram_id=telegram_id,
+                role="summary",
+                content=summary,
+                token_count=tokens,
+                replaced_tokens=replaced_tokens,
+                created_at=messages[-1].created_at
+            ))
+        
+        if self.cache:
+            self.cache.invalidate(telegram_id)
+        
+        logger.debug(
+            f"История пользователя {telegram_id} сжата: {len(ids)} сообщений, "
+            f"{replaced_tokens} -> {tokens} токенов"
+        )
+        return True
     
     async def clear_context(self, telegram_id: int) -> None:
         """
         Очистка контекста диалога пользователя
         
+        Архив сообщений пользователя не затрагивается.
+        
         Args:
             telegram_id: ID пользователя в Telegram
         """
-        async with db_manager.get_session() as session:
-            await session.execute(
-                delete(Message).where(Message.telegram_id == telegram_id)
-            )
-            await session.commit()
-            logger.info(f"Контекст пользователя {telegram_id} очищен")
+        async with self._consistent_read():
+            async with db_manager.get_session() as session:
+                await session.execute(
+                    delete(Message).where(Message.telegram_id == telegram_id)
+                )
+                await session.commit()
+            
+            if self.write_buffer:
+                self.write_buffer.discard(telegram_id)
+        
+        if self.cache:
+            self.cache.invalidate(telegram_id)
+        
+        logger.info(f"Контекст пользователя {telegram_id} очищен")
     
-    async def cleanup_old_contexts(self) -> None:
-        """Очистка устаревших контекстов"""
+    async def cleanup_old_contexts(self) -> Dict[str, Any]:
+        """
+        Очистка устаревших контекстов небольшими пакетами
+        
+        Каждый пакет удаляется в отдельной короткой транзакции, между
+        пакетами управление возвращается циклу событий. Если бюджет времени
+        исчерпан, оставшиеся сообщения удалит следующий запуск.
+        
+        С CONTEXT_ARCHIVE_ENABLED сообщения перед удалением переносятся в
+        архив в той же транзакции. Пакеты тогда выбираются по индексу
+        (telegram_id, created_at): в пакет попадают целые дни пользователей,
+        и сегмент дня почти всегда пишется один раз, а не дополняется
+        каждым пакетом.
+        
+        Returns:
+            Статистика текущего запуска
+        """
         cutoff_date = datetime.utcnow() - timedelta(hours=settings.context_ttl_hours)
+        started = time.monotonic()
+        archiving = settings.context_archive_enabled
+        run = {
+            "rows_deleted": 0,
+            "rows_archived": 0,
+            "batches": 0,
+            "lock_time_total": 0.0,
+            "lock_time_max": 0.0,
+            "budget_exhausted": False,
+        }
+        touched_users = set()
+        next_telegram_id = 0
         
-        async with db_manager.get_session() as session:
-            result = await session.execute(
-                delete(Message).where(Message.created_at < cutoff_date)
+        while True:
+            if time.monotonic() - started >= settings.cleanup_time_budget_seconds:
+                run["budget_exhausted"] = True
+                break
+            
+            if archiving:
+                # Обход пользователей по порядку; перенесенные строки удаляются,
+                # поэтому следующий пакет продолжает с последнего пользователя
+                query = (
+                    select(
+                        Message.id, Message.user_id, Message.telegram_id, Message.role,
+                        Message.content, Message.token_count, Message.replaced_tokens,
+                        Message.created_at
+                    )
+                    .where(Message.telegram_id >= next_telegram_id, Message.created_at < cutoff_date)
+                    .order_by(Message.telegram_id, Message.created_at)
+                    .limit(settings.cleanup_batch_size)
+                )
+            else:
+                # Самые старые сообщения находим по индексу created_at
+                query = (
+                    select(Message.id, Message.telegram_id)
+                    .where(Message.created_at < cutoff_date)
+                    .order_by(Message.created_at)
+                    .limit(settings.cleanup_batch_size)
+                )
+            if settings.worker_count > 1:
+                # Воркер удаляет только сообщения своих пользователей (см. shard_for):
+                # их контексты лежат в его кэше
+                query = query.where(Message.telegram_id % settings.worker_count == settings.worker_index)
+            
+            async with db_manager.get_session() as session:
+                result = await session.execute(query)
+                rows = result.all()
+                
+                if rows and archiving:
+                    # Сжатие идет до первой записи: archive() только готовит
+                    # сегменты в сессии, ничего не записывая
+                    run["rows_archived"] += await self.archive.archive(session, rows)
+                
+                if rows:
+                    # Блокировка на запись берется с первой записью (сегменты
+                    # архива или DELETE) и держится до commit
+                    lock_started = time.perf_counter()
+                    if archiving:
+                        await session.flush()
+                    await session.execute(
+                        delete(Message).where(Message.id.in_([row.id for row in rows]))
+                    )
+            
+            if not rows:
+                break
+            
+            lock_time = time.perf_counter() - lock_started
+            run["rows_deleted"] += len(rows)
+            run["batches"] += 1
+            run["lock_time_total"] += lock_time
+            run["lock_time_max"] = max(run["lock_time_max"], lock_time)
+            touched_users.update(row.telegram_id for row in rows)
+            next_telegram_id = rows[-1].telegram_id
+            
+            if len(rows) < settings.cleanup_batch_size:
+                break
+            
+            # Даем обработать сообщения пользователей между пакетами
+            await asyncio.sleep(settings.cleanup_batch_pause_seconds)
+        
+        if archiving and settings.context_archive_retention_days > 0:
+            run["segments_expired"] = await self.archive.expire(
+                datetime.utcnow().date() - timedelta(days=settings.context_archive_retention_days)
             )
-            await session.commit()
+        
+        run["duration"] = time.monotonic() - started
+        
+        # Буферы кэша могли содержать удаленные сообщения
+        if self.cache:
+            for telegram_id in touched_users:
+                self.cache.invalidate(telegram_id)
+        
+        stats = self.cleanup_stats
+        stats["runs"] += 1
+        stats["rows_deleted"] += run["rows_deleted"]
+        stats["rows_archived"] += run["rows_archived"]
+        stats["batches"] += run["batches"]
+        stats["lock_time_total"] += run["lock_time_total"]
+        stats["lock_time_max"] = max(stats["lock_time_max"], run["lock_time_max"])
+        stats["budget_exhausted"] += int(run["budget_exhausted"])
+        stats["last_run"] = run
+        
+        if run["rows_deleted"] > 0:
+            logger.info(
+                f"{'Перенесено в архив' if archiving else 'Удалено'} {run['rows_deleted']} устаревших сообщений за {run['batches']} пакетов, "
+                f"блокировка {run['lock_time_total']:.3f} с (макс. {run['lock_time_max']:.3f} с)"
+            )
+        if run["budget_exhausted"]:
+            logger.info("Бюджет времени очистки исчерпан, продолжение при следующем запуске")
+        
+        if self.cache:
+            logger.info(f"Статистика кэша контекстов: {self.cache.stats()}")
+        if self.users:
+            logger.info(f"Статистика кэша пользователей: {self.users.stats()}")
+        if self.write_buffer:
+            logger.info(f"Статистика пакетной записи сообщений: {self.write_buffer.stats()}")
+        if archiving:
+            logger.info(f"Статистика архива сообщений: {self.archive.stats()}")
+        
+        return run
+    
+    async def load_archived_history(
+        self,
+        telegram_id: int,
+        start: Optional[date] = None,
+        end: Optional[date] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Восстановление архивной истории пользователя по запросу
+        
+        Args:
+            telegram_id: ID пользователя в Telegram
+            start: Первый день (включительно)
+            end: Последний день (включительно)
             
-            if result.rowcount > 0:
-                logger.info(f"Удалено {result.rowcount} устаревших сообщений")
+        Returns:
+            Перенесенные в архив сообщения в хронологическом порядке
+        """
+        return await self.archive.load(telegram_id, start, end)
+    
+    async def close(self) -> None:
+        """Запись сообщений и времени активности, оставшихся в буферах"""
+        if self.write_buffer:
+            await self.write_buffer.close()
+        if self.users:
+            await self.users.close()
 
 
 # Глобальный экземпляр сервиса
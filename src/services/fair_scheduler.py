@@ -0,0 +1,224 @@
+"""
+Справедливое распределение одновременных запросов к OpenAI между пользователями
+"""
+import asyncio
+import heapq
+import itertools
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+
+class _Waiter:
+    """Запрос, ожидающий слота"""
+    
+    __slots__ = ("tag", "future")
+    
+    def __init__(self, tag: float, future: asyncio.Future):
+        self.tag = tag
+        self.future = future
+
+
+class _Flow:
+    """Очередь запросов одного пользователя"""
+    
+    __slots__ = ("weight", "finish", "in_flight", "waiters", "scheduled")
+    
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.finish = 0.0
+        self.in_flight = 0
+        self.waiters: Deque[_Waiter] = deque()
+        self.scheduled = False
+
+
+class FairScheduler:
+    """
+    Взвешенная справедливая очередь (WFQ) за слоты одновременных запросов
+    
+    Каждый пользователь - отдельный поток со своей очередью. Запрос
+    получает виртуальное время окончания: начало (виртуальное время
+    системы или окончание предыдущего запроса потока) плюс стоимость,
+    деленная на вес пользователя. Освободившийся слот достается запросу
+    с наименьшим временем окончания, поэтому пользователь с длинными
+    промптами или частыми запросами продвигается медленнее остальных,
+    а пользователь с весом 2 получает вдвое большую долю. Виртуальное
+    время системы - метка последнего допущенного запроса (SCFQ): поток,
+    простаивавший какое-то время, не копит кредит.
+    
+    Ключ None - общий поток без ограничения одновременных запросов.
+    При fair=False временем окончания служит номер поступления запроса:
+    слоты выдаются в порядке очереди, но ограничение одновременных
+    запросов пользователя по-прежнему действует.
+    """
+    
+    def __init__(
+        self,
+        slots: int,
+        max_in_flight_per_key: int = 0,
+        weight_for: Optional[Callable[[Hashable], float]] = None,
+        max_tracked_keys: int = 10000,
+        fair: bool = True
+    ):
+        """
+        Args:
+            slots: Количество одновременных запросов
+            max_in_flight_per_key: Максимум одновременных запросов одного
+                ключа (0 - без ограничения)
+            weight_for: Вес ключа (по умолчанию 1)
+            max_tracked_keys: Сколько ключей хранить в статистике ожидания
+            fair: Взвешенная очередь (False - в порядке поступления)
+        """
+        self.slots = slots
+        self.max_in_flight_per_key = max_in_flight_per_key
+        self.weight_for = weight_for or (lambda key: 1.0)
+        self.max_tracked_keys = max_tracked_keys
+        self.fair = fair
+        
+        self.virtual_time = 0.0
+        self.in_use = 0
+        self._flows: Dict[Hashable, _Flow] = {}
+        self._ready: List[Tuple[float, int, Hashable, _Waiter]] = []
+        self._sequence = itertools.count()
+        self._arrivals = itertools.count()
+        
+        self.waiting = 0
+        self.capped = 0
+        self._waits: "OrderedDict[Hashable, List[float]]" = OrderedDict()
+    
+    def _cap_reached(self, key: Hashable, flow: _Flow) -> bool:
+        return key is not None and 0 < self.max_in_flight_per_key <= flow.in_flight
+    
+    def _schedule(self, key: Hashable, flow: _Flow) -> None:
+        """Постановка первого запроса потока в кучу кандидатов"""
+        if flow.scheduled or not flow.waiters or self._cap_reached(key, flow):
+            return
+        flow.scheduled = True
+        heapq.heappush(self._ready, (flow.waiters[0].tag, next(self._sequence), key, flow.waiters[0]))
+    
+    def _dispatch(self) -> None:
+        """Раздача свободных слотов запросам с наименьшим временем окончания"""
+        while self.in_use < self.slots and self._ready:
+            _, _, key, waiter = heapq.heappop(self._ready)
+            flow = self._flows[key]
+            flow.scheduled = False
+            if not flow.waiters or flow.waiters[0] is not waiter:
+                # Запрос отменен, пока ждал; в кучу ставится новый первый
+                self._schedule(key, flow)
+                self._forget(key, flow)
+                continue
+            
+            flow.waiters.popleft()
+            self._grant(flow, waiter.tag)
+            waiter.future.set_result(None)
+            self._schedule(key, flow)
+    
+    def _grant(self, flow: _Flow, tag: float) -> None:
+        self.virtual_time = max(self.virtual_time, tag)
+        self.in_use += 1
+        flow.in_flight += 1
+    
+    async def acquire(self, key: Hashable, cost: float) -> None:
+        """
+        Ожидание слота
+        
+        Args:
+            key: Пользователь (None - общий поток)
+            cost: Оценка стоимости запроса (токены)
+        """
+        flow = self._flows.get(key)
+        if flow is None:
+            flow = self._flows[key] = _Flow(self.weight_for(key))
+        
+        if self.fair:
+            tag = max(self.virtual_time, flow.finish) + max(cost, 1) / flow.weight
+        else:
+            tag = float(next(self._arrivals))
+        flow.finish = tag
+        
+        if self.in_use < self.slots and not flow.waiters and not self._cap_reached(key, flow):
+            self._grant(flow, tag)
+            return
+        
+        if self.in_use < self.slots:
+            self.capped += 1
+        waiter = _Waiter(tag, asyncio.get_running_loop().create_future())
+        flow.waiters.append(waiter)
+        self._schedule(key, flow)
+        self.waiting += 1
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Слот выдан одновременно с отменой
+                self.release(key)
+            else:
+                flow.waiters.remove(waiter)
+                self._forget(key, flow)
+            raise
+        finally:
+            self.waiting -= 1
+    
+    def release(self, key: Hashable) -> None:
+        """Освобождение слота после завершения запроса"""
+        flow = self._flows[key]
+        flow.in_flight -= 1
+        self.in_use -= 1
+        self._schedule(key, flow)
+        self._dispatch()
+        self._forget(key, flow)
+    
+    def charge(self, key: Hashable, extra_cost: float) -> None:
+        """
+        Поправка на фактическую стоимость выполняющегося запроса
+        
+        Разница между фактическим расходом и оценкой сдвигает время
+        окончания потока, то есть учитывается в следующих запросах.
+        """
+        flow = self._flows.get(key)
+        if flow is not None and self.fair:
+            flow.finish += extra_cost / flow.weight
+    
+    def _forget(self, key: Hashable, flow: _Flow) -> None:
+        """Удаление состояния потока без запросов"""
+        if not flow.in_flight and not flow.waiters and not flow.scheduled:
+            del self._flows[key]
+    
+    def record_wait(self, key: Hashable, waited: float) -> None:
+        """Учет времени ожидания запроса пользователя"""
+        entry = self._waits.get(key)
+        if entry is None:
+            entry = self._waits[key] = [0, 0.0, 0.0]
+            if len(self._waits) > self.max_tracked_keys:
+                self._waits.popitem(last=False)
+        else:
+            self._waits.move_to_end(key)
+        entry[0] += 1
+        entry[1] += waited
+        entry[2] = max(entry[2], waited)
+    
+    def wait_stats(self, key: Hashable) -> Dict[str, float]:
+        """Время ожидания запросов пользователя"""
+        count, total, longest = self._waits.get(key, (0, 0.0, 0.0))
+        return {
+            "requests": count,
+            "wait_time_avg": total / count if count else 0.0,
+            "wait_time_max": longest,
+        }
+    
+    def stats(self, top: int = 5) -> Dict[str, Any]:
+        """Состояние очереди и пользователи с наибольшим средним ожиданием"""
+        slowest = sorted(
+            self._waits.items(),
+            key=lambda item: item[1][1] / item[1][0],
+            reverse=True
+        )[:top]
+        return {
+            "waiting": self.waiting,
+            "in_use": self.in_use,
+            "flows": len(self._flows),
+            "backlogged_flows": sum(1 for flow in self._flows.values() if flow.waiters),
+            "capped": self.capped,
+            "slowest_users": {
+                key: round(total / count, 3) for key, (count, total, _) in slowest
+            },
+        }
@@ -0,0 +1,240 @@
+"""
+Архив устаревших сообщений: сжатые сегменты по пользователю и дню
+"""
+import asyncio
+import gzip
+import json
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.connection import db_manager
+from src.database.models import ArchiveSegment
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - зависимость опциональна
+    zstandard = None
+
+
+CODECS = ("gzip", "zstd")
+
+# Уровни сжатия: сегменты пишутся в фоне, читаются редко
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 9
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    """Сжатие содержимого сегмента"""
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def decompress(payload: bytes, codec: str) -> bytes:
+    """Распаковка содержимого сегмента"""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Сегмент архива сжат zstd, но пакет zstandard не установлен")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return gzip.decompress(payload)
+
+
+def _encode(messages: List[Dict[str, Any]]) -> bytes:
+    return json.dumps(messages, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _message(row: Any) -> Dict[str, Any]:
+    """Строка messages в виде записи сегмента"""
+    return {
+        "id": row.id,
+        "role": row.role,
+        "content": row.content,
+        "token_count": row.token_count,
+        "replaced_tokens": row.replaced_tokens,
+        "created_at": row.created_at.isoformat(),
+    }
+
+
+class MessageArchive:
+    """
+    Холодное хранилище истории в таблице message_archive
+    
+    Очистка контекстов переносит устаревшие сообщения сюда вместо
+    удаления: сообщения пользователя за день хранятся одним сегментом,
+    JSON со сжатием gzip или zstd. Если сегмент дня уже есть (следующий
+    запуск очистки того же дня), он распаковывается, дополняется и
+    сжимается заново. Сжатие выполняется в отдельном потоке до первой
+    записи в транзакции, поэтому не удлиняет блокировку БД.
+    """
+    
+    def __init__(self, codec: str = "gzip"):
+        """
+        Args:
+            codec: Сжатие новых сегментов: gzip или zstd
+        """
+        if codec not in CODECS:
+            logger.warning(f"Неизвестное сжатие архива {codec!r}, используется gzip")
+            codec = "gzip"
+        if codec == "zstd" and zstandard is None:
+            logger.warning("Пакет zstandard не установлен, архив сжимается gzip")
+            codec = "gzip"
+        self.codec = codec
+        
+        self.messages_archived = 0
+        self.segments_created = 0
+        self.segments_merged = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.compress_time_total = 0.0
+        self.reads = 0
+        self.read_time_total = 0.0
+    
+    def _build_segments(
+        self,
+        groups: Dict[Tuple[int, date], List[Dict[str, Any]]],
+        existing: Dict[Tuple[int, date], Tuple[bytes, str]]
+    ) -> Dict[Tuple[int, date], Tuple[List[Dict[str, Any]], bytes, int]]:
+        """Объединение с существующими сегментами и сжатие (в фоновом потоке)"""
+        built = {}
+        for key, messages in groups.items():
+            if key in existing:
+                payload, codec = existing[key]
+                messages = json.loads(decompress(payload, codec)) + messages
+                messages.sort(key=lambda message: (message["created_at"], message["id"]))
+            raw = _encode(messages)
+            built[key] = (messages, compress(raw, self.codec), len(raw))
+        return built
+    
+    async def archive(self, session: AsyncSession, rows: Sequence[Any]) -> int:
+        """
+        Перенос строк messages в сегменты архива в открытой сессии
+        
+        Строки из messages удаляет вызывающий в той же транзакции, чтобы
+        перенос был атомарным. Изменения сегментов записываются при
+        следующем обращении сессии к БД (autoflush) или при фиксации.
+        
+        Args:
+            session: Открытая сессия БД
+            rows: Строки с полями id, user_id, telegram_id, role, content,
+                token_count, replaced_tokens, created_at
+        
+        Returns:
+            Количество перенесенных сообщений
+        """
+        if not rows:
+            return 0
+        
+        groups: Dict[Tuple[int, date], List[Dict[str, Any]]] = defaultdict(list)
+        user_ids: Dict[int, int] = {}
+        for row in rows:
+            groups[(row.telegram_id, row.created_at.date())].append(_message(row))
+            user_ids[row.telegram_id] = row.user_id
+        
+        result = await session.execute(
+            select(ArchiveSegment)
+            .where(tuple_(ArchiveSegment.telegram_id, ArchiveSegment.day).in_(list(groups)))
+        )
+        segments = {(segment.telegram_id, segment.day): segment for segment in result.scalars()}
+        existing = {key: (segment.payload, segment.codec) for key, segment in segments.items()}
+        
+        started = time.perf_counter()
+        built = await asyncio.to_thread(self._build_segments, groups, existing)
+        self.compress_time_total += time.perf_counter() - started
+        
+        for (telegram_id, day), (messages, payload, raw_bytes) in built.items():
+            segment = segments.get((telegram_id, day))
+            if segment is None:
+                segment = ArchiveSegment(user_id=user_ids[telegram_id], telegram_id=telegram_id, day=day)
+                session.add(segment)
+                self.segments_created += 1
+            else:
+                self.compressed_bytes -= len(segment.payload)
+                self.raw_bytes -= segment.raw_bytes
+                self.segments_merged += 1
+            
+            segment.codec = self.codec
+            segment.payload = payload
+            segment.raw_bytes = raw_bytes
+            segment.message_count = len(messages)
+            segment.first_created_at = datetime.fromisoformat(messages[0]["created_at"])
+            segment.last_created_at = datetime.fromisoformat(messages[-1]["created_at"])
+            self.raw_bytes += raw_bytes
+            self.compressed_bytes += len(payload)
+        
+        self.messages_archived += len(rows)
+        return len(rows)
+    
+    async def load(
+        self,
+        telegram_id: int,
+        start: Optional[date] = None,
+        end: Optional[date] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Архивная история пользователя
+        
+        Args:
+            telegram_id: ID пользователя в Telegram
+            start: Первый день (включительно), по умолчанию с начала архива
+            end: Последний день (включительно), по умолчанию до конца архива
+        
+        Returns:
+            Сообщения с полями id, role, content, token_count,
+            replaced_tokens, created_at в хронологическом порядке
+        """
+        started = time.perf_counter()
+        query = select(ArchiveSegment.payload, ArchiveSegment.codec).where(
+            ArchiveSegment.telegram_id == telegram_id
+        )
+        if start is not None:
+            query = query.where(ArchiveSegment.day >= start)
+        if end is not None:
+            query = query.where(ArchiveSegment.day <= end)
+        
+        async with db_manager.get_session() as session:
+            result = await session.execute(query.order_by(ArchiveSegment.day))
+            segments = result.all()
+        
+        messages = []
+        for segment in segments:
+            for message in json.loads(decompress(segment.payload, segment.codec)):
+                message["created_at"] = datetime.fromisoformat(message["created_at"])
+                messages.append(message)
+        
+        self.reads += 1
+        self.read_time_total += time.perf_counter() - started
+        return messages
+    
+    async def expire(self, before: date) -> int:
+        """
+        Удаление сегментов старше срока хранения архива
+        
+        Returns:
+            Количество удаленных сегментов
+        """
+        async with db_manager.get_session() as session:
+            result = await session.execute(
+                delete(ArchiveSegment).where(ArchiveSegment.day < before)
+            )
+            return result.rowcount
+    
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики переноса в архив и чтения"""
+        return {
+            "codec": self.codec,
+            "messages_archived": self.messages_archived,
+            "segments_created": self.segments_created,
+            "segments_merged": self.segments_merged,
+            "raw_bytes": self.raw_bytes,
+            "compressed_bytes": self.compressed_bytes,
+            "ratio": self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0.0,
+            "compress_time_total": self.compress_time_total,
+            "reads": self.reads,
+            "read_time_total": self.read_time_total,
+        }
@@ -0,0 +1,147 @@
+"""
+Очередь входящих сообщений пользователей
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from loguru import logger
+
+from src.metrics import observe_stage
+
+
+class UserMessageQueue:
+    """
+    Последовательная обработка сообщений каждого пользователя
+    
+    Сообщения одного пользователя, пришедшие с интервалом меньше окна
+    ожидания, объединяются в одну пачку и обрабатываются одним вызовом.
+    Пачки одного пользователя обрабатываются строго по очереди, разные
+    пользователи обрабатываются параллельно.
+    """
+    
+    def __init__(
+        self,
+        processor: Callable[[int, List[Any]], Awaitable[None]],
+        debounce_seconds: float,
+        max_delay_seconds: float,
+        max_pending: int
+    ):
+        """
+        Args:
+            processor: Обработчик пачки сообщений пользователя
+            debounce_seconds: Окно ожидания следующего сообщения
+            max_delay_seconds: Максимальная задержка первого сообщения пачки
+            max_pending: Максимум ожидающих сообщений одного пользователя
+        """
+        self.processor = processor
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.max_pending = max_pending
+        
+        self._pending: Dict[int, List[Any]] = {}
+        self._first_queued: Dict[int, float] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        
+        # Сообщения, ожидающие обработки, и сообщения выполняющихся пачек
+        self.queued = 0
+        self.in_progress = 0
+        
+        self.submitted = 0
+        self.batches = 0
+        self.coalesced = 0
+        self.rejected = 0
+    
+    def submit(self, key: int, item: Any) -> bool:
+        """
+        Постановка сообщения в очередь пользователя
+        
+        Args:
+            key: ID пользователя
+            item: Сообщение для обработчика
+        
+        Returns:
+            False, если очередь пользователя переполнена
+        """
+        pending = self._pending.setdefault(key, [])
+        if len(pending) >= self.max_pending:
+            self.rejected += 1
+            return False
+        
+        if not pending:
+            self._first_queued[key] = time.perf_counter()
+        pending.append(item)
+        self.queued += 1
+        self.submitted += 1
+        
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._drain(key))
+        return True
+    
+    async def _wait_for_quiet(self, key: int) -> None:
+        """Ожидание паузы в сообщениях пользователя"""
+        started = time.monotonic()
+        while True:
+            count = len(self._pending[key])
+            await asyncio.sleep(self.debounce_seconds)
+            
+            if len(self._pending[key]) == count:
+                return
+            if time.monotonic() - started >= self.max_delay_seconds:
+                return
+    
+    async def _drain(self, key: int) -> None:
+        """Обработка очереди пользователя до ее опустошения"""
+        try:
+            while self._pending.get(key):
+                if self.debounce_seconds > 0:
+                    await self._wait_for_quiet(key)
+                
+                batch = self._pending[key]
+                self._pending[key] = []
+                self.queued -= len(batch)
+                observe_stage("queue_wait", time.perf_counter() - self._first_queued.pop(key))
+                self.batches += 1
+                self.coalesced += len(batch) - 1
+                
+                self.in_progress += len(batch)
+                try:
+                    await self.processor(key, batch)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки очереди пользователя {key}: {e}")
+                finally:
+                    self.in_progress -= len(batch)
+        finally:
+            self.queued -= len(self._pending.pop(key, None) or ())
+            self._first_queued.pop(key, None)
+            self._workers.pop(key, None)
+    
+    def is_busy(self, key: int) -> bool:
+        """Есть ли у пользователя ожидающие или обрабатываемые сообщения"""
+        return key in self._workers
+    
+    def backlog(self) -> int:
+        """Принятые и еще не обработанные сообщения (ожидающие и выполняющиеся)"""
+        return self.queued + self.in_progress
+    
+    def stats(self) -> Dict[str, float]:
+        """Счетчики очереди"""
+        return {
+            "active_users": len(self._workers),
+            "pending": self.queued,
+            "in_progress": self.in_progress,
+            "submitted": self.submitted,
+            "batches": self.batches,
+            "rejected": self.rejected,
+            "coalesced": self.coalesced,
+        }
+    
+    async def close(self, timeout: float = 30.0) -> None:
+        """Ожидание обработки уже принятых сообщений"""
+        workers = list(self._workers.values())
+        if not workers:
+            return
+        
+        done, pending = await asyncio.wait(workers, timeout=timeout)
+        for task in pending:
+            task.cancel()
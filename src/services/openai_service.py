@@ -1,83 +1,469 @@
 """
 Сервис для работы с OpenAI API
+
+Пакет openai импортируется долго, поэтому он загружается вместе с
+созданием сервиса, а сервис создается при первом обращении (см.
+get_openai_service).
 """
-from typing import List, Dict, Optional
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Dict, Optional
 import httpx
-from httpx_socks import AsyncProxyTransport
-from openai import AsyncOpenAI
 from loguru import logger
 
 from src.config import settings
+from src.metrics import OPENAI_REQUEST_SECONDS, OPENAI_TOKENS_TOTAL
+from src.services.backend_pool import BackendPool, OpenAIBackend
+from src.services.rate_limiter import RateLimiter, RateLimitQueueFull, parse_retry_after
+from src.services.response_cache import (
+    DatabaseResponseCache,
+    MemoryResponseCache,
+    ResponseCache,
+    make_cache_key
+)
+from src.services.token_counter import count_message_tokens, count_tokens
 
 
 class OpenAIService:
     """Сервис для взаимодействия с ChatGPT через API"""
     
     def __init__(self):
-        self.client = None
+        self.pool = None
+        self.last_request_at = time.monotonic()
+        self.limiter = RateLimiter(
+            max_concurrency=settings.openai_max_concurrency,
+            requests_per_minute=settings.openai_requests_per_minute,
+            tokens_per_minute=settings.openai_tokens_per_minute,
+            max_queue=settings.openai_queue_size,
+            max_in_flight_per_user=settings.openai_user_max_in_flight,
+            user_weight=self._user_weight,
+            fair_queuing=settings.openai_fair_queuing
+        )
+        self.cache = self._init_cache()
         self._init_client()
     
-    def _init_client(self):
-        """Инициализация клиента OpenAI с поддержкой прокси"""
-        http_client = None
+    @staticmethod
+    def _user_weight(user_id: Optional[int]) -> float:
+        """Вес пользователя в очереди к OpenAI"""
+        return settings.user_priority_weights.get(user_id, 1.0) if user_id is not None else 1.0
+    
+    @staticmethod
+    def _init_cache() -> Optional[ResponseCache]:
+        """Создание кэша ответов по настройкам"""
+        backends = {
+            "memory": MemoryResponseCache,
+            "database": DatabaseResponseCache,
+        }
+        backend = backends.get(settings.response_cache_backend)
+        if backend is None:
+            return None
         
-        # Настройка прокси если указан
-        if settings.proxy_url:
-            logger.info(f"Используется прокси: {settings.proxy_url}")
+        return ResponseCache(backend(
+            ttl_seconds=settings.response_cache_ttl_seconds,
+            max_entries=settings.response_cache_max_entries
+        ))
+    
+    def _cache_key(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> Optional[str]:
+        """Ключ кэша или None, если ответ не стоит кэшировать"""
+        if not self.cache or temperature > settings.response_cache_max_temperature:
+            return None
+        return make_cache_key(settings.openai_model, temperature, messages, max_tokens)
+    
+    @staticmethod
+    def _timeout() -> httpx.Timeout:
+        """Раздельные таймауты соединения, отправки, чтения и ожидания пула"""
+        return httpx.Timeout(
+            connect=settings.openai_connect_timeout,
+            read=settings.openai_request_timeout,
+            write=settings.openai_write_timeout,
+            pool=settings.openai_pool_timeout
+        )
+    
+    @staticmethod
+    def _http2_enabled() -> bool:
+        """HTTP/2 включен в настройках и доступен"""
+        if not settings.openai_http2:
+            return False
+        try:
+            import h2  # noqa: F401
+        except ImportError:  # pragma: no cover - зависимость опциональна
+            logger.warning("Пакет h2 не установлен, используется HTTP/1.1")
+            return False
+        return True
+    
+    def _make_http_client(self, proxy_url: Optional[str]) -> httpx.AsyncClient:
+        """HTTP-клиент с настроенным пулом соединений и, если задан, прокси"""
+        limits = httpx.Limits(
+            max_connections=settings.openai_max_connections,
+            max_keepalive_connections=settings.openai_max_keepalive_connections,
+            keepalive_expiry=settings.openai_keepalive_expiry
+        )
+        http2 = self._http2_enabled()
+        
+        if proxy_url:
+            logger.info(f"Используется прокси: {proxy_url}")
+        
+        # Определяем тип прокси
+        if proxy_url and proxy_url.startswith("socks"):
+            from httpx_socks import AsyncProxyTransport
             
-            # Определяем тип прокси
-            if settings.proxy_url.startswith("socks"):
-                transport = AsyncProxyTransport.from_url(settings.proxy_url)
-                http_client = httpx.AsyncClient(transport=transport)
-            else:
-                # HTTP/HTTPS прокси
-                http_client = httpx.AsyncClient(proxies=settings.proxy_url)
-        
-        # Создаем клиент OpenAI
-        self.client = AsyncOpenAI(
-            api_key=settings.openai_api_key,
-            base_url=settings.openai_api_base,
-            http_client=http_client
+            transport = AsyncProxyTransport.from_url(proxy_url, limits=limits, http2=http2)
+            return httpx.AsyncClient(transport=transport, timeout=self._timeout())
+        
+        # HTTP/HTTPS прокси или прямое соединение
+        return httpx.AsyncClient(
+            proxies=proxy_url or None,
+            limits=limits,
+            http2=http2,
+            timeout=self._timeout()
+        )
+    
+    def _init_client(self):
+        """Инициализация пула клиентов OpenAI с поддержкой прокси"""
+        from openai import AsyncOpenAI
+        
+        configs = settings.openai_backends or [{
+            "name": "default",
+            "base_url": settings.openai_api_base,
+            "api_key": settings.openai_api_key,
+            "proxy_url": settings.proxy_url,
+        }]
+        
+        backends = []
+        for index, config in enumerate(configs):
+            # Повторы и переключение серверов выполняет сервис с учетом лимитов
+            client = AsyncOpenAI(
+                api_key=config.get("api_key") or settings.openai_api_key,
+                base_url=config.get("base_url") or settings.openai_api_base,
+                http_client=self._make_http_client(config.get("proxy_url")),
+                timeout=self._timeout(),
+                max_retries=0
+            )
+            backends.append(OpenAIBackend(
+                name=config.get("name") or f"backend-{index}",
+                client=client,
+                latency_window=settings.openai_latency_window
+            ))
+        
+        self.pool = BackendPool(
+            backends,
+            failure_threshold=settings.openai_breaker_failures,
+            cooldown_seconds=settings.openai_breaker_cooldown_seconds
         )
         
-        logger.info("OpenAI клиент инициализирован")
+        logger.info(f"OpenAI клиент инициализирован, серверов: {len(backends)}")
+    
+    @staticmethod
+    def _estimate_tokens(messages: List[Dict[str, str]], max_tokens: Optional[int]) -> int:
+        """Оценка токенов запроса вместе с ответом для лимита в минуту"""
+        prompt = sum(count_message_tokens(m["content"], settings.openai_model) for m in messages)
+        return prompt + (max_tokens or settings.openai_reply_tokens_estimate)
+    
+    @asynccontextmanager
+    async def _request(self, estimated_tokens: int, user_id: Optional[int], **params):
+        """
+        Запрос к Chat Completions API с учетом лимитов и повторами
+        
+        Место в ограничителе удерживается, пока открыт контекст, поэтому
+        потоковый ответ считается выполняющимся до конца чтения. При
+        ошибке сети, таймауте или ошибке сервера повтор уходит на другой
+        сервер пула, если он есть.
+        
+        Args:
+            estimated_tokens: Оценка токенов запроса
+            user_id: Пользователь для справедливой очереди
+            **params: Параметры chat.completions.create
+        
+        Yields:
+            Ответ API (ChatCompletion или поток фрагментов)
+        """
+        # Пакет уже загружен при создании клиентов
+        from openai import (
+            APIConnectionError, APIStatusError, AuthenticationError, InternalServerError,
+            NotFoundError, PermissionDeniedError, RateLimitError
+        )
+        
+        failed = []
+        self.last_request_at = time.monotonic()
+        
+        for attempt in range(settings.openai_max_retries + 1):
+            backoff = 0.0
+            
+            async with self.limiter.acquire(estimated_tokens, user_id):
+                backend = self.pool.select(exclude=failed)
+                trial = backend.state == "half-open"
+                backend.in_flight += 1
+                started = time.monotonic()
+                outcome = "error"
+                try:
+                    raw = await backend.client.chat.completions.with_raw_response.create(**params)
+                except RateLimitError as e:
+                    outcome = "rate_limited"
+                    if self.pool.single:
+                        # Пауза применяется ко всем запросам через ограничитель
+                        self.limiter.on_rate_limited(e.response.headers)
+                    else:
+                        # Остальные серверы пула продолжают принимать запросы
+                        self.pool.record_rate_limited(backend, parse_retry_after(e.response.headers))
+                        backoff = self.pool.time_until_available()
+                    error = e
+                except (APIConnectionError, InternalServerError) as e:
+                    # Таймауты тоже относятся к APIConnectionError
+                    self.pool.record_failure(backend)
+                    failed.append(backend)
+                    if not self.pool.has_alternative(failed):
+                        backoff = 0.5 * 2 ** attempt
+                    error = e
+                except (AuthenticationError, PermissionDeniedError, NotFoundError) as e:
+                    # 401/403/404 - ошибка настройки сервера (ключ, base_url, модель):
+                    # сервер отключается сразу, запрос уходит на другой
+                    self.pool.record_failure(backend, trip=True)
+                    failed.append(backend)
+                    if not self.pool.has_alternative(failed):
+                        OPENAI_REQUEST_SECONDS.labels(backend.name, outcome).observe(time.monotonic() - started)
+                        raise
+                    error = e
+                except APIStatusError as e:
+                    # Ошибка самого запроса (400, 413, 422): сервер исправен, повтор бесполезен
+                    self.pool.record_success(backend, time.monotonic() - started)
+                    OPENAI_REQUEST_SECONDS.labels(backend.name, outcome).observe(time.monotonic() - started)
+                    raise
+                else:
+                    outcome = "ok"
+                    self.pool.record_success(backend, time.monotonic() - started)
+                    if self.pool.single:
+                        self.limiter.update_from_headers(raw.headers)
+                    OPENAI_REQUEST_SECONDS.labels(backend.name, outcome).observe(time.monotonic() - started)
+                    yield raw.parse()
+                    return
+                finally:
+                    backend.in_flight -= 1
+                    # Отмена или другая ошибка не должны навсегда занять пробный запрос
+                    if trial:
+                        self.pool.release_trial(backend)
+                
+                OPENAI_REQUEST_SECONDS.labels(backend.name, outcome).observe(time.monotonic() - started)
+            
+            if attempt < settings.openai_max_retries:
+                logger.warning(f"Повтор запроса к OpenAI ({attempt + 1}, сервер {backend.name}): {error}")
+                await asyncio.sleep(backoff)
+        
+        raise error
     
     async def get_chat_completion(
         self,
         messages: List[Dict[str, str]],
-        temperature: float = 0.7,
-        max_tokens: Optional[int] = None
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        user_id: Optional[int] = None
     ) -> str:
         """
         Получение ответа от ChatGPT
         
+        Запросы с температурой не выше response_cache_max_temperature
+        обслуживаются из кэша, одинаковые одновременные запросы
+        выполняются один раз.
+        
         Args:
             messages: История сообщений в формате OpenAI
-            temperature: Температура генерации (0-2)
+            temperature: Температура генерации (0-2), по умолчанию из настроек
             max_tokens: Максимальное количество токенов в ответе
+            user_id: ID пользователя в Telegram, от имени которого идет
+                запрос (для справедливой очереди)
         
         Returns:
             Текст ответа от модели
         """
+        if temperature is None:
+            temperature = settings.openai_temperature
+        
+        key = self._cache_key(messages, temperature, max_tokens)
+        if key is None:
+            return await self._complete(messages, temperature, max_tokens, user_id)
+        
+        return await self.cache.get_or_compute(
+            key,
+            lambda: self._complete(messages, temperature, max_tokens, user_id)
+        )
+    
+    async def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int],
+        user_id: Optional[int] = None
+    ) -> str:
+        """Запрос к API без кэша"""
+        estimated = self._estimate_tokens(messages, max_tokens)
+        
         try:
-            response = await self.client.chat.completions.create(
+            async with self._request(
+                estimated,
+                user_id,
                 model=settings.openai_model,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens
-            )
-            
-            return response.choices[0].message.content
+            ) as response:
+                if response.usage:
+                    self.limiter.record_usage(estimated, response.usage.total_tokens, user_id)
+                    OPENAI_TOKENS_TOTAL.labels("prompt", "usage").inc(response.usage.prompt_tokens)
+                    OPENAI_TOKENS_TOTAL.labels("completion", "usage").inc(response.usage.completion_tokens)
+                
+                return response.choices[0].message.content
             
+        except RateLimitQueueFull:
+            logger.warning("Очередь запросов к OpenAI переполнена")
+            raise
         except Exception as e:
             logger.error(f"Ошибка при обращении к OpenAI API: {e}")
             raise
     
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        user_id: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        Потоковое получение ответа от ChatGPT
+        
+        Закэшированный ответ отдается одним фрагментом, полный ответ
+        из потока сохраняется в кэш.
+        
+        Args:
+            messages: История сообщений в формате OpenAI
+            temperature: Температура генерации (0-2), по умолчанию из настроек
+            max_tokens: Максимальное количество токенов в ответе
+            user_id: ID пользователя в Telegram (для справедливой очереди)
+        
+        Yields:
+            Фрагменты текста ответа по мере генерации
+        """
+        if temperature is None:
+            temperature = settings.openai_temperature
+        
+        key = self._cache_key(messages, temperature, max_tokens)
+        if key is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        
+        parts = []
+        try:
+            async with self._request(
+                self._estimate_tokens(messages, max_tokens),
+                user_id,
+                model=settings.openai_model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            ) as stream:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            
+        except RateLimitQueueFull:
+            logger.warning("Очередь запросов к OpenAI переполнена")
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при потоковом обращении к OpenAI API: {e}")
+            raise
+        
+        # В потоковом режиме usage не приходит, токены оцениваются
+        text = "".join(parts)
+        OPENAI_TOKENS_TOTAL.labels("prompt", "estimate").inc(
+            sum(count_message_tokens(m["content"], settings.openai_model) for m in messages)
+        )
+        OPENAI_TOKENS_TOTAL.labels("completion", "estimate").inc(count_tokens(text, settings.openai_model))
+        
+        if key is not None:
+            await self.cache.set(key, text)
+    
+    def idle_for(self) -> float:
+        """Время в секундах с последнего запроса к API"""
+        return time.monotonic() - self.last_request_at
+    
+    async def warm_up(self, connections: Optional[int] = None) -> Dict[str, float]:
+        """
+        Прогрев соединений: установка TCP, прокси и TLS заранее, чтобы
+        первый запрос пользователя не ждал рукопожатий
+        
+        На каждый сервер отправляется несколько одновременных легких
+        запросов списка моделей; ошибки ответа не важны, соединения
+        остаются в пуле.
+        
+        Args:
+            connections: Соединений на сервер (по умолчанию из настроек)
+        
+        Returns:
+            Время прогрева каждого сервера в секундах
+        """
+        if connections is None:
+            connections = settings.openai_prewarm_connections
+        if connections <= 0:
+            return {}
+        
+        async def ping(backend: OpenAIBackend) -> None:
+            try:
+                await backend.client.models.with_raw_response.list()
+            except Exception as e:
+                logger.debug(f"Прогрев соединения с {backend.name}: {e}")
+        
+        async def warm(backend: OpenAIBackend) -> float:
+            started = time.monotonic()
+            await asyncio.gather(*(ping(backend) for _ in range(connections)))
+            return time.monotonic() - started
+        
+        durations = await asyncio.gather(*(warm(backend) for backend in self.pool.backends))
+        result = {backend.name: duration for backend, duration in zip(self.pool.backends, durations)}
+        logger.info(
+            "Соединения с OpenAI прогреты: "
+            + ", ".join(f"{name} {duration:.3f} с" for name, duration in result.items())
+        )
+        return result
+    
     async def close(self):
-        """Закрытие HTTP клиента"""
-        if self.client and self.client._client:
-            await self.client._client.aclose()
+        """Закрытие HTTP клиентов"""
+        for backend in self.pool.backends:
+            await backend.client.close()
+
+
+_service: Optional[OpenAIService] = None
+_service_lock = threading.Lock()
+
+
+def get_openai_service() -> OpenAIService:
+    """
+    Глобальный экземпляр сервиса, создается при первом обращении
+    
+    TelegramBot.initialize создает его в фоновом потоке, пока идут
+    инициализация БД и подключение к Telegram; блокировка не дает
+    создать второй экземпляр, если первое сообщение придет раньше.
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = OpenAIService()
+    return _service
 
 
-# Глобальный экземпляр сервиса
-openai_service = OpenAIService() 
\ No newline at end of file
+async def close_openai_service() -> None:
+    """Закрытие HTTP-клиентов, если сервис был создан"""
+    if _service is not None:
+        await _service.close()
@@ -0,0 +1,296 @@
+"""
+Ограничение нагрузки на OpenAI API
+"""
+import asyncio
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Hashable, Mapping, Optional
+
+from loguru import logger
+
+from src.metrics import OPENAI_QUEUE_WAIT_SECONDS
+from src.services.fair_scheduler import FairScheduler
+
+
+class RateLimitQueueFull(Exception):
+    """Очередь ожидания переполнена, запрос отклонен без ожидания"""
+
+
+class TokenBucket:
+    """
+    Ведро токенов с равномерным пополнением
+    
+    Уровень может уходить в минус: так учитывается разница между
+    оценкой и фактическим расходом после ответа.
+    """
+    
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate_per_minute: Скорость пополнения в минуту (0 - без ограничения)
+            capacity: Емкость ведра (по умолчанию минутный запас)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+    
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def time_until(self, amount: float) -> float:
+        """Время в секундах, через которое будет доступно amount"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        # Запрос больше емкости ждет полного ведра, иначе он не пройдет никогда
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+    
+    def consume(self, amount: float) -> None:
+        """Списание amount (допускается уход в минус)"""
+        if self.unlimited:
+            return
+        self._refill()
+        self.level -= amount
+    
+    def limit_to(self, remaining: float) -> None:
+        """Синхронизация с остатком, который сообщил сервер"""
+        if self.unlimited:
+            return
+        self._refill()
+        self.level = min(self.level, remaining)
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Разбор длительности из заголовков OpenAI ("20ms", "1.5s", "6m0s")
+    
+    Returns:
+        Длительность в секундах или None, если формат не распознан
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Пауза, которую сервер просит выдержать после 429
+    
+    Returns:
+        Длительность в секундах или None, если заголовков нет
+    """
+    delay = parse_duration(headers.get("retry-after-ms"))
+    if delay is not None:
+        return delay / 1000
+    return parse_duration(headers.get("retry-after"))
+
+
+class RateLimiter:
+    """
+    Ограничитель запросов к OpenAI: число одновременных запросов,
+    лимиты запросов и токенов в минуту, пауза по заголовкам ответа
+    и ограниченная очередь ожидания
+    
+    Слоты одновременных запросов распределяются между пользователями
+    взвешенной справедливой очередью (FairScheduler) по оценке токенов.
+    """
+    
+    def __init__(
+        self,
+        max_concurrency: int,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_queue: int,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        max_in_flight_per_user: int = 0,
+        user_weight: Optional[Callable[[Hashable], float]] = None,
+        fair_queuing: bool = True
+    ):
+        """
+        Args:
+            max_concurrency: Максимум одновременных запросов
+            requests_per_minute: Лимит запросов в минуту (0 - без ограничения)
+            tokens_per_minute: Лимит токенов в минуту (0 - без ограничения)
+            max_queue: Максимум запросов, ожидающих своей очереди
+            backoff_base: Начальная пауза после 429 без Retry-After
+            backoff_max: Максимальная пауза после 429
+            max_in_flight_per_user: Максимум одновременных запросов
+                одного пользователя (0 - без ограничения)
+            user_weight: Вес пользователя в очереди (по умолчанию 1)
+            fair_queuing: Справедливая очередь между пользователями; без
+                нее слоты выдаются в порядке поступления (ограничение
+                max_in_flight_per_user действует в обоих режимах)
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.user_weight = user_weight or (lambda user_id: 1.0)
+        self.fair_queuing = fair_queuing
+        
+        self.scheduler = FairScheduler(
+            slots=max_concurrency,
+            max_in_flight_per_key=max_in_flight_per_user,
+            weight_for=self.user_weight,
+            fair=fair_queuing
+        )
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.pause_until = 0.0
+        self._consecutive_limits = 0
+        
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+    
+    @asynccontextmanager
+    async def acquire(self, estimated_tokens: int, user_id: Optional[int] = None):
+        """
+        Ожидание разрешения на запрос
+        
+        Args:
+            estimated_tokens: Оценка токенов запроса вместе с ответом
+            user_id: Пользователь, для которого выполняется запрос
+        
+        Raises:
+            RateLimitQueueFull: Если очередь ожидания заполнена
+        """
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise RateLimitQueueFull(f"В очереди к OpenAI уже {self.waiting} запросов")
+        
+        self.waiting += 1
+        started = time.monotonic()
+        acquired = False
+        try:
+            await self.scheduler.acquire(user_id, estimated_tokens)
+            acquired = True
+            
+            while True:
+                delay = max(
+                    self.pause_until - time.monotonic(),
+                    self.requests.time_until(1),
+                    self.tokens.time_until(estimated_tokens),
+                )
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            
+            self.requests.consume(1)
+            self.tokens.consume(estimated_tokens)
+        except BaseException:
+            if acquired:
+                self.scheduler.release(user_id)
+            raise
+        finally:
+            self.waiting -= 1
+        
+        waited = time.monotonic() - started
+        self.admitted += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        self.scheduler.record_wait(user_id, waited)
+        OPENAI_QUEUE_WAIT_SECONDS.labels(f"{self.user_weight(user_id):g}").observe(waited)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.scheduler.release(user_id)
+    
+    def record_usage(self, estimated_tokens: int, actual_tokens: int, user_id: Optional[int] = None) -> None:
+        """
+        Поправка на фактический расход: ведро токенов и доля пользователя
+        в очереди (вызывается, пока запрос удерживает слот)
+        """
+        self.tokens.consume(actual_tokens - estimated_tokens)
+        self.scheduler.charge(user_id, actual_tokens - estimated_tokens)
+    
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """
+        Подстройка под лимиты, которые сообщил сервер
+        
+        Args:
+            headers: Заголовки ответа OpenAI (x-ratelimit-*)
+        """
+        self._consecutive_limits = 0
+        
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            try:
+                remaining = float(remaining)
+            except ValueError:
+                continue
+            
+            bucket.limit_to(remaining)
+            if remaining <= 0:
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    self.pause_until = max(self.pause_until, time.monotonic() + reset)
+    
+    def on_rate_limited(self, headers: Mapping[str, str]) -> float:
+        """
+        Обработка ответа 429: пауза для всех запросов
+        
+        Args:
+            headers: Заголовки ответа с ошибкой
+        
+        Returns:
+            Длительность паузы в секундах
+        """
+        self.rate_limited += 1
+        self._consecutive_limits += 1
+        
+        delay = parse_retry_after(headers)
+        if delay is None:
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (self._consecutive_limits - 1))
+        
+        self.pause_until = max(self.pause_until, time.monotonic() + delay)
+        logger.warning(f"Лимит OpenAI превышен, пауза {delay:.1f} с")
+        return delay
+    
+    def stats(self) -> Dict[str, float]:
+        """Глубина очереди и время ожидания"""
+        return {
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rate_limited": self.rate_limited,
+            "wait_time_avg": self.wait_time_total / self.admitted if self.admitted else 0.0,
+            "wait_time_max": self.wait_time_max,
+            "paused_for": max(0.0, self.pause_until - time.monotonic()),
+            "users": self.scheduler.stats(),
+        }
@@ -0,0 +1,217 @@
+"""
+Кэш ответов OpenAI для одинаковых запросов
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from loguru import logger
+
+from src.database.connection import db_manager
+from src.database.models import ResponseCacheEntry
+
+
+def make_cache_key(
+    model: str,
+    temperature: float,
+    messages: List[Dict[str, str]],
+    max_tokens: Optional[int] = None
+) -> str:
+    """
+    Ключ кэша: хэш всех параметров, влияющих на ответ
+    
+    Returns:
+        SHA-256 в шестнадцатеричном виде
+    """
+    payload = json.dumps(
+        {"model": model, "temperature": temperature, "max_tokens": max_tokens, "messages": messages},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryResponseCache:
+    """Хранилище ответов в памяти процесса с TTL и LRU-вытеснением"""
+    
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+    
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, response = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        
+        self._entries.move_to_end(key)
+        return response
+    
+    async def set(self, key: str, response: str) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class DatabaseResponseCache:
+    """
+    Хранилище ответов в таблице response_cache
+    
+    Переживает перезапуск и общее для нескольких процессов с одной БД.
+    Лишние и просроченные записи удаляются раз в prune_every записей.
+    """
+    
+    def __init__(self, ttl_seconds: int, max_entries: int, prune_every: int = 100):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self._writes = 0
+    
+    async def get(self, key: str) -> Optional[str]:
+        async with db_manager.get_session() as session:
+            result = await session.execute(
+                select(ResponseCacheEntry.response)
+                .where(ResponseCacheEntry.key == key)
+                .where(ResponseCacheEntry.expires_at > datetime.now(timezone.utc))
+            )
+            return result.scalar_one_or_none()
+    
+    async def set(self, key: str, response: str) -> None:
+        now = datetime.now(timezone.utc)
+        async with db_manager.get_session() as session:
+            await session.merge(ResponseCacheEntry(
+                key=key,
+                response=response,
+                created_at=now,
+                expires_at=now + timedelta(seconds=self.ttl_seconds)
+            ))
+        
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            await self.prune()
+    
+    async def prune(self) -> None:
+        """Удаление просроченных записей и самых старых сверх лимита"""
+        async with db_manager.get_session() as session:
+            await session.execute(
+                delete(ResponseCacheEntry)
+                .where(ResponseCacheEntry.expires_at <= datetime.now(timezone.utc))
+            )
+            
+            count = (await session.execute(
+                select(func.count()).select_from(ResponseCacheEntry)
+            )).scalar_one()
+            
+            if count > self.max_entries:
+                oldest = (
+                    select(ResponseCacheEntry.key)
+                    .order_by(ResponseCacheEntry.created_at)
+                    .limit(count - self.max_entries)
+                )
+                await session.execute(
+                    delete(ResponseCacheEntry).where(ResponseCacheEntry.key.in_(oldest))
+                )
+    
+    def size(self) -> Optional[int]:
+        return None
+
+
+class ResponseCache:
+    """
+    Кэш ответов с объединением одинаковых одновременных запросов:
+    пока первый запрос выполняется, остальные ждут его результата
+    """
+    
+    def __init__(self, backend):
+        self.backend = backend
+        self._inflight: Dict[str, asyncio.Future] = {}
+        
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+    
+    async def get(self, key: str) -> Optional[str]:
+        """Ответ из хранилища без обращения к API"""
+        try:
+            response = await self.backend.get(key)
+        except Exception as e:
+            # Недоступный кэш не должен ломать ответ пользователю
+            logger.warning(f"Ошибка чтения кэша ответов: {e}")
+            return None
+        
+        if response is not None:
+            self.hits += 1
+        return response
+    
+    async def set(self, key: str, response: str) -> None:
+        """Сохранение ответа в хранилище"""
+        try:
+            await self.backend.set(key, response)
+        except Exception as e:
+            logger.warning(f"Ошибка записи кэша ответов: {e}")
+    
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        """
+        Ответ из кэша или результат compute() с сохранением в кэш
+        
+        Args:
+            key: Ключ запроса (make_cache_key)
+            compute: Выполнение запроса к API
+        
+        Returns:
+            Текст ответа
+        """
+        response = await self.get(key)
+        if response is not None:
+            return response
+        
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.deduplicated += 1
+            return await asyncio.shield(inflight)
+        
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            response = await compute()
+            future.set_result(response)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение получат ожидающие; помечаем его полученным
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        
+        await self.set(key, response)
+        return response
+    
+    def stats(self) -> Dict[str, Optional[float]]:
+        """Счетчики попаданий, промахов и объединенных запросов"""
+        lookups = self.hits + self.misses + self.deduplicated
+        return {
+            "size": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "deduplicated": self.deduplicated,
+            "hit_rate": (self.hits + self.deduplicated) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,294 @@
+"""
+Отправка сообщений в Telegram с учетом лимитов Bot API
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, TypeVar
+
+from loguru import logger
+from telegram import Message
+from telegram.error import RetryAfter
+
+from src.config import settings
+from src.metrics import TELEGRAM_SENDS_TOTAL
+from src.services.rate_limiter import TokenBucket
+
+T = TypeVar("T")
+
+# Максимальная длина текста сообщения в Telegram (в единицах UTF-16)
+MESSAGE_LIMIT = 4096
+
+# Границы разбиения длинного текста в порядке предпочтения
+SEPARATORS = ("\n\n", "\n", ". ", "! ", "? ", "; ", ", ", " ")
+
+
+def utf16_length(text: str) -> int:
+    """Длина текста так, как ее считает Telegram"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _fitting_prefix(text: str, limit: int) -> int:
+    """Наибольшее число символов от начала текста, умещающееся в limit"""
+    if utf16_length(text[:limit]) <= limit:
+        return min(len(text), limit)
+    # Символы вне BMP (эмодзи) занимают две единицы UTF-16
+    low, high = limit // 2, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if utf16_length(text[:middle]) <= limit:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """
+    Разбиение длинного текста на части не длиннее limit
+    
+    Граница ищется во второй половине части: сначала между абзацами,
+    затем между строками, предложениями и словами; текст без пробелов
+    режется по длине. Разделитель остается в конце части, так что части
+    вместе в точности составляют исходный текст.
+    
+    Returns:
+        Части текста по порядку (для короткого текста - он сам)
+    """
+    chunks = []
+    while utf16_length(text) > limit:
+        cut = _fitting_prefix(text, limit)
+        window = text[:cut]
+        for separator in SEPARATORS:
+            index = window.rfind(separator)
+            if index >= cut // 2:
+                cut = index + len(separator)
+                break
+        chunks.append(text[:cut])
+        text = text[cut:]
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+
+def _seconds(retry_after: Any) -> float:
+    """RetryAfter.retry_after: число секунд или timedelta в новых версиях PTB"""
+    if hasattr(retry_after, "total_seconds"):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class _Chat:
+    """Лимит отправок в чат и очередь его запросов"""
+    
+    __slots__ = ("bucket", "lock")
+    
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.lock = asyncio.Lock()
+
+
+class SendQueue:
+    """
+    Очередь исходящих запросов к Bot API
+    
+    Перед каждой отправкой или редактированием сообщения берется токен
+    из ведра чата (в личном чате около 1 сообщения в секунду с короткими
+    всплесками, в группах 20 в минуту без всплесков) и из общего ведра
+    бота (около 30 сообщений в секунду). Общее ведро вмещает один токен:
+    отправки идут равномерно, и ни в одну секунду их не больше
+    global_rate. Общее ведро выдается в порядке очереди, чат,
+    ожидающий своего ведра, других не задерживает. Ответ RetryAfter
+    приостанавливает все отправки на указанное время, после чего запрос
+    повторяется.
+    """
+    
+    def __init__(
+        self,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: int,
+        group_rate_per_minute: float,
+        max_retries: int,
+        max_chats: int = 10000
+    ):
+        """
+        Args:
+            global_rate: Сообщений в секунду на весь бот (0 - без ограничения)
+            chat_rate: Сообщений в секунду в личный чат (0 - без ограничения)
+            chat_burst: Сообщений в чат подряд без паузы
+            group_rate_per_minute: Сообщений в минуту в группу (0 - без ограничения)
+            max_retries: Повторов после RetryAfter
+            max_chats: Сколько чатов хранить в памяти
+        """
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate_per_minute = group_rate_per_minute
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        
+        self.global_bucket = TokenBucket(global_rate * 60, capacity=1)
+        self._global_lock = asyncio.Lock()
+        self._chats: "OrderedDict[int, _Chat]" = OrderedDict()
+        self.pause_until = 0.0
+        
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+    
+    def _chat(self, chat_id: int) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            # Отрицательный ID - группа или канал: лимит в минуту строгий, без всплесков
+            if chat_id < 0:
+                chat = _Chat(TokenBucket(self.group_rate_per_minute, capacity=1))
+            else:
+                chat = _Chat(TokenBucket(self.chat_rate * 60, capacity=self.chat_burst))
+            self._chats[chat_id] = chat
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return chat
+    
+    def ready(self, chat_id: int) -> bool:
+        """Можно ли отправить в чат без ожидания"""
+        return (
+            self.pause_until <= time.monotonic()
+            and self._chat(chat_id).bucket.time_until(1) <= 0
+            and self.global_bucket.time_until(1) <= 0
+        )
+    
+    async def _acquire(self, chat_id: int) -> None:
+        """
+        Ожидание токенов чата и бота
+        
+        Токен чата списывается вместе с токеном бота, то есть в момент
+        отправки: ожидание общей очереди не сдвигает отправки в чат ближе
+        друг к другу, чем позволяет его лимит. Запросы одного чата
+        получают токены по очереди.
+        """
+        started = time.monotonic()
+        chat = self._chat(chat_id)
+        async with chat.lock:
+            while True:
+                delay = chat.bucket.time_until(1)
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            
+            async with self._global_lock:
+                while True:
+                    delay = max(self.pause_until - time.monotonic(), self.global_bucket.time_until(1))
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                self.global_bucket.consume(1)
+                chat.bucket.consume(1)
+        
+        waited = time.monotonic() - started
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+    
+    async def _send(self, chat_id: int, send: Callable[[], Awaitable[T]], acquired: bool = False) -> T:
+        """Запрос с повтором после RetryAfter"""
+        for attempt in range(self.max_retries + 1):
+            if not acquired:
+                await self._acquire(chat_id)
+            acquired = False
+            
+            # Пауза могла начаться, пока токен был уже получен
+            delay = self.pause_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            try:
+                result = await send()
+            except RetryAfter as e:
+                delay = _seconds(e.retry_after)
+                self.pause_until = max(self.pause_until, time.monotonic() + delay)
+                TELEGRAM_SENDS_TOTAL.labels("retry_after").inc()
+                logger.warning(f"Лимит Telegram превышен (чат {chat_id}), пауза {delay:.1f} с")
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    raise
+                self.retried += 1
+                continue
+            
+            self.sent += 1
+            TELEGRAM_SENDS_TOTAL.labels("ok").inc()
+            return result
+    
+    async def call(self, chat_id: int, send: Callable[[], Awaitable[T]]) -> T:
+        """
+        Запрос к Bot API, отправляющий или изменяющий сообщение в чате
+        
+        Args:
+            chat_id: ID чата
+            send: Функция, создающая запрос (вызывается на каждую попытку)
+        
+        Returns:
+            Результат запроса
+        """
+        return await self._send(chat_id, send)
+    
+    async def reply(self, message: Message, text: str, **kwargs) -> List[Message]:
+        """
+        Ответ на сообщение; длинный текст отправляется несколькими сообщениями
+        
+        Части уходят строго по порядку, но токены для следующей части
+        ожидаются, пока отправляется текущая, поэтому после ответа
+        Telegram следующая часть уходит сразу.
+        
+        Args:
+            message: Сообщение, на которое отвечаем
+            text: Текст ответа
+            **kwargs: Параметры reply_text (например, parse_mode)
+        
+        Returns:
+            Отправленные сообщения
+        """
+        chat_id = message.chat_id
+        # Части из одних пробелов Telegram не принимает
+        chunks = [chunk for chunk in split_message(text) if chunk.strip()] or [text]
+        sent = []
+        turn = asyncio.ensure_future(self._acquire(chat_id))
+        try:
+            for index, chunk in enumerate(chunks):
+                await turn
+                turn = None
+                if index + 1 < len(chunks):
+                    turn = asyncio.ensure_future(self._acquire(chat_id))
+                sent.append(await self._send(
+                    chat_id,
+                    lambda: message.reply_text(chunk, **kwargs),
+                    acquired=True
+                ))
+        finally:
+            if turn is not None:
+                turn.cancel()
+        return sent
+    
+    def stats(self) -> Dict[str, float]:
+        """Отправки, повторы и ожидание лимитов"""
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "chats": len(self._chats),
+            "wait_time_avg": self.wait_time_total / (self.sent + self.failed) if self.sent + self.failed else 0.0,
+            "wait_time_max": self.wait_time_max,
+            "paused_for": max(0.0, self.pause_until - time.monotonic()),
+        }
+
+
+# Глобальный экземпляр очереди
+send_queue = SendQueue(
+    global_rate=settings.telegram_global_rate,
+    chat_rate=settings.telegram_chat_rate,
+    chat_burst=settings.telegram_chat_burst,
+    group_rate_per_minute=settings.telegram_group_rate_per_minute,
+    max_retries=settings.telegram_send_retries
+)
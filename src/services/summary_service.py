@@ -0,0 +1,173 @@
+"""
+Фоновое сжатие истории диалогов
+"""
+import asyncio
+from typing import Any, Dict, List, Set
+
+from loguru import logger
+
+from src.config import settings
+from src.services.context_service import context_service
+from src.services.openai_service import get_openai_service
+
+
+SUMMARY_INSTRUCTIONS = (
+    "Составь краткое содержание диалога пользователя с ассистентом. "
+    "Сохрани факты о пользователе, его цели, принятые решения и открытые вопросы. "
+    "Пиши кратко, от третьего лица, без вступлений."
+)
+
+ROLE_NAMES = {
+    "user": "Пользователь",
+    "assistant": "Ассистент",
+}
+
+
+class ConversationSummarizer:
+    """
+    Сжатие старой части диалога в краткое содержание
+    
+    Сжатие запускается после ответа пользователю и выполняется в фоне,
+    не задерживая обработку сообщений. Количество одновременных запросов
+    ограничено отдельно от основного лимита OpenAI, для каждого
+    пользователя в работе не больше одного сжатия.
+    """
+    
+    def __init__(self, max_concurrency: int, trigger_messages: int, keep_messages: int):
+        """
+        Args:
+            max_concurrency: Максимум одновременных сжатий
+            trigger_messages: Размер контекста, после которого история сжимается
+            keep_messages: Последние сообщения, которые не сжимаются
+        """
+        self.trigger_messages = trigger_messages
+        self.keep_messages = keep_messages
+        
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        
+        self.scheduled = 0
+        self.compactions = 0
+        self.messages_compacted = 0
+        self.skipped = 0
+        self.failures = 0
+    
+    def schedule(self, telegram_id: int, context_size: int) -> bool:
+        """
+        Постановка сжатия истории пользователя в фон
+        
+        Args:
+            telegram_id: ID пользователя в Telegram
+            context_size: Количество сообщений в последнем контексте
+        
+        Returns:
+            True, если сжатие запланировано
+        """
+        if context_size < self.trigger_messages or telegram_id in self._pending:
+            return False
+        
+        self._pending.add(telegram_id)
+        self.scheduled += 1
+        task = asyncio.create_task(self._run(telegram_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+    
+    async def _run(self, telegram_id: int) -> None:
+        """Сжатие с ограничением параллельности"""
+        try:
+            async with self._semaphore:
+                await self.summarize(telegram_id)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Не удалось сжать историю пользователя {telegram_id}: {e}")
+        finally:
+            self._pending.discard(telegram_id)
+    
+    @staticmethod
+    def _render(messages: List[Any]) -> str:
+        """Текст диалога для запроса краткого содержания"""
+        lines = []
+        for message in messages:
+            if message.role == "summary":
+                lines.append(f"Краткое содержание более ранней части:\n{message.content}\n")
+            else:
+                lines.append(f"{ROLE_NAMES.get(message.role, message.role)}: {message.content}")
+        return "\n".join(lines)
+    
+    async def summarize(self, telegram_id: int) -> bool:
+        """
+        Сжатие истории пользователя
+        
+        Все сообщения контекста, кроме последних keep_messages, вместе с
+        предыдущим кратким содержанием заменяются новым кратким содержанием.
+        
+        Args:
+            telegram_id: ID пользователя в Telegram
+        
+        Returns:
+            True, если история сжата
+        """
+        history = await context_service.load_history(telegram_id)
+        if len(history) < self.trigger_messages:
+            self.skipped += 1
+            return False
+        
+        older = history[:-self.keep_messages] if self.keep_messages else history
+        if len(older) < 2:
+            self.skipped += 1
+            return False
+        
+        summary = await get_openai_service().get_chat_completion(
+            [
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": self._render(older)},
+            ],
+            temperature=0.0,
+            max_tokens=settings.summary_max_tokens,
+            user_id=telegram_id
+        )
+        
+        if not await context_service.replace_with_summary(telegram_id, older, summary):
+            self.skipped += 1
+            return False
+        
+        self.compactions += 1
+        self.messages_compacted += len(older)
+        return True
+    
+    def stats(self) -> Dict[str, float]:
+        """Счетчики сжатия и экономия токенов промпта"""
+        turn_stats = context_service.summary_stats
+        turns = turn_stats["turns"]
+        return {
+            "in_flight": len(self._tasks),
+            "scheduled": self.scheduled,
+            "compactions": self.compactions,
+            "messages_compacted": self.messages_compacted,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "turns": turns,
+            "turns_with_summary": turn_stats["turns_with_summary"],
+            "prompt_tokens_saved": turn_stats["prompt_tokens_saved"],
+            "prompt_tokens_saved_per_turn": turn_stats["prompt_tokens_saved"] / turns if turns else 0.0,
+        }
+    
+    async def close(self, timeout: float = 30.0) -> None:
+        """Ожидание завершения начатых сжатий"""
+        tasks = list(self._tasks)
+        if not tasks:
+            return
+        
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+
+# Глобальный экземпляр сервиса
+summarizer = ConversationSummarizer(
+    max_concurrency=settings.summary_max_concurrency,
+    trigger_messages=settings.summary_trigger_messages,
+    keep_messages=settings.summary_keep_messages
+)
@@ -0,0 +1,74 @@
+"""
+Подсчет токенов для ограничения размера контекста
+"""
+from functools import lru_cache
+from typing import Optional
+
+from loguru import logger
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - зависимость опциональна
+    tiktoken = None
+
+
+# Служебные токены, которые OpenAI добавляет к каждому сообщению
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Калибровка оценки без токенизатора: среднее число символов на токен
+# для cl100k_base на латинице и на кириллице
+ASCII_CHARS_PER_TOKEN = 4.0
+NON_ASCII_CHARS_PER_TOKEN = 2.5
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str) -> Optional["tiktoken.Encoding"]:
+    """Загрузка токенизатора модели (None, если недоступен)"""
+    if tiktoken is None:
+        return None
+    
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Словари tiktoken скачиваются при первом использовании
+        logger.warning(f"Токенизатор недоступен, используется оценка: {e}")
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Быстрая оценка количества токенов без токенизатора
+    
+    Args:
+        text: Текст
+    
+    Returns:
+        Оценка количества токенов
+    """
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    ascii_chars = len(text) - non_ascii
+    return int(ascii_chars / ASCII_CHARS_PER_TOKEN + non_ascii / NON_ASCII_CHARS_PER_TOKEN) + 1
+
+
+def count_tokens(text: str, model: str) -> int:
+    """
+    Количество токенов в тексте
+    
+    Args:
+        text: Текст
+        model: Модель OpenAI, для которой считаются токены
+    
+    Returns:
+        Количество токенов
+    """
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(content: str, model: str) -> int:
+    """Количество токенов сообщения с учетом служебных токенов"""
+    return count_tokens(content, model) + MESSAGE_OVERHEAD_TOKENS
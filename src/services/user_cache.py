@@ -0,0 +1,175 @@
+"""
+Кэш внутренних ID пользователей и отложенная запись времени активности
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from loguru import logger
+from sqlalchemy import update
+
+from src.database.connection import db_manager
+from src.database.models import User
+from src.metrics import USER_CACHE_LOOKUPS
+
+
+class UserCache:
+    """
+    Соответствие telegram_id -> users.id и накопление last_active
+    
+    ID пользователя не меняется после создания записи, поэтому после
+    первого обращения ход диалога не ищет пользователя в БД. Время
+    последней активности не пишется на каждое сообщение: touch()
+    запоминает его в памяти, а накопленные значения записываются одним
+    пакетным UPDATE раз в flush_interval секунд, так что у каждого
+    пользователя last_active обновляется не чаще этого интервала. При
+    штатной остановке (TelegramBot.stop, в том числе по SIGTERM и Ctrl+C)
+    close() записывает остаток; при аварийном завершении (SIGKILL,
+    падение) теряются отметки активности не больше чем за последний
+    интервал, так как запись идет периодически, а не только при остановке.
+    """
+    
+    def __init__(self, max_users: int, flush_interval: float):
+        """
+        Args:
+            max_users: Максимальное количество пользователей в кэше (LRU)
+            flush_interval: Интервал записи времени активности в секундах
+        """
+        self.max_users = max_users
+        self.flush_interval = flush_interval
+        
+        self._ids: "OrderedDict[int, int]" = OrderedDict()
+        self._activity: Dict[int, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        
+        self._hits = USER_CACHE_LOOKUPS.labels(result="hit")
+        self._misses = USER_CACHE_LOOKUPS.labels(result="miss")
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.touches = 0
+        self.rows_flushed = 0
+        self.flushes = 0
+        self.failures = 0
+        self.flush_time_total = 0.0
+    
+    def get(self, telegram_id: int) -> Optional[int]:
+        """
+        Внутренний ID пользователя
+        
+        Returns:
+            ID из users или None, если пользователя нет в кэше
+        """
+        user_id = self._ids.get(telegram_id)
+        if user_id is None:
+            self.misses += 1
+            self._misses.inc()
+            return None
+        
+        self._ids.move_to_end(telegram_id)
+        self.hits += 1
+        self._hits.inc()
+        return user_id
+    
+    def put(self, telegram_id: int, user_id: int) -> None:
+        """Запоминание ID пользователя, прочитанного или созданного в БД"""
+        self._ids[telegram_id] = user_id
+        self._ids.move_to_end(telegram_id)
+        
+        while len(self._ids) > self.max_users:
+            self._ids.popitem(last=False)
+            self.evictions += 1
+    
+    def touch(self, user_id: int) -> None:
+        """Отметка активности пользователя для следующей записи"""
+        self._activity[user_id] = datetime.utcnow()
+        self.touches += 1
+        
+        if not self._closing and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+    
+    async def _run(self) -> None:
+        """Периодическая запись времени активности"""
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            
+            if self._activity:
+                await self.flush()
+    
+    async def flush(self) -> int:
+        """
+        Запись накопленного времени активности одним пакетным UPDATE
+        
+        Returns:
+            Количество обновленных пользователей (0 при ошибке записи)
+        """
+        async with self._flush_lock:
+            if not self._activity:
+                return 0
+            
+            batch, self._activity = self._activity, {}
+            started = time.perf_counter()
+            try:
+                async with db_manager.get_session() as session:
+                    await session.execute(
+                        update(User),
+                        [{"id": user_id, "last_active": at} for user_id, at in batch.items()]
+                    )
+            except asyncio.CancelledError:
+                self._restore(batch)
+                raise
+            except Exception as e:
+                self._restore(batch)
+                self.failures += 1
+                logger.error(f"Не удалось записать время активности {len(batch)} пользователей: {e}")
+                return 0
+            
+            self.flush_time_total += time.perf_counter() - started
+            self.flushes += 1
+            self.rows_flushed += len(batch)
+            return len(batch)
+    
+    def _restore(self, batch: Dict[int, datetime]) -> None:
+        """Возврат неудавшегося пакета; отметки, поступившие во время записи, новее"""
+        for user_id, at in batch.items():
+            self._activity.setdefault(user_id, at)
+    
+    async def close(self) -> None:
+        """Остановка периодической записи и запись остатка"""
+        self._closing = True
+        self._wakeup.set()
+        if self._task:
+            await self._task
+            self._task = None
+        
+        await self.flush()
+        if self._activity:
+            logger.error(f"При остановке не записано время активности {len(self._activity)} пользователей")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики кэша и отложенной записи активности"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._ids),
+            "max_users": self.max_users,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "pending_activity": len(self._activity),
+            "touches": self.touches,
+            "rows_flushed": self.rows_flushed,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "flush_time_total": self.flush_time_total,
+        }
@@ -0,0 +1,195 @@
+"""
+Отложенная пакетная запись сообщений в БД
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import insert
+
+from src.database.connection import db_manager
+from src.database.models import Message
+
+
+class MessageWriteBuffer:
+    """
+    Буфер вставок сообщений с записью пакетами
+    
+    Сообщения копятся в памяти и записываются одной транзакцией раз в
+    flush_interval секунд или сразу по накоплении max_rows строк, так что
+    на пакет приходится одна фиксация (и один fsync) вместо одной на
+    сообщение. Время создания сообщению присваивается при постановке в
+    буфер, поэтому порядок истории не зависит от момента записи.
+    
+    Гарантии сохранности: сообщение считается записанным только после
+    фиксации пакета. При штатной остановке (TelegramBot.stop, в том числе
+    по SIGTERM и Ctrl+C) close() записывает остаток буфера; при аварийном
+    завершении процесса (SIGKILL, падение) теряются сообщения за
+    последние flush_interval секунд (не больше max_rows строк на момент
+    сбоя плюс накопившиеся за время неудачных попыток). Пакет, который не
+    удалось записать, возвращается в начало буфера и повторяется со
+    следующим пакетом.
+    
+    Чтение истории, которое должно видеть буфер, выполняется внутри
+    consistent_read(): на это время запись пакетов приостанавливается,
+    и каждая строка видна либо в БД, либо в буфере, но не дважды.
+    """
+    
+    def __init__(self, flush_interval: float, max_rows: int):
+        """
+        Args:
+            flush_interval: Максимальное время ожидания записи в секундах
+            max_rows: Количество строк, при котором пакет записывается сразу
+        """
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        
+        self._pending: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        
+        # Чтения с учетом буфера и запись пакета взаимно исключают друг друга
+        self._flushing = False
+        self._readers = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._no_readers = asyncio.Event()
+        self._no_readers.set()
+        
+        self.rows_added = 0
+        self.rows_flushed = 0
+        self.flushes = 0
+        self.max_batch = 0
+        self.failures = 0
+        self.flush_time_total = 0.0
+    
+    def add(self, **row: Any) -> None:
+        """
+        Постановка сообщения в буфер
+        
+        Args:
+            **row: Значения колонок Message (user_id, telegram_id, role,
+                content, token_count)
+        """
+        row.setdefault("created_at", datetime.now(timezone.utc))
+        self._pending.append(row)
+        self.rows_added += 1
+        
+        if not self._closing and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+        if len(self._pending) >= self.max_rows:
+            self._wakeup.set()
+    
+    def pending_for(self, telegram_id: int) -> List[Dict[str, Any]]:
+        """Еще не записанные сообщения пользователя в порядке поступления"""
+        return [row for row in self._pending if row["telegram_id"] == telegram_id]
+    
+    def discard(self, telegram_id: int) -> int:
+        """
+        Удаление незаписанных сообщений пользователя (очистка контекста)
+        
+        Returns:
+            Количество удаленных сообщений
+        """
+        kept = [row for row in self._pending if row["telegram_id"] != telegram_id]
+        discarded = len(self._pending) - len(kept)
+        self._pending = kept
+        return discarded
+    
+    @asynccontextmanager
+    async def consistent_read(self) -> AsyncIterator[None]:
+        """Чтение БД вместе с буфером без записи пакета посередине"""
+        while self._flushing:
+            await self._idle.wait()
+        
+        self._readers += 1
+        self._no_readers.clear()
+        try:
+            yield
+        finally:
+            self._readers -= 1
+            if not self._readers:
+                self._no_readers.set()
+    
+    async def _run(self) -> None:
+        """Периодическая запись пакетов"""
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            
+            if self._pending:
+                await self.flush()
+    
+    async def flush(self) -> int:
+        """
+        Запись накопленных сообщений одной транзакцией
+        
+        Returns:
+            Количество записанных строк (0 при ошибке записи)
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            
+            self._flushing = True
+            self._idle.clear()
+            try:
+                await self._no_readers.wait()
+                batch, self._pending = self._pending, []
+                
+                started = time.perf_counter()
+                try:
+                    async with db_manager.get_session() as session:
+                        await session.execute(insert(Message), batch)
+                except asyncio.CancelledError:
+                    self._pending[:0] = batch
+                    raise
+                except Exception as e:
+                    # Новые сообщения могли поступить во время записи и идут после пакета
+                    self._pending[:0] = batch
+                    self.failures += 1
+                    logger.error(f"Не удалось записать {len(batch)} сообщений из буфера: {e}")
+                    return 0
+                
+                self.flush_time_total += time.perf_counter() - started
+                self.flushes += 1
+                self.rows_flushed += len(batch)
+                self.max_batch = max(self.max_batch, len(batch))
+                return len(batch)
+            finally:
+                self._flushing = False
+                self._idle.set()
+    
+    async def close(self) -> None:
+        """Остановка периодической записи и запись остатка буфера"""
+        self._closing = True
+        self._wakeup.set()
+        if self._task:
+            # Начатый пакет дописывается, а не прерывается
+            await self._task
+            self._task = None
+        
+        await self.flush()
+        if self._pending:
+            logger.error(f"При остановке не записано {len(self._pending)} сообщений из буфера")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики буфера записи"""
+        return {
+            "pending": len(self._pending),
+            "rows_added": self.rows_added,
+            "rows_flushed": self.rows_flushed,
+            "flushes": self.flushes,
+            "avg_batch": self.rows_flushed / self.flushes if self.flushes else 0.0,
+            "max_batch": self.max_batch,
+            "failures": self.failures,
+            "flush_time_total": self.flush_time_total,
+        }
@@ -0,0 +1,88 @@
+"""
+Замер времени запуска бота
+
+Модуль использует только стандартную библиотеку и импортируется первым
+(из run.py), поэтому отсчет идет почти с начала работы процесса.
+"""
+import importlib
+import time
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Awaitable, Dict, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class StartupReport:
+    """
+    Длительность этапов запуска и импортов тяжелых пакетов
+    
+    Этапы, выполняемые параллельно, замеряются по отдельности, поэтому
+    их сумма может превышать общее время до готовности.
+    """
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.imports: Dict[str, float] = {}
+        self.ready_at: Optional[float] = None
+        self.first_update_at: Optional[float] = None
+    
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Замер этапа запуска"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+    
+    async def timed(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Замер асинхронного этапа, который может идти параллельно с другими"""
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.phases[name] = time.perf_counter() - started
+    
+    def import_module(self, name: str) -> ModuleType:
+        """Импорт модуля с замером; уже загруженный модуль не учитывается"""
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        elapsed = time.perf_counter() - started
+        if name not in self.imports and elapsed > 0.0005:
+            self.imports[name] = elapsed
+        return module
+    
+    def mark_ready(self) -> float:
+        """Отметка готовности к приему обновлений; возвращает время с начала запуска"""
+        self.ready_at = time.perf_counter()
+        return self.ready_at - self.started
+    
+    def mark_first_update(self) -> Optional[float]:
+        """
+        Отметка первого полученного обновления
+        
+        Returns:
+            Время с начала запуска или None, если обновление не первое
+        """
+        if self.first_update_at is not None:
+            return None
+        self.first_update_at = time.perf_counter()
+        return self.first_update_at - self.started
+    
+    def summary(self) -> str:
+        """Однострочная сводка для лога"""
+        parts = []
+        if self.ready_at is not None:
+            parts.append(f"готов через {self.ready_at - self.started:.3f} с")
+        parts += [f"{name} {seconds:.3f}" for name, seconds in self.phases.items()]
+        if self.imports:
+            parts.append("импорты: " + ", ".join(
+                f"{name} {seconds:.3f}" for name, seconds in self.imports.items()
+            ))
+        return "; ".join(parts)
+
+
+# Глобальный экземпляр отчета
+startup_report = StartupReport()
@@ -0,0 +1,488 @@
+"""
+Режим нескольких процессов: супервизор и воркеры
+
+Супервизор сам получает обновления (long polling или webhook) и передает
+каждое воркеру, номер которого определяется ID пользователя, так что
+сообщения одного пользователя всегда обрабатывает один процесс и его
+кэши (контексты, ID пользователей) остаются локальными. Воркер - обычный
+TelegramBot в режиме webhook, который слушает 127.0.0.1 и принимает
+обновления только от супервизора. Обновления передаются каждому воркеру
+по одному и по порядку; пока воркер недоступен или перегружен, они ждут
+в очереди супервизора.
+
+Модуль импортируется и в процессах воркеров (spawn), поэтому на верхнем
+уровне не импортирует бота и сервисы: их настройки задаются до импорта.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import secrets
+import signal
+from collections import defaultdict
+from multiprocessing.process import BaseProcess
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+from loguru import logger
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, generate_latest
+from prometheus_client.metrics_core import Metric
+from prometheus_client.parser import text_string_to_metric_families
+
+from src.config import settings
+from src.logging_setup import setup_logging
+
+
+# Таймаут long polling getUpdates в секундах
+POLL_TIMEOUT = 10
+
+# Путь, на который супервизор передает обновления воркерам
+WORKER_UPDATE_PATH = "/update"
+
+# Метрики процессов, которые нельзя складывать между воркерами
+NON_ADDITIVE_METRICS = {"process_start_time_seconds", "process_max_fds", "python_info"}
+
+SUPERVISOR_REGISTRY = CollectorRegistry()
+
+UPDATES_ROUTED = Counter(
+    "bot_supervisor_updates_total",
+    "Обновления, переданные воркерам",
+    ["worker"],
+    registry=SUPERVISOR_REGISTRY
+)
+WORKER_RESTARTS = Counter(
+    "bot_supervisor_worker_restarts_total",
+    "Перезапуски упавших воркеров",
+    ["worker"],
+    registry=SUPERVISOR_REGISTRY
+)
+WORKER_QUEUE_PENDING = Gauge(
+    "bot_supervisor_queue_pending",
+    "Обновления, ожидающие передачи воркеру",
+    ["worker"],
+    registry=SUPERVISOR_REGISTRY
+)
+
+
+def shard_for(telegram_id: int, workers: int) -> int:
+    """
+    Номер воркера для пользователя
+    
+    Та же формула используется в SQL при очистке контекстов воркером,
+    поэтому менять ее можно только вместе с cleanup_old_contexts.
+    """
+    return telegram_id % workers
+
+
+def sender_id(update: Dict[str, Any]) -> int:
+    """ID отправителя обновления (from/user), для каналов - ID чата"""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        for key in ("from", "user", "chat"):
+            sender = value.get(key)
+            if isinstance(sender, dict) and "id" in sender:
+                return sender["id"]
+    return 0
+
+
+class WorkerMetricsCollector:
+    """
+    Сумма метрик воркеров
+    
+    Счетчики и гистограммы складываются по совпадающим меткам, датчики
+    (глубина очередей, память) - тоже, поэтому супервизор отдает
+    значения для бота целиком. Тексты метрик загружаются перед сбором.
+    """
+    
+    def __init__(self):
+        self.texts: List[str] = []
+    
+    def collect(self):
+        families: Dict[str, Metric] = {}
+        values: Dict[str, Dict[Any, float]] = defaultdict(dict)
+        
+        for text in self.texts:
+            for family in text_string_to_metric_families(text):
+                if family.name in NON_ADDITIVE_METRICS or family.name.endswith("_created"):
+                    continue
+                families.setdefault(family.name, family)
+                merged = values[family.name]
+                for sample in family.samples:
+                    if sample.name.endswith("_created"):
+                        continue
+                    key = (sample.name, tuple(sorted(sample.labels.items())))
+                    merged[key] = merged.get(key, 0.0) + sample.value
+        
+        for name, family in families.items():
+            metric = Metric(name, family.documentation, family.type)
+            for (sample_name, labels), value in values[name].items():
+                metric.add_sample(sample_name, dict(labels), value)
+            yield metric
+
+
+def _worker_log_file(index: int) -> str:
+    """Отдельный файл логов воркера: ротация одного файла из нескольких процессов ломается"""
+    if not settings.log_file:
+        return ""
+    root, ext = os.path.splitext(settings.log_file)
+    return f"{root}.worker{index}{ext}"
+
+
+def _run_worker(overrides: Dict[str, Any]) -> None:
+    """Точка входа процесса-воркера"""
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    
+    # Ctrl+C получает вся группа процессов; воркеры останавливает супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging()
+    asyncio.run(_worker_main())
+
+
+async def _worker_main() -> None:
+    from src.bot import bot
+    
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, bot.request_stop)
+    try:
+        await bot.start()
+    except Exception as e:
+        logger.error(f"Критическая ошибка воркера {settings.worker_index}: {e}")
+    finally:
+        await bot.stop()
+        await logger.complete()
+
+
+class Supervisor:
+    """
+    Запуск воркеров, распределение обновлений и перезапуск упавших
+    
+    Обновления, переданные воркеру, который затем упал, теряются, как и
+    в однопроцессном режиме при аварийном завершении.
+    """
+    
+    def __init__(self, workers: int):
+        """
+        Args:
+            workers: Количество процессов-воркеров
+        """
+        self.workers = workers
+        self.secret = secrets.token_urlsafe(24)
+        
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: List[Optional[BaseProcess]] = [None] * workers
+        self._queues: List[asyncio.Queue] = [asyncio.Queue() for _ in range(workers)]
+        self._stopping = False
+        self._stop_event = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._runners: List[web.AppRunner] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._collector = WorkerMetricsCollector()
+        SUPERVISOR_REGISTRY.register(self._collector)
+        
+        self.routed = [0] * workers
+        self.restarts = [0] * workers
+        self.delivery_retries = 0
+        self.dropped = 0
+        
+        for index in range(workers):
+            WORKER_QUEUE_PENDING.labels(str(index)).set_function(self._queues[index].qsize)
+    
+    def update_port(self, index: int) -> int:
+        """Порт приема обновлений воркера"""
+        return settings.worker_base_port + index
+    
+    def metrics_port(self, index: int) -> int:
+        """Порт метрик воркера"""
+        return settings.worker_base_port + self.workers + index
+    
+    def _overrides(self, index: int) -> Dict[str, Any]:
+        """Настройки воркера: настройки супервизора плюс собственный порт и номер"""
+        overrides = settings.model_dump()
+        overrides.update(
+            workers=1,
+            worker_index=index,
+            worker_count=self.workers,
+            bot_mode="webhook",
+            webhook_listen="127.0.0.1",
+            webhook_port=self.update_port(index),
+            webhook_path=WORKER_UPDATE_PATH,
+            webhook_secret_token=self.secret,
+            webhook_set_on_start=False,
+            webhook_reuse_port=False,
+            metrics_listen="127.0.0.1",
+            metrics_port=self.metrics_port(index),
+            log_file=_worker_log_file(index),
+        )
+        return overrides
+    
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=_run_worker,
+            args=(self._overrides(index),),
+            name=f"bot-worker-{index}",
+            daemon=False
+        )
+        process.start()
+        self._processes[index] = process
+        logger.info(f"Запущен воркер {index} (pid {process.pid})")
+    
+    async def start(self) -> None:
+        """Запуск воркеров и прием обновлений до остановки"""
+        from src.database.connection import db_manager
+        
+        # Схема создается и обновляется один раз, до запуска воркеров
+        await db_manager.init_db()
+        await db_manager.close()
+        
+        for index in range(self.workers):
+            self._spawn(index)
+        
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=POLL_TIMEOUT + 20))
+        self._tasks = [
+            asyncio.create_task(self._forward(index)) for index in range(self.workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._monitor()))
+        
+        if settings.metrics_enabled:
+            await self._start_metrics_server()
+        
+        if settings.bot_mode == "webhook":
+            await self._start_webhook_server()
+        else:
+            self._tasks.append(asyncio.create_task(self._poll()))
+        
+        logger.info(f"Супервизор запущен: {self.workers} воркеров, режим {settings.bot_mode}")
+        await self._stop_event.wait()
+    
+    def request_stop(self) -> None:
+        """Запрос остановки (из обработчика сигнала)"""
+        self._stop_event.set()
+    
+    async def _call(self, method: str, **params) -> Any:
+        """Вызов метода Bot API"""
+        url = f"{settings.telegram_api_base}{settings.telegram_bot_token}/{method}"
+        async with self._session.post(url, json=params) as response:
+            payload = await response.json(content_type=None)
+        if not payload.get("ok"):
+            raise RuntimeError(f"{method}: {payload.get('description')}")
+        return payload["result"]
+    
+    def _pending(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+    
+    def _route(self, update: Dict[str, Any], body: Optional[bytes] = None) -> None:
+        """Постановка обновления в очередь воркера пользователя"""
+        index = shard_for(sender_id(update), self.workers)
+        self._queues[index].put_nowait(body if body is not None else json.dumps(update).encode())
+        self.routed[index] += 1
+        UPDATES_ROUTED.labels(str(index)).inc()
+    
+    async def _poll(self) -> None:
+        """Получение обновлений через long polling"""
+        await self._call("deleteWebhook", drop_pending_updates=settings.polling_drop_pending_updates)
+        offset = 0
+        while True:
+            # Пока воркеры не успевают, новые обновления остаются в Telegram
+            while self._pending() >= settings.webhook_max_pending:
+                await asyncio.sleep(0.05)
+            
+            try:
+                updates = await self._call("getUpdates", offset=offset, timeout=POLL_TIMEOUT)
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError, ValueError) as e:
+                logger.error(f"Ошибка получения обновлений: {e}")
+                await asyncio.sleep(1)
+                continue
+            
+            for update in updates:
+                offset = update["update_id"] + 1
+                self._route(update)
+    
+    async def _start_webhook_server(self) -> None:
+        """Прием обновлений от Telegram через webhook"""
+        app = web.Application()
+        app.router.add_post(settings.webhook_path, self._handle_webhook)
+        await self._start_site(app, settings.webhook_listen, settings.webhook_port)
+        
+        if settings.webhook_set_on_start:
+            url = settings.webhook_url.rstrip("/") + settings.webhook_path
+            await self._call(
+                "setWebhook",
+                url=url,
+                secret_token=settings.webhook_secret_token,
+                max_connections=settings.webhook_max_connections
+            )
+            logger.info(f"Webhook зарегистрирован: {url}")
+    
+    async def _handle_webhook(self, request: web.Request) -> web.Response:
+        if settings.webhook_secret_token:
+            from src.webhook import WebhookServer
+            token = request.headers.get(WebhookServer.SECRET_HEADER, "")
+            if not secrets.compare_digest(token, settings.webhook_secret_token):
+                return web.Response(status=403)
+        
+        if self._pending() >= settings.webhook_max_pending:
+            return web.Response(status=503)
+        
+        body = await request.read()
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+        
+        self._route(update, body)
+        return web.Response(status=200)
+    
+    async def _forward(self, index: int) -> None:
+        """Передача обновлений воркеру по одному, в порядке поступления"""
+        from src.webhook import WebhookServer
+        
+        url = f"http://127.0.0.1:{self.update_port(index)}{WORKER_UPDATE_PATH}"
+        headers = {WebhookServer.SECRET_HEADER: self.secret, "Content-Type": "application/json"}
+        queue = self._queues[index]
+        
+        while True:
+            body = await queue.get()
+            delay = 0.05
+            while True:
+                try:
+                    async with self._session.post(url, data=body, headers=headers) as response:
+                        status = response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    # Воркер запускается или перезапускается
+                    status = None
+                
+                if status == 200:
+                    break
+                if status in (400, 403):
+                    self.dropped += 1
+                    logger.error(f"Воркер {index} отклонил обновление: {status}")
+                    break
+                
+                self.delivery_retries += 1
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 1.0)
+            queue.task_done()
+    
+    async def _monitor(self) -> None:
+        """Перезапуск завершившихся воркеров"""
+        while True:
+            await asyncio.sleep(0.5)
+            for index, process in enumerate(self._processes):
+                if self._stopping or process.is_alive():
+                    continue
+                logger.error(f"Воркер {index} завершился с кодом {process.exitcode}, перезапуск")
+                self.restarts[index] += 1
+                WORKER_RESTARTS.labels(str(index)).inc()
+                await asyncio.sleep(settings.worker_restart_delay_seconds)
+                if not self._stopping:
+                    self._spawn(index)
+    
+    async def _start_metrics_server(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        await self._start_site(app, settings.metrics_listen, settings.metrics_port)
+        logger.info(f"Метрики воркеров доступны на {settings.metrics_listen}:{settings.metrics_port}/metrics")
+    
+    async def _start_site(self, app: web.Application, host: str, port: int) -> None:
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host=host, port=port).start()
+        self._runners.append(runner)
+    
+    async def _fetch_metrics(self, index: int) -> str:
+        """Текст метрик воркера; недоступный воркер пропускается"""
+        try:
+            async with self._session.get(
+                f"http://127.0.0.1:{self.metrics_port(index)}/metrics",
+                timeout=aiohttp.ClientTimeout(total=2)
+            ) as response:
+                return await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return ""
+    
+    async def collect_metrics(self) -> bytes:
+        """Метрики супервизора и сумма метрик воркеров в формате Prometheus"""
+        self._collector.texts = await asyncio.gather(*(
+            self._fetch_metrics(index) for index in range(self.workers)
+        ))
+        return generate_latest(SUPERVISOR_REGISTRY)
+    
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=await self.collect_metrics(),
+            headers={"Content-Type": CONTENT_TYPE_LATEST}
+        )
+    
+    def kill_worker(self, index: int) -> None:
+        """Аварийное завершение воркера (для проверки перезапуска)"""
+        process = self._processes[index]
+        if process and process.is_alive():
+            process.kill()
+    
+    async def stop(self) -> None:
+        """Передача принятых обновлений и штатная остановка воркеров"""
+        self._stop_event.set()
+        
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners = []
+        
+        # Очереди дописываются, пока воркеры живы
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)),
+                settings.worker_stop_timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"При остановке не передано воркерам {self._pending()} обновлений")
+        
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        
+        loop = asyncio.get_running_loop()
+        alive = [process for process in self._processes if process and process.is_alive()]
+        for process in alive:
+            process.terminate()
+        for process in alive:
+            await loop.run_in_executor(None, process.join, settings.worker_stop_timeout_seconds)
+            if process.is_alive():
+                logger.error(f"Воркер {process.name} не остановился вовремя, принудительное завершение")
+                process.kill()
+                await loop.run_in_executor(None, process.join)
+        
+        if self._session:
+            await self._session.close()
+            self._session = None
+        
+        SUPERVISOR_REGISTRY.unregister(self._collector)
+        logger.info("Супервизор остановлен")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики супервизора"""
+        return {
+            "workers": self.workers,
+            "alive": sum(1 for process in self._processes if process and process.is_alive()),
+            "routed": list(self.routed),
+            "restarts": list(self.restarts),
+            "pending": self._pending(),
+            "delivery_retries": self.delivery_retries,
+            "dropped": self.dropped,
+        }
+
+
+async def run_supervisor() -> None:
+    """Запуск в режиме нескольких процессов до сигнала остановки"""
+    supervisor = Supervisor(settings.workers)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, supervisor.request_stop)
+    
+    try:
+        await supervisor.start()
+    finally:
+        await supervisor.stop()
@@ -0,0 +1,105 @@
+"""
+Параллельная обработка обновлений с сохранением порядка внутри чата
+"""
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+# Ограничение семафора PTB: слоты считает ChatOrderedUpdateProcessor
+UNLIMITED_UPDATES = 2 ** 31 - 1
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обработчик обновлений для Application.concurrent_updates
+    
+    Обновления разных чатов обрабатываются параллельно (не больше
+    max_updates одновременно), обновления одного чата - строго
+    по очереди в порядке поступления. Обновления без чата и пользователя
+    ничем не упорядочиваются.
+    
+    Слот обработки занимает только первое в очереди своего чата
+    обновление: остальные ждут блокировки чата, не занимая слотов, так
+    что серия сообщений из одного чата не задерживает другие чаты.
+    Семафор PTB берется до do_process_update, то есть до очереди чата,
+    поэтому он не ограничивается (max_concurrent_updates в PTB только
+    включает параллельную обработку), а слоты считает собственный
+    семафор на max_updates.
+    """
+    
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(UNLIMITED_UPDATES)
+        self.max_updates = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # Ключ чата -> [блокировка, число ожидающих и работающих обновлений]
+        self._chats: Dict[int, list] = {}
+        
+        # Принятые PTB обновления: ожидающие очереди чата или слота и выполняющиеся
+        self.pending = 0
+        self.processed = 0
+        self.queued_behind_chat = 0
+        self.max_chat_queue = 0
+    
+    @staticmethod
+    def _chat_key(update: object) -> Optional[int]:
+        """Ключ упорядочивания: чат, а если его нет - пользователь"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+    
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Выполнение обработчика под блокировкой чата в свободном слоте"""
+        self.pending += 1
+        try:
+            await self._process_in_order(update, coroutine)
+        finally:
+            self.pending -= 1
+    
+    async def _process_in_order(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._chat_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+                self.processed += 1
+            return
+        
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        if entry[1] > 1:
+            self.queued_behind_chat += 1
+            self.max_chat_queue = max(self.max_chat_queue, entry[1] - 1)
+        
+        try:
+            async with entry[0], self._slots:
+                await coroutine
+                self.processed += 1
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chats[key]
+    
+    async def initialize(self) -> None:
+        """Ресурсы не требуются"""
+    
+    async def shutdown(self) -> None:
+        """Ресурсы не требуются"""
+    
+    def stats(self) -> Dict[str, int]:
+        """Счетчики обработки"""
+        return {
+            "max_concurrent_updates": self.max_updates,
+            "processed": self.processed,
+            "pending": self.pending,
+            "active_chats": len(self._chats),
+            "queued_behind_chat": self.queued_behind_chat,
+            "max_chat_queue": self.max_chat_queue,
+        }
@@ -0,0 +1,125 @@
+"""
+Прием обновлений Telegram через webhook
+"""
+import hmac
+import json
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+from loguru import logger
+
+from src.config import settings
+from src.update_processor import ChatOrderedUpdateProcessor
+
+
+class WebhookServer:
+    """
+    HTTP-сервер, принимающий обновления от Telegram
+    
+    Обновление ставится в очередь приложения, и Telegram сразу получает
+    ответ 200; обработку выполняют воркеры приложения. Когда принятых, но
+    еще не обработанных обновлений webhook_max_pending, сервер отвечает
+    503, и Telegram повторит доставку позже.
+    Несколько процессов могут слушать один порт (webhook_reuse_port)
+    или стоять за балансировщиком.
+    """
+    
+    SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+    
+    def __init__(self, application: Application):
+        self.application = application
+        self._runner = None
+        
+        self.accepted = 0
+        self.rejected = 0
+    
+    async def start(self) -> None:
+        """Запуск HTTP-сервера"""
+        app = web.Application()
+        app.router.add_post(settings.webhook_path, self._handle_update)
+        app.router.add_get("/healthz", self._handle_health)
+        
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        
+        site = web.TCPSite(
+            self._runner,
+            host=settings.webhook_listen,
+            port=settings.webhook_port,
+            reuse_port=settings.webhook_reuse_port or None
+        )
+        await site.start()
+        
+        logger.info(
+            f"Webhook-сервер слушает {settings.webhook_listen}:{settings.webhook_port}"
+            f"{settings.webhook_path}"
+        )
+    
+    async def register(self) -> None:
+        """Регистрация адреса webhook в Telegram"""
+        url = settings.webhook_url.rstrip("/") + settings.webhook_path
+        await self.application.bot.set_webhook(
+            url=url,
+            secret_token=settings.webhook_secret_token,
+            max_connections=settings.webhook_max_connections,
+            allowed_updates=Update.ALL_TYPES
+        )
+        logger.info(f"Webhook зарегистрирован: {url}")
+    
+    async def stop(self) -> None:
+        """Остановка HTTP-сервера"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    def pending(self) -> int:
+        """
+        Принятые и еще не обработанные обновления
+        
+        При параллельной обработке PTB сразу забирает обновления из очереди
+        приложения и запускает задачу на каждое, поэтому глубина очереди
+        почти всегда 0: ожидающие и выполняющиеся обработчики считает
+        ChatOrderedUpdateProcessor. Обработчик сообщений лишь ставит
+        сообщение в очередь пользователя, так что учитываются и сообщения,
+        ждущие или получающие ответ в message_queue.
+        """
+        # Супервизор импортирует модуль ради SECRET_HEADER, обработчики ему не нужны
+        from src.handlers.message_handler import message_queue
+        
+        pending = self.application.update_queue.qsize() + message_queue.backlog()
+        processor = self.application.update_processor
+        if isinstance(processor, ChatOrderedUpdateProcessor):
+            pending += processor.pending
+        return pending
+    
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        """Прием одного обновления"""
+        if settings.webhook_secret_token:
+            token = request.headers.get(self.SECRET_HEADER, "")
+            if not hmac.compare_digest(token, settings.webhook_secret_token):
+                return web.Response(status=403)
+        
+        if self.pending() >= settings.webhook_max_pending:
+            self.rejected += 1
+            return web.Response(status=503)
+        
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            logger.warning(f"Некорректное обновление webhook: {e}")
+            return web.Response(status=400)
+        
+        await self.application.update_queue.put(update)
+        self.accepted += 1
+        return web.Response(status=200)
+    
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        """Проверка живости для балансировщика"""
+        return web.json_response({
+            "status": "ok",
+            "pending_updates": self.pending(),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+        })
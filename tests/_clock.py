@@ -0,0 +1,67 @@
+"""
+Цикл событий с виртуальным временем для тестов лимитов
+
+Когда все задачи ждут таймеров, время цикла сразу переводится к
+ближайшему из них, поэтому минуты ожидания лимитов проходят за
+миллисекунды, а порядок и интервалы событий те же, что в реальном
+времени. Модули, читающие time.monotonic, подменяются через patch_time.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import Any, Awaitable, TypeVar
+
+T = TypeVar("T")
+
+# Наименьший шаг времени за итерацию цикла событий
+CLOCK_TICK = 1e-6
+
+
+class _VirtualSelector:
+    """Селектор, который вместо ожидания сдвигает время цикла"""
+    
+    def __init__(self, selector: Any, loop: "VirtualClockLoop"):
+        self._selector = selector
+        self._loop = loop
+    
+    def select(self, timeout=None):
+        events = self._selector.select(0)
+        # Как и настоящие часы, время идет и между таймерами: иначе ожидание
+        # меньше точности float (остаток ведра токенов) повторялось бы вечно
+        self._loop.now += max(timeout or 0.0, CLOCK_TICK) if not events else CLOCK_TICK
+        return events
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._selector, name)
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Цикл событий, время которого идет только при ожидании таймеров"""
+    
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+        self._selector = _VirtualSelector(self._selector, self)
+    
+    def time(self) -> float:
+        return self.now
+
+
+def run_virtual(coroutine: Awaitable[T]) -> T:
+    """Выполнение корутины в цикле с виртуальным временем"""
+    loop = VirtualClockLoop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def patch_time(monkeypatch: Any, *modules: Any) -> None:
+    """Подмена time.monotonic в модулях на время текущего цикла событий"""
+    clock = SimpleNamespace(
+        monotonic=lambda: asyncio.get_running_loop().time(),
+        perf_counter=lambda: asyncio.get_running_loop().time(),
+        time=time.time
+    )
+    for module in modules:
+        monkeypatch.setattr(module, "time", clock)
@@ -0,0 +1,7 @@
+"""
+Окружение тестов: настройки без реальных сервисов
+"""
+from benchmarks._env import setup_env
+
+# До первого импорта src: настройки читаются при импорте
+setup_env(log_level="ERROR", log_file="", openai_prewarm_connections="0")
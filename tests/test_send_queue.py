@@ -0,0 +1,165 @@
+"""
+Очередь отправки: разбиение длинных ответов и соблюдение лимитов Bot API
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import RetryAfter
+
+from src.services import rate_limiter, send_queue
+from src.services.send_queue import MESSAGE_LIMIT, SendQueue, split_message, utf16_length
+from tests._clock import patch_time, run_virtual
+
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+CHAT_BURST = 3
+GROUP_RATE_PER_MINUTE = 20
+
+
+def max_in_window(times, window: float) -> int:
+    """Наибольшее число событий в полуоткрытом окне [t, t + window)"""
+    times = sorted(times)
+    peak = 0
+    first = 0
+    for last, at in enumerate(times):
+        while at - times[first] >= window:
+            first += 1
+        peak = max(peak, last - first + 1)
+    return peak
+
+
+class FakeChat:
+    """Сообщение пользователя, ответы на которое записываются с временем отправки"""
+    
+    def __init__(self, chat_id: int, log: list):
+        self.chat_id = chat_id
+        self.log = log
+    
+    async def reply_text(self, text: str, **kwargs):
+        self.log.append(SimpleNamespace(chat_id=self.chat_id, text=text, at=asyncio.get_running_loop().time()))
+        return SimpleNamespace(text=text)
+
+
+@pytest.fixture
+def virtual_time(monkeypatch):
+    patch_time(monkeypatch, rate_limiter, send_queue)
+
+
+def make_queue(max_retries: int = 3) -> SendQueue:
+    return SendQueue(
+        global_rate=GLOBAL_RATE,
+        chat_rate=CHAT_RATE,
+        chat_burst=CHAT_BURST,
+        group_rate_per_minute=GROUP_RATE_PER_MINUTE,
+        max_retries=max_retries
+    )
+
+
+@pytest.mark.parametrize("text", [
+    "короткий ответ",
+    "Абзац. " * 2000,
+    "\n\n".join(["строка " * 300] * 10),
+    "😀" * 5000,
+    "x" * 10000,
+])
+def test_split_message_keeps_text_and_limit(text):
+    chunks = split_message(text)
+    
+    assert "".join(chunks) == text
+    assert all(utf16_length(chunk) <= MESSAGE_LIMIT for chunk in chunks)
+
+
+def test_split_message_prefers_paragraphs():
+    paragraph = "слово " * 500
+    chunks = split_message("\n\n".join([paragraph] * 3))
+    
+    assert all(chunk.endswith("\n\n") for chunk in chunks[:-1])
+
+
+def test_sends_stay_within_limits(virtual_time):
+    log = []
+    long_text = "\n\n".join(["Предложение ответа. " * 150] * 6)
+    chunks = split_message(long_text)
+    assert len(chunks) > 1
+    
+    async def scenario():
+        queue = make_queue()
+        private = [FakeChat(chat_id, log) for chat_id in range(1, 81)]
+        groups = [FakeChat(-chat_id, log) for chat_id in range(1, 3)]
+        chatty = FakeChat(1000, log)
+        
+        async def group_messages(chat):
+            for number in range(45):
+                await queue.reply(chat, f"сообщение {number}")
+        
+        await asyncio.gather(
+            *(queue.reply(chat, long_text) for chat in private),
+            *(group_messages(chat) for chat in groups),
+            *(queue.reply(chatty, f"ответ {number}") for number in range(100))
+        )
+    
+    run_virtual(scenario())
+    
+    assert len(log) == 80 * len(chunks) + 2 * 45 + 100
+    assert max_in_window([sent.at for sent in log], 1.0) <= GLOBAL_RATE
+    
+    by_chat = {}
+    for sent in log:
+        by_chat.setdefault(sent.chat_id, []).append(sent)
+    for chat_id, sent in by_chat.items():
+        times = [message.at for message in sent]
+        if chat_id < 0:
+            assert max_in_window(times, 60.0) <= GROUP_RATE_PER_MINUTE
+        else:
+            assert max_in_window(times, 1.0) <= CHAT_BURST
+            assert max_in_window(times, 60.0) <= CHAT_RATE * 60 + CHAT_BURST
+    
+    for chat_id in range(1, 81):
+        assert [message.text for message in by_chat[chat_id]] == chunks
+    assert [message.text for message in by_chat[-1]] == [f"сообщение {number}" for number in range(45)]
+
+
+def test_retry_after_pauses_all_chats(virtual_time):
+    log = []
+    
+    async def scenario():
+        queue = make_queue()
+        flooded = FakeChat(1, log)
+        other = FakeChat(2, log)
+        attempts = []
+        
+        async def send():
+            attempts.append(asyncio.get_running_loop().time())
+            if len(attempts) == 1:
+                raise RetryAfter(5)
+            return await flooded.reply_text("повтор")
+        
+        first = asyncio.ensure_future(queue.call(1, send))
+        await asyncio.sleep(0.5)
+        await queue.reply(other, "другой чат")
+        await first
+        return attempts, queue.stats()
+    
+    attempts, stats = run_virtual(scenario())
+    
+    assert attempts[1] - attempts[0] >= 5
+    assert all(sent.at >= 5 for sent in log)
+    assert [sent.text for sent in log if sent.chat_id == 1] == ["повтор"]
+    assert stats["retried"] == 1 and stats["failed"] == 0
+
+
+def test_retry_after_gives_up_after_max_retries(virtual_time):
+    async def scenario():
+        queue = make_queue(max_retries=1)
+        
+        async def send():
+            raise RetryAfter(1)
+        
+        with pytest.raises(RetryAfter):
+            await queue.call(1, send)
+        return queue.stats()
+    
+    stats = run_virtual(scenario())
+    
+    assert stats["retried"] == 1 and stats["failed"] == 1
@@ -0,0 +1,112 @@
+"""
+Потоковый ответ против заглушки OpenAI: частота редактирования и итоговый текст
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from src.config import settings
+from src.handlers import message_handler
+from src.services.openai_service import OpenAIService
+from src.services.send_queue import MESSAGE_LIMIT, SendQueue, utf16_length
+
+EDIT_INTERVAL = 0.2
+
+
+class FakeSentMessage:
+    """Отправленное ботом сообщение; как Telegram, отклоняет пустые и неизмененные тексты"""
+    
+    def __init__(self, chat: "FakeChat", text: str):
+        self.chat = chat
+        self.text = text
+    
+    async def edit_text(self, text: str):
+        if text.rstrip() == self.text.rstrip():
+            raise BadRequest("Message is not modified: specified new message content is the same")
+        self.chat.check(text)
+        self.text = text
+        self.chat.calls.append(("edit", time.monotonic()))
+        return self
+
+
+class FakeChat:
+    """Сообщение пользователя, на которое отвечает stream_reply"""
+    
+    chat_id = 1
+    
+    def __init__(self):
+        self.sent = []
+        self.calls = []
+    
+    @staticmethod
+    def check(text: str) -> None:
+        if not text.strip():
+            raise BadRequest("Message text is empty")
+        if utf16_length(text) > MESSAGE_LIMIT:
+            raise BadRequest("Message is too long")
+    
+    async def reply_text(self, text: str, **kwargs):
+        self.check(text)
+        message = FakeSentMessage(self, text)
+        self.sent.append(message)
+        self.calls.append(("send", time.monotonic()))
+        return message
+
+
+@pytest.fixture
+def stream_env(monkeypatch):
+    monkeypatch.setattr(settings, "stream_edit_interval", EDIT_INTERVAL)
+    monkeypatch.setattr(message_handler, "send_queue", SendQueue(0, 0, 1, 0, 0))
+    
+    def run(reply_tokens: int, token_delay: float) -> tuple:
+        async def scenario():
+            server = FakeOpenAIServer(first_token_delay=0.01, token_delay=token_delay, reply_tokens=reply_tokens)
+            await server.start()
+            monkeypatch.setattr(settings, "openai_api_base", server.base_url)
+            service = OpenAIService()
+            monkeypatch.setattr(message_handler, "get_openai_service", lambda: service)
+            chat = FakeChat()
+            try:
+                text = await message_handler.stream_reply(chat, [{"role": "user", "content": "Привет"}], 1)
+            finally:
+                await service.close()
+                await server.stop()
+            return text, "".join(server._tokens()), chat
+        
+        return asyncio.run(scenario())
+    
+    return run
+
+
+def test_edits_follow_interval_and_end_with_full_text(stream_env):
+    text, completion, chat = stream_env(reply_tokens=100, token_delay=0.01)
+    
+    assert text == completion
+    assert len(chat.sent) == 1
+    assert chat.sent[0].text.rstrip() == completion.rstrip()
+    
+    edits = [at for kind, at in chat.calls if kind == "edit"]
+    assert len(edits) >= 3
+    # Промежуточные правки не чаще интервала; последняя дописывает остаток сразу
+    times = [at for _, at in chat.calls]
+    gaps = [later - earlier for earlier, later in zip(times, times[1:-1])]
+    assert all(gap >= EDIT_INTERVAL * 0.9 for gap in gaps)
+
+
+def test_long_reply_continues_in_new_messages(stream_env):
+    text, completion, chat = stream_env(reply_tokens=1500, token_delay=0.0)
+    
+    assert text == completion
+    assert len(chat.sent) > 1
+    assert "".join(message.text for message in chat.sent).rstrip() == completion.rstrip()
+
+
+def test_empty_completion_sends_fallback(stream_env):
+    text, completion, chat = stream_env(reply_tokens=0, token_delay=0.0)
+    
+    assert text == completion == ""
+    assert [message.text for message in chat.sent] == [message_handler.EMPTY_REPLY_TEXT]